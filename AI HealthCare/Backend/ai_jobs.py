@@ -0,0 +1,165 @@
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from config import Config
+
+
+class RateLimiter:
+    """Thread-safe token bucket limiting calls per second (0 disables limiting)"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate or 0)
+        self.capacity = float(burst or max(self.rate, 1))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def run_bounded(app, func, items, max_workers=8, rate_limiter=None):
+    """
+    Run func(item) for every item on a bounded thread pool
+
+    Each call runs inside its own application context, so it gets its own
+    database session and can use current_app. The rate limiter, if given,
+    is passed to func so it can gate just the expensive part of the work.
+
+    Returns:
+        List of (item, result, error) tuples in input order
+    """
+    def call(item):
+        with app.app_context():
+            try:
+                return item, func(item, rate_limiter), None
+            except Exception as e:
+                return item, None, e
+
+    if not items:
+        return []
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(items)))) as pool:
+        return list(pool.map(call, items))
+
+
+_process_tokens = {}
+
+
+def process_token():
+    """
+    host:pid:nonce naming this process as the owner of its background jobs
+
+    Computed per pid so forked workers do not share their parent's token;
+    the nonce tells a restarted process apart from an earlier one that had
+    the same pid (e.g. pid 1 in a container).
+    """
+    pid = os.getpid()
+    if pid not in _process_tokens:
+        _process_tokens[pid] = f'{socket.gethostname()}:{pid}:{uuid.uuid4().hex[:8]}'
+    return _process_tokens[pid]
+
+
+def owner_is_gone(token):
+    """
+    Whether the process named by a process_token() has exited
+
+    Only decidable for processes on this host; owners elsewhere (and rows
+    without an owner) are assumed alive.
+    """
+    if not token:
+        return False
+    try:
+        host, pid, _ = token.rsplit(':', 2)
+        pid = int(pid)
+    except ValueError:
+        return False
+    if host != socket.gethostname():
+        return False
+    if pid == os.getpid():
+        return token != process_token()
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        return False
+    return False
+
+
+class JobQueueFull(Exception):
+    """Raised when the background job pool has no room for another job"""
+
+
+class BackgroundJobPool:
+    """
+    Bounded pool for work that outlives the HTTP request
+
+    Jobs run in their own application context. submit() refuses new work once
+    max_pending jobs are queued or running so a burst cannot grow the queue
+    without bound; callers should answer 503 in that case.
+    """
+
+    def __init__(self, max_workers=4, max_pending=100):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._executor = None
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def submit(self, app, func, *args):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise JobQueueFull(f'{self._pending} jobs already pending')
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix='ai-job'
+                )
+            self._pending += 1
+
+        def run():
+            try:
+                with app.app_context():
+                    func(*args)
+            except Exception as e:
+                print(f"Background job failed: {e}")
+            finally:
+                with self._lock:
+                    self._pending -= 1
+
+        return self._executor.submit(run)
+
+    @property
+    def pending(self):
+        with self._lock:
+            return self._pending
+
+
+# Process-wide limit on model calls made by batch analyses
+batch_rate_limiter = RateLimiter(Config.AI_BATCH_RATE_LIMIT)
+
+# Shared pool for asynchronous AI analysis jobs
+analysis_jobs = BackgroundJobPool(
+    max_workers=Config.AI_JOB_WORKERS,
+    max_pending=Config.AI_JOB_MAX_PENDING
+)
+
+# Rolling discussion summaries, folded after the AI reply has been stored
+summary_jobs = BackgroundJobPool(
+    max_workers=Config.CHAT_SUMMARY_WORKERS,
+    max_pending=Config.AI_JOB_MAX_PENDING
+)
@@ -1,18 +1,231 @@
 import os
 import json
+import time
+import openai
 from openai import OpenAI
 from datetime import datetime
+from config import Config
+from llm_cache import LLMCache
+from prompt_builder import PromptBuilder, UsageTracker, compact_json, count_tokens, count_message_tokens
+from metrics import registry, CollectedMetric, llm_request_seconds, llm_requests, llm_retries, llm_hedges
+from resilience import CircuitBreaker, CallPolicy, CircuitOpenError
 
-# Initialize OpenAI client
-client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+# Initialize OpenAI client; retries are handled by llm_policy instead
+client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'), max_retries=0)
+
+# Errors that say the provider is slow or unhealthy, as opposed to a bad request
+RETRYABLE_ERRORS = (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)
+
+# Deadlines per AIHealthAnalyzer method, in seconds; Config.LLM_METHOD_TIMEOUTS overrides
+DEFAULT_METHOD_TIMEOUTS = {
+    'analyze_patient_data': 45,
+    'analyze_patient_update': 45,
+    'generate_treatment_proposal': 60,
+    'chat_with_doctor': 30,
+    'chat_with_doctor_stream': 60,
+    'summarize_discussion': 20
+}
+
+# Request parameters shared by the sync and async analyzers
+ANALYSIS_PARAMS = {'temperature': 0.7, 'max_tokens': 1000, 'response_format': {"type": "json_object"}}
+PROPOSAL_PARAMS = {'temperature': 0.7, 'max_tokens': 1500, 'response_format': {"type": "json_object"}}
+CHAT_PARAMS = {'temperature': 0.8, 'max_tokens': 800}
+SUMMARY_PARAMS = {'temperature': 0.2, 'max_tokens': 300}
+CHAT_FALLBACK = "I apologize, but I'm having trouble responding right now. Please try again."
+
+# Values allowed by the ai_analyses.risk_level CHECK constraint
+ANALYSIS_RISK_LEVELS = ('low', 'moderate', 'high', 'critical')
+
+
+def parse_analysis(content):
+    """Decode an analysis reply, raising ValueError unless it is an object with a known risk_level"""
+    analysis = json.loads(content)
+    if not isinstance(analysis, dict):
+        raise ValueError('Analysis response is not a JSON object')
+    risk_level = str(analysis.get('risk_level', '')).strip().lower()
+    if risk_level not in ANALYSIS_RISK_LEVELS:
+        raise ValueError(f"Analysis response has no valid risk_level: {analysis.get('risk_level')!r}")
+    analysis['risk_level'] = risk_level
+    return analysis
+
+
+def parse_proposal(content):
+    """Decode a treatment proposal reply, raising ValueError unless it is a JSON object"""
+    proposal = json.loads(content)
+    if not isinstance(proposal, dict):
+        raise ValueError('Treatment proposal response is not a JSON object')
+    return proposal
+
+llm_breaker = CircuitBreaker(
+    failure_threshold=Config.LLM_BREAKER_FAILURES,
+    reset_timeout=Config.LLM_BREAKER_RESET
+)
+
+llm_policy = CallPolicy(
+    timeout=Config.LLM_TIMEOUT,
+    max_retries=Config.LLM_MAX_RETRIES,
+    backoff=Config.LLM_RETRY_BACKOFF,
+    backoff_max=Config.LLM_RETRY_BACKOFF_MAX,
+    hedge_after=Config.LLM_HEDGE_AFTER,
+    breaker=llm_breaker,
+    retryable=RETRYABLE_ERRORS
+)
 
 class AIHealthAnalyzer:
     """AI service for analyzing patient health data"""
     
-    def __init__(self):
+    def __init__(self, cache=None, analysis_budget=1500, proposal_budget=2000, policy=None, timeouts=None,
+                 usage=None):
         self.model = "gpt-4o-mini"  # or "gpt-3.5-turbo" for cheaper option
+        self.cache = cache
+        self.analysis_budget = analysis_budget
+        self.proposal_budget = proposal_budget
+        self.policy = policy or CallPolicy(retryable=RETRYABLE_ERRORS)
+        self.timeouts = {**DEFAULT_METHOD_TIMEOUTS, **(timeouts or {})}
+        self.usage = usage or UsageTracker()
+    
+    def _create(self, method, messages, stream=False, **params):
+        """
+        Call the chat completions API under the method's deadline, retry and breaker policy
+        
+        Raises CircuitOpenError without calling OpenAI while the breaker is
+        open; callers treat it like any other API error and fall back.
+        """
+        try:
+            return self.policy.call(
+                lambda timeout: client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    stream=stream,
+                    timeout=timeout,
+                    **params
+                ),
+                timeout=self.timeouts.get(method),
+                hedge=not stream,
+                on_retry=lambda: llm_retries.inc(method=method),
+                on_hedge=lambda outcome: llm_hedges.inc(method=method, outcome=outcome)
+            )
+        except CircuitOpenError:
+            llm_requests.inc(method=method, outcome='rejected')
+            raise
     
-    def analyze_patient_data(self, patient_data, vital_signs, health_logs):
+    def _complete(self, messages, method='completion', parse=None, **params):
+        """
+        Run a chat completion, serving identical requests from the cache
+        
+        Args:
+            parse: Optional callable turning the content into the caller's
+                result, raising ValueError for content it cannot use (e.g.
+                parse_analysis). A response is only cached once it parses,
+                so a malformed reply is not served again from cache.
+        
+        Returns:
+            Tuple of (response content or parsed result, whether it came
+            from the cache, token usage dict for this call)
+        """
+        key = None
+        if self.cache is not None:
+            key = self.cache.make_key(self.model, messages, **params)
+            hit = self._parse_cached(self.cache.get(key), parse)
+            if hit is not None:
+                self.usage.record(method, cached=True)
+                llm_requests.inc(method=method, outcome='cached')
+                return hit, True, {'prompt_tokens': 0, 'completion_tokens': 0}
+        
+        started = time.perf_counter()
+        try:
+            response = self._create(method, messages, **params)
+        except CircuitOpenError:
+            raise
+        except Exception:
+            llm_request_seconds.observe(time.perf_counter() - started, method=method)
+            llm_requests.inc(method=method, outcome='error')
+            raise
+        llm_request_seconds.observe(time.perf_counter() - started, method=method)
+        llm_requests.inc(method=method, outcome='ok')
+        content = response.choices[0].message.content
+        
+        usage = {
+            'prompt_tokens': getattr(response.usage, 'prompt_tokens', 0) or 0,
+            'completion_tokens': getattr(response.usage, 'completion_tokens', 0) or 0
+        }
+        self.usage.record(method, **usage)
+        
+        result = parse(content) if parse is not None else content
+        if key is not None and content:
+            self.cache.set(key, content, model=self.model)
+        
+        return result, False, usage
+    
+    @staticmethod
+    def _parse_cached(content, parse):
+        """Parsed cache entry, or None for a miss or an entry that no longer parses"""
+        if content is None or parse is None:
+            return content
+        try:
+            return parse(content)
+        except (TypeError, ValueError):
+            return None
+    
+    def _stream(self, messages, method='chat_stream', **params):
+        """
+        Run a streaming chat completion, yielding content deltas as they arrive
+        
+        A cache hit is yielded as a single delta. A completed stream is stored
+        under the same key as the non-streaming call with the same inputs.
+        """
+        key = None
+        if self.cache is not None:
+            key = self.cache.make_key(self.model, messages, **params)
+            cached = self.cache.get(key)
+            if cached is not None:
+                self.usage.record(method, cached=True)
+                llm_requests.inc(method=method, outcome='cached')
+                yield cached
+                return
+        
+        # Latency covers the whole stream, not just time to first token
+        started = time.perf_counter()
+        parts = []
+        try:
+            stream = self._create(method, messages, stream=True, **params)
+        except CircuitOpenError:
+            raise
+        except Exception:
+            llm_request_seconds.observe(time.perf_counter() - started, method=method)
+            llm_requests.inc(method=method, outcome='error')
+            raise
+        
+        try:
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    parts.append(delta)
+                    yield delta
+        except Exception as e:
+            # Mid-stream failures are not retried, but still count against the breaker
+            if isinstance(e, RETRYABLE_ERRORS):
+                self.policy.breaker.record_failure()
+            llm_requests.inc(method=method, outcome='error')
+            raise
+        finally:
+            llm_request_seconds.observe(time.perf_counter() - started, method=method)
+        llm_requests.inc(method=method, outcome='ok')
+        
+        # Streamed responses carry no usage block, so estimate it locally
+        content = "".join(parts)
+        self.usage.record(
+            method,
+            prompt_tokens=count_message_tokens(messages, self.model),
+            completion_tokens=count_tokens(content, self.model)
+        )
+        
+        if key is not None and parts:
+            self.cache.set(key, content, model=self.model)
+    
+    def analyze_patient_data(self, patient_data, vital_signs, health_logs, features=None):
         """
         Analyze patient data and generate health insights
         
@@ -20,53 +233,88 @@ class AIHealthAnalyzer:
             patient_data: Patient demographic and medical history
             vital_signs: Recent vital signs from wearable device
             health_logs: Manual health logs from patient
+            features: Optional trend summary from features.extract_patient_features
         
         Returns:
             AI analysis with findings, concerns, and recommendations
         """
         
         # Create comprehensive prompt
-        prompt = self._create_analysis_prompt(patient_data, vital_signs, health_logs)
+        prompt, prompt_report = self._create_analysis_prompt(patient_data, vital_signs, health_logs, features)
+        return self._analysis_completion('analyze_patient_data', prompt, prompt_report)
+    
+    def analyze_patient_update(self, patient_data, prior_analysis, delta_features):
+        """
+        Update a previous analysis with only the data recorded since it ran
+        
+        Args:
+            patient_data: Patient demographic and medical history
+            prior_analysis: The previous analysis result (findings, concerns, risk_level, ...)
+            delta_features: features.extract_patient_features over the new rows only
         
+        Returns:
+            AI analysis in the same shape as analyze_patient_data
+        """
+        prompt, prompt_report = self._create_update_prompt(patient_data, prior_analysis, delta_features)
+        return self._analysis_completion('analyze_patient_update', prompt, prompt_report)
+    
+    def _analysis_completion(self, method, prompt, prompt_report):
+        """Run an analysis prompt and add response metadata, falling back on API errors"""
         try:
-            response = client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": """You are a medical AI assistant helping doctors analyze patient health data. 
-                        You provide evidence-based analysis, identify concerning patterns, and suggest treatment options.
-                        Always cite medical guidelines when relevant. Be clear about confidence levels.
-                        Format your response as JSON with these fields: findings, concerns, risk_level, recommendations, evidence."""
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                temperature=0.7,
-                max_tokens=1000,
-                response_format={"type": "json_object"}
+            ai_response, cached, usage = self._complete(
+                method=method,
+                messages=self._analysis_messages(prompt),
+                parse=parse_analysis,
+                **ANALYSIS_PARAMS
             )
-            
-            # Parse AI response
-            ai_response = json.loads(response.choices[0].message.content)
-            
-            # Add metadata
-            ai_response['confidence_score'] = 0.85  # Can be calculated based on data quality
-            ai_response['generated_at'] = datetime.utcnow().isoformat()
-            ai_response['model_used'] = self.model
-            
-            return ai_response
+            return self._analysis_result(ai_response, cached, usage, prompt_report)
             
         except Exception as e:
             print(f"Error calling OpenAI API: {e}")
             return self._fallback_analysis()
     
-    def _create_analysis_prompt(self, patient_data, vital_signs, health_logs):
-        """Create detailed prompt for AI analysis"""
+    def _analysis_messages(self, prompt):
+        return [
+            {
+                "role": "system",
+                "content": """You are a medical AI assistant helping doctors analyze patient health data. 
+                You provide evidence-based analysis, identify concerning patterns, and suggest treatment options.
+                Always cite medical guidelines when relevant. Be clear about confidence levels.
+                Format your response as JSON with these fields: findings, concerns, risk_level, recommendations, evidence."""
+            },
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ]
+    
+    def _analysis_result(self, ai_response, cached, usage, prompt_report):
+        """Add metadata to the model's parsed JSON analysis"""
+        ai_response['confidence_score'] = 0.85  # Can be calculated based on data quality
+        ai_response['generated_at'] = datetime.utcnow().isoformat()
+        ai_response['model_used'] = self.model
+        ai_response['cached'] = cached
+        ai_response['token_usage'] = {
+            **usage,
+            'prompt_budget': prompt_report['budget'],
+            'trimmed': prompt_report['trimmed']
+        }
         
-        prompt = f"""
+        return ai_response
+    
+    def _create_analysis_prompt(self, patient_data, vital_signs, health_logs, features=None):
+        """
+        Create detailed prompt for AI analysis, trimmed to the analysis token budget
+        
+        Returns:
+            Tuple of (prompt text, PromptBuilder report)
+        """
+        
+        features = features or {}
+        trend_items = list({**features.get('vitals', {}), **features.get('logs', {})}.items())
+        
+        builder = PromptBuilder(self.analysis_budget, self.model)
+        builder.add('patient', lambda _: f"""
 Analyze this patient's health data and provide medical insights:
 
 PATIENT INFORMATION:
@@ -75,13 +323,18 @@ PATIENT INFORMATION:
 - Gender: {patient_data.get('gender', 'Unknown')}
 - Medical History: {patient_data.get('chronic_conditions', 'None reported')}
 - Current Medications: {patient_data.get('medications', 'None reported')}
-
+""", required=True)
+        builder.add('vital_signs', lambda items: f"""
 RECENT VITAL SIGNS (from wearable device):
-{self._format_vital_signs(vital_signs)}
-
+{self._format_vital_signs(items)}
+""", items=vital_signs or [], priority=3, min_items=3)
+        builder.add('health_logs', lambda items: f"""
 RECENT HEALTH LOGS (patient reported):
-{self._format_health_logs(health_logs)}
-
+{self._format_health_logs(items)}
+""", items=health_logs or [], priority=2, min_items=2)
+        builder.add('trends', lambda items: self._format_trends(features.get('window', {}), items),
+                    items=trend_items, priority=1, trim_from='end')
+        builder.add('instructions', lambda _: """
 Please provide:
 1. Key findings from the data
 2. Any concerning patterns or anomalies
@@ -90,8 +343,60 @@ Please provide:
 5. Relevant medical guidelines or studies
 
 Format your response as JSON with fields: findings, concerns, risk_level, recommendations, evidence.
-"""
-        return prompt
+""", required=True)
+        
+        return builder.build()
+    
+    def _create_update_prompt(self, patient_data, prior_analysis, delta_features):
+        """
+        Prompt with the prior findings and a summary of new data only
+        
+        Returns:
+            Tuple of (prompt text, PromptBuilder report)
+        """
+        prior = {
+            k: v for k, v in (prior_analysis or {}).items()
+            if k in ('findings', 'concerns', 'risk_level', 'recommendations')
+        }
+        window = delta_features.get('window', {})
+        trend_items = list({**delta_features.get('vitals', {}), **delta_features.get('logs', {})}.items())
+        
+        builder = PromptBuilder(self.analysis_budget, self.model)
+        builder.add('patient', lambda _: f"""
+Update this patient's previous health analysis with the data recorded since it was generated:
+
+PATIENT INFORMATION:
+- Name: {patient_data.get('name', 'Unknown')}
+- Age: {patient_data.get('age', 'Unknown')}
+- Gender: {patient_data.get('gender', 'Unknown')}
+""", required=True)
+        builder.add('prior', lambda items: f"""
+PREVIOUS ANALYSIS ({(prior_analysis or {}).get('generated_at', 'unknown date')}):
+{compact_json(dict(items))}
+""", items=list(prior.items()), priority=2, min_items=1, trim_from='end')
+        builder.add('vital_signs', lambda items: f"""
+NEW VITAL SIGNS ({window.get('wearable_samples', 0)} samples):
+{self._format_vital_signs(items)}
+""", items=delta_features.get('daily', []), priority=3, min_items=3)
+        builder.add('health_logs', lambda items: f"""
+NEW HEALTH LOGS ({window.get('health_logs', 0)} entries):
+{self._format_health_logs(items)}
+""", items=delta_features.get('recent_logs', []), priority=2, min_items=2)
+        builder.add('trends', lambda items: self._format_trends(window, items, title='TRENDS IN NEW DATA'),
+                    items=trend_items, priority=1, trim_from='end')
+        builder.add('instructions', lambda _: """
+Please provide the updated analysis, keeping previous findings that still hold and revising
+anything the new data confirms, contradicts or adds:
+1. Key findings from the data
+2. Any concerning patterns or anomalies
+3. Overall risk level (low/moderate/high/critical)
+4. Evidence-based treatment recommendations
+5. Relevant medical guidelines or studies
+
+Format your response as JSON with fields: findings, concerns, risk_level, recommendations, evidence.
+""", required=True)
+        
+        return builder.build()
     
     def _format_vital_signs(self, vital_signs):
         """Format vital signs for prompt"""
@@ -117,6 +422,25 @@ Format your response as JSON with fields: findings, concerns, risk_level, recomm
         
         return "\n".join(formatted) if formatted else "No data"
     
+    def _format_trends(self, window, trend_items, title=None):
+        """Format (field, stats) trend summaries for prompt"""
+        if not trend_items:
+            return ""
+        
+        title = title or f"TRENDS OVER LAST {window.get('days')} DAYS"
+        formatted = [f"\n{title} "
+                     f"({window.get('wearable_samples', 0)} wearable samples, "
+                     f"{window.get('health_logs', 0)} health logs):"]
+        for name, stats in trend_items:
+            rolling = next((v for k, v in stats.items() if k.startswith('rolling_mean')), None)
+            trend = stats.get('trend_per_day')
+            trend = f"{trend:+}/day" if trend is not None else "n/a"
+            formatted.append(f"- {name}: mean {stats['mean']} (range {stats['min']}-{stats['max']}, "
+                             f"sd {stats['std']}), trend {trend}, "
+                             f"recent avg {rolling}, {stats['outliers']} outliers")
+        
+        return "\n".join(formatted) + "\n"
+    
     def _fallback_analysis(self):
         """Fallback response if API fails"""
         return {
@@ -142,15 +466,42 @@ Format your response as JSON with fields: findings, concerns, risk_level, recomm
             Structured treatment proposal with medications, lifestyle changes, etc.
         """
         
-        prompt = f"""
+        try:
+            proposal, _, _ = self._complete(
+                method='generate_treatment_proposal',
+                messages=self._proposal_messages(patient_context, ai_analysis),
+                parse=parse_proposal,
+                **PROPOSAL_PARAMS
+            )
+            
+            return proposal
+            
+        except Exception as e:
+            print(f"Error generating treatment proposal: {e}")
+            return self._proposal_fallback(e)
+    
+    def _proposal_messages(self, patient_context, ai_analysis):
+        """Treatment proposal prompt, trimmed to the proposal token budget"""
+        
+        # Response metadata adds tokens without telling the model anything
+        analysis = {
+            k: v for k, v in (ai_analysis or {}).items()
+            if k not in ('generated_at', 'model_used', 'cached', 'token_usage')
+        }
+        
+        builder = PromptBuilder(self.proposal_budget, self.model)
+        builder.add('header', lambda _: """
 Based on this patient analysis, generate a detailed treatment proposal:
-
+""", required=True)
+        builder.add('patient_context', lambda items: f"""
 PATIENT CONTEXT:
-{json.dumps(patient_context, indent=2)}
-
+{compact_json(dict(items))}
+""", items=list((patient_context or {}).items()), priority=2, min_items=1, trim_from='end')
+        builder.add('ai_analysis', lambda items: f"""
 AI ANALYSIS:
-{json.dumps(ai_analysis, indent=2)}
-
+{compact_json(dict(items))}
+""", items=list(analysis.items()), priority=1, min_items=1, trim_from='end')
+        builder.add('instructions', lambda _: """
 Provide a comprehensive treatment proposal including:
 1. Primary medication recommendations with dosing
 2. Supporting lifestyle modifications
@@ -161,52 +512,137 @@ Provide a comprehensive treatment proposal including:
 
 Format as JSON with fields: medications, lifestyle_changes, diagnostic_tests, 
 follow_up_plan, patient_education, risks, rationale.
-"""
+""", required=True)
+        prompt, _ = builder.build()
         
-        try:
-            response = client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": """You are a medical AI providing treatment recommendations. 
-                        Base recommendations on current clinical guidelines. Include evidence citations.
-                        Consider patient-specific factors like age, comorbidities, and current medications."""
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                temperature=0.7,
-                max_tokens=1500,
-                response_format={"type": "json_object"}
-            )
-            
-            return json.loads(response.choices[0].message.content)
-            
-        except Exception as e:
-            print(f"Error generating treatment proposal: {e}")
-            return {
-                "medications": [],
-                "lifestyle_changes": [],
-                "diagnostic_tests": [],
-                "follow_up_plan": "Unable to generate proposal",
-                "error": str(e)
+        return [
+            {
+                "role": "system",
+                "content": """You are a medical AI providing treatment recommendations. 
+                Base recommendations on current clinical guidelines. Include evidence citations.
+                Consider patient-specific factors like age, comorbidities, and current medications."""
+            },
+            {
+                "role": "user",
+                "content": prompt
             }
+        ]
+    
+    def _proposal_fallback(self, error):
+        return {
+            "medications": [],
+            "lifestyle_changes": [],
+            "diagnostic_tests": [],
+            "follow_up_plan": "Unable to generate proposal",
+            "error": str(error)
+        }
     
-    def chat_with_doctor(self, conversation_history, doctor_message):
+    def chat_with_doctor(self, conversation_history, doctor_message, summary=None):
         """
         Handle doctor-AI conversation for collaborative decision making
         
         Args:
             conversation_history: List of previous messages
             doctor_message: Current message from doctor
+            summary: Optional rolling summary of earlier turns not in conversation_history
         
         Returns:
             AI response considering full conversation context
         """
         
+        messages = self._build_chat_messages(conversation_history, doctor_message, summary)
+        
+        try:
+            content, _, _ = self._complete(
+                method='chat_with_doctor',
+                messages=messages,
+                **CHAT_PARAMS
+            )
+            
+            return content
+            
+        except Exception as e:
+            print(f"Error in doctor chat: {e}")
+            return CHAT_FALLBACK
+    
+    def stream_chat_with_doctor(self, conversation_history, doctor_message, summary=None):
+        """
+        Streaming variant of chat_with_doctor
+        
+        Yields:
+            Response text deltas as soon as the model produces them
+        """
+        
+        messages = self._build_chat_messages(conversation_history, doctor_message, summary)
+        
+        produced = False
+        try:
+            for delta in self._stream(messages, method='chat_with_doctor_stream', **CHAT_PARAMS):
+                produced = True
+                yield delta
+                
+        except Exception as e:
+            print(f"Error in doctor chat stream: {e}")
+            if not produced:
+                yield CHAT_FALLBACK
+    
+    def summarize_discussion(self, previous_summary, turns):
+        """
+        Fold older discussion turns into a rolling summary
+        
+        Args:
+            previous_summary: Summary so far, or None
+            turns: Turns leaving the recent-context window, oldest first
+        
+        Returns:
+            Updated summary text, or None if it could not be generated
+        """
+        
+        try:
+            content, _, _ = self._complete(
+                method='summarize_discussion',
+                messages=self._summary_messages(previous_summary, turns),
+                **SUMMARY_PARAMS
+            )
+            
+            return content
+            
+        except Exception as e:
+            print(f"Error summarizing discussion: {e}")
+            return None
+    
+    def _summary_messages(self, previous_summary, turns):
+        """Messages asking the model to fold turns into the rolling summary"""
+        
+        transcript = "\n".join(
+            f"{'AI' if turn['speaker'] == 'ai' else 'Doctor'}: {turn['content']}" for turn in turns
+        )
+        
+        prompt = f"""
+EXISTING SUMMARY:
+{previous_summary or 'None yet'}
+
+NEW TURNS:
+{transcript}
+
+Update the summary so it covers the existing summary and the new turns. Keep clinical
+facts, agreed decisions, open questions and the doctor's stated preferences. Use at most 200 words.
+"""
+        
+        return [
+            {
+                "role": "system",
+                "content": "You maintain concise running summaries of doctor-AI clinical discussions."
+            },
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ]
+    
+    def _build_chat_messages(self, conversation_history, doctor_message, summary=None):
+        """Build the chat completion messages for a doctor conversation"""
+        
         # Build conversation context
         messages = [
             {
@@ -219,6 +655,12 @@ follow_up_plan, patient_education, risks, rationale.
             }
         ]
         
+        if summary:
+            messages.append({
+                "role": "system",
+                "content": f"Summary of the earlier part of this discussion:\n{summary}"
+            })
+        
         # Add conversation history
         for msg in conversation_history:
             messages.append({
@@ -232,19 +674,58 @@ follow_up_plan, patient_education, risks, rationale.
             "content": doctor_message
         })
         
-        try:
-            response = client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                temperature=0.8,
-                max_tokens=800
-            )
-            
-            return response.choices[0].message.content
-            
-        except Exception as e:
-            print(f"Error in doctor chat: {e}")
-            return "I apologize, but I'm having trouble responding right now. Please try again."
+        return messages
 
 # Initialize global AI analyzer instance
-ai_analyzer = AIHealthAnalyzer()
\ No newline at end of file
+llm_cache = LLMCache(
+    ttl=Config.LLM_CACHE_TTL,
+    max_entries=Config.LLM_CACHE_MAX_ENTRIES,
+    shared=Config.LLM_CACHE_SHARED
+) if Config.LLM_CACHE_ENABLED else None
+
+ai_analyzer = AIHealthAnalyzer(
+    cache=llm_cache,
+    analysis_budget=Config.ANALYSIS_PROMPT_TOKEN_BUDGET,
+    proposal_budget=Config.PROPOSAL_PROMPT_TOKEN_BUDGET,
+    policy=llm_policy,
+    timeouts=Config.LLM_METHOD_TIMEOUTS
+)
+
+def _token_samples():
+    for method, stats in ai_analyzer.usage.snapshot()['by_method'].items():
+        yield {'method': method, 'kind': 'prompt'}, stats['prompt_tokens']
+        yield {'method': method, 'kind': 'completion'}, stats['completion_tokens']
+
+def _cache_samples():
+    if llm_cache is None:
+        return
+    stats = llm_cache.stats()
+    for name in ('memory_hits', 'shared_hits', 'misses', 'stores', 'evictions', 'expirations', 'shared_errors'):
+        yield {'stat': name}, stats[name]
+    yield {'stat': 'hit_ratio'}, stats['hit_ratio']
+
+registry.register(CollectedMetric(
+    'llm_tokens_total', 'Prompt and completion tokens by AIHealthAnalyzer method',
+    ('method', 'kind'), collect=_token_samples, kind='counter'
+))
+registry.register(CollectedMetric(
+    'llm_cache', 'LLM response cache counters and hit ratio', ('stat',), collect=_cache_samples
+))
+
+def _breaker_samples():
+    snapshot = llm_breaker.snapshot()
+    for state in (CircuitBreaker.CLOSED, CircuitBreaker.HALF_OPEN, CircuitBreaker.OPEN):
+        yield {'state': state}, 1 if snapshot['state'] == state else 0
+
+def _breaker_transition_samples():
+    for state, count in llm_breaker.snapshot()['transitions'].items():
+        yield {'state': state}, count
+
+registry.register(CollectedMetric(
+    'llm_circuit_state', 'OpenAI circuit breaker state (1 for the current state)', ('state',),
+    collect=_breaker_samples
+))
+registry.register(CollectedMetric(
+    'llm_circuit_transitions_total', 'OpenAI circuit breaker transitions into each state', ('state',),
+    collect=_breaker_transition_samples, kind='counter'
+))
\ No newline at end of file
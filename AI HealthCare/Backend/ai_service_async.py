@@ -0,0 +1,231 @@
+import asyncio
+import os
+import time
+from openai import AsyncOpenAI
+from config import Config
+from prompt_builder import count_tokens, count_message_tokens
+from metrics import llm_request_seconds, llm_requests, llm_retries, llm_hedges
+from resilience import CircuitOpenError
+from ai_service import (
+    AIHealthAnalyzer, RETRYABLE_ERRORS, ANALYSIS_PARAMS, PROPOSAL_PARAMS, CHAT_PARAMS, SUMMARY_PARAMS,
+    CHAT_FALLBACK, ai_analyzer, llm_cache, llm_policy, parse_analysis, parse_proposal
+)
+
+# Initialize async OpenAI client; retries are handled by llm_policy instead
+async_client = AsyncOpenAI(api_key=os.getenv('OPENAI_API_KEY'), max_retries=0)
+
+
+class AsyncAIHealthAnalyzer(AIHealthAnalyzer):
+    """
+    asyncio counterpart of AIHealthAnalyzer built on AsyncOpenAI
+
+    Prompts, response handling and fallbacks are AIHealthAnalyzer's; only
+    the transport is async, so an in-flight completion costs a coroutine
+    rather than a thread. The response cache's shared tier is a database
+    table, so cache lookups and stores run in a worker thread, inside an
+    app context when an app is given.
+    """
+
+    def __init__(self, *args, app=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.app = app
+
+    def _cache_call(self, func, *args, **kwargs):
+        if self.app is None:
+            return func(*args, **kwargs)
+        with self.app.app_context():
+            return func(*args, **kwargs)
+
+    async def _cache_get(self, key):
+        return await asyncio.to_thread(self._cache_call, self.cache.get, key)
+
+    async def _cache_set(self, key, content):
+        await asyncio.to_thread(self._cache_call, self.cache.set, key, content, model=self.model)
+
+    async def _create(self, method, messages, stream=False, **params):
+        try:
+            return await self.policy.call_async(
+                lambda timeout: async_client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    stream=stream,
+                    timeout=timeout,
+                    **params
+                ),
+                timeout=self.timeouts.get(method),
+                hedge=not stream,
+                on_retry=lambda: llm_retries.inc(method=method),
+                on_hedge=lambda outcome: llm_hedges.inc(method=method, outcome=outcome)
+            )
+        except CircuitOpenError:
+            llm_requests.inc(method=method, outcome='rejected')
+            raise
+
+    async def _complete(self, messages, method='completion', parse=None, **params):
+        """Async _complete: (response content or parsed result, cached, token usage dict)"""
+        key = None
+        if self.cache is not None:
+            key = self.cache.make_key(self.model, messages, **params)
+            hit = self._parse_cached(await self._cache_get(key), parse)
+            if hit is not None:
+                self.usage.record(method, cached=True)
+                llm_requests.inc(method=method, outcome='cached')
+                return hit, True, {'prompt_tokens': 0, 'completion_tokens': 0}
+
+        started = time.perf_counter()
+        try:
+            response = await self._create(method, messages, **params)
+        except CircuitOpenError:
+            raise
+        except Exception:
+            llm_request_seconds.observe(time.perf_counter() - started, method=method)
+            llm_requests.inc(method=method, outcome='error')
+            raise
+        llm_request_seconds.observe(time.perf_counter() - started, method=method)
+        llm_requests.inc(method=method, outcome='ok')
+        content = response.choices[0].message.content
+
+        usage = {
+            'prompt_tokens': getattr(response.usage, 'prompt_tokens', 0) or 0,
+            'completion_tokens': getattr(response.usage, 'completion_tokens', 0) or 0
+        }
+        self.usage.record(method, **usage)
+
+        result = parse(content) if parse is not None else content
+        if key is not None and content:
+            await self._cache_set(key, content)
+
+        return result, False, usage
+
+    async def _stream(self, messages, method='chat_stream', **params):
+        """Async _stream: yields content deltas as they arrive"""
+        key = None
+        if self.cache is not None:
+            key = self.cache.make_key(self.model, messages, **params)
+            cached = await self._cache_get(key)
+            if cached is not None:
+                self.usage.record(method, cached=True)
+                llm_requests.inc(method=method, outcome='cached')
+                yield cached
+                return
+
+        started = time.perf_counter()
+        parts = []
+        try:
+            stream = await self._create(method, messages, stream=True, **params)
+        except CircuitOpenError:
+            raise
+        except Exception:
+            llm_request_seconds.observe(time.perf_counter() - started, method=method)
+            llm_requests.inc(method=method, outcome='error')
+            raise
+
+        try:
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    parts.append(delta)
+                    yield delta
+        except Exception as e:
+            if isinstance(e, RETRYABLE_ERRORS):
+                self.policy.breaker.record_failure()
+            llm_requests.inc(method=method, outcome='error')
+            raise
+        finally:
+            llm_request_seconds.observe(time.perf_counter() - started, method=method)
+        llm_requests.inc(method=method, outcome='ok')
+
+        content = "".join(parts)
+        self.usage.record(
+            method,
+            prompt_tokens=count_message_tokens(messages, self.model),
+            completion_tokens=count_tokens(content, self.model)
+        )
+
+        if key is not None and parts:
+            await self._cache_set(key, content)
+
+    async def _analysis_completion(self, method, prompt, prompt_report):
+        try:
+            ai_response, cached, usage = await self._complete(
+                method=method,
+                messages=self._analysis_messages(prompt),
+                parse=parse_analysis,
+                **ANALYSIS_PARAMS
+            )
+            return self._analysis_result(ai_response, cached, usage, prompt_report)
+
+        except Exception as e:
+            print(f"Error calling OpenAI API: {e}")
+            return self._fallback_analysis()
+
+    async def analyze_patient_data(self, patient_data, vital_signs, health_logs, features=None):
+        prompt, prompt_report = self._create_analysis_prompt(patient_data, vital_signs, health_logs, features)
+        return await self._analysis_completion('analyze_patient_data', prompt, prompt_report)
+
+    async def analyze_patient_update(self, patient_data, prior_analysis, delta_features):
+        prompt, prompt_report = self._create_update_prompt(patient_data, prior_analysis, delta_features)
+        return await self._analysis_completion('analyze_patient_update', prompt, prompt_report)
+
+    async def generate_treatment_proposal(self, patient_context, ai_analysis):
+        try:
+            proposal, _, _ = await self._complete(
+                method='generate_treatment_proposal',
+                messages=self._proposal_messages(patient_context, ai_analysis),
+                parse=parse_proposal,
+                **PROPOSAL_PARAMS
+            )
+            return proposal
+
+        except Exception as e:
+            print(f"Error generating treatment proposal: {e}")
+            return self._proposal_fallback(e)
+
+    async def chat_with_doctor(self, conversation_history, doctor_message, summary=None):
+        messages = self._build_chat_messages(conversation_history, doctor_message, summary)
+        try:
+            content, _, _ = await self._complete(method='chat_with_doctor', messages=messages, **CHAT_PARAMS)
+            return content
+
+        except Exception as e:
+            print(f"Error in doctor chat: {e}")
+            return CHAT_FALLBACK
+
+    async def stream_chat_with_doctor(self, conversation_history, doctor_message, summary=None):
+        messages = self._build_chat_messages(conversation_history, doctor_message, summary)
+        produced = False
+        try:
+            async for delta in self._stream(messages, method='chat_with_doctor_stream', **CHAT_PARAMS):
+                produced = True
+                yield delta
+
+        except Exception as e:
+            print(f"Error in doctor chat stream: {e}")
+            if not produced:
+                yield CHAT_FALLBACK
+
+    async def summarize_discussion(self, previous_summary, turns):
+        try:
+            content, _, _ = await self._complete(
+                method='summarize_discussion',
+                messages=self._summary_messages(previous_summary, turns),
+                **SUMMARY_PARAMS
+            )
+            return content
+
+        except Exception as e:
+            print(f"Error summarizing discussion: {e}")
+            return None
+
+
+# Shares the sync analyzer's cache, breaker/retry policy and usage counters
+async_ai_analyzer = AsyncAIHealthAnalyzer(
+    cache=llm_cache,
+    analysis_budget=Config.ANALYSIS_PROMPT_TOKEN_BUDGET,
+    proposal_budget=Config.PROPOSAL_PROMPT_TOKEN_BUDGET,
+    policy=llm_policy,
+    timeouts=Config.LLM_METHOD_TIMEOUTS,
+    usage=ai_analyzer.usage
+)
@@ -3,19 +3,39 @@ from flask_cors import CORS
 from flask_jwt_extended import JWTManager
 from config import Config
 from models import db, bcrypt
-from routes import api
+from routes import api, fail_orphaned_analysis_jobs
+from query_stats import init_query_stats
+from auth import init_auth
+from json_provider import FastJSONProvider
+from db_routing import init_db_routing
+from metrics import init_metrics
+
+# Shared with the natively served ASGI routes (see asgi.py) so both return the same CORS headers
+CORS_OPTIONS = {'expose_headers': ['ETag', 'X-Query-Count', 'X-Query-Time-Ms']}
 
 def create_app():
     app = Flask(__name__)
     app.config.from_object(Config)
+    app.json = FastJSONProvider(app)
     
     db.init_app(app)
+    init_db_routing(app, db)
     bcrypt.init_app(app)
-    JWTManager(app)
-    CORS(app)
+    init_auth(JWTManager(app))
+    CORS(app, **CORS_OPTIONS)
+    init_query_stats(app)
+    init_metrics(app)
     
     app.register_blueprint(api, url_prefix='/api')
     
+    # Background jobs do not survive a restart; fail the rows they left behind
+    with app.app_context():
+        try:
+            fail_orphaned_analysis_jobs(all_owners=app.config['AI_JOB_SINGLE_PROCESS'])
+        except Exception as e:
+            db.session.rollback()
+            print(f"Could not check for orphaned analysis jobs: {e}")
+    
     @app.route('/')
     def home():
         return {
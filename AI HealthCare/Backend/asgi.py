@@ -0,0 +1,272 @@
+"""
+ASGI entry point: uvicorn asgi:app --workers 2
+
+The LLM-bound chat and proposal endpoints are served natively on the event
+loop by AsyncAIHealthAnalyzer, so an open completion or SSE stream costs a
+coroutine instead of a WSGI worker thread. Their short database phases (JWT
+checks, discussion rows) keep using the sync SQLAlchemy session and run in
+worker threads inside a Flask request context; rolling discussion summaries
+are produced on the loop after the reply is committed. Every other route,
+including the analysis endpoints and CORS preflights, is handed to the Flask
+app through asgiref's WSGI adapter, so behavior there is unchanged.
+"""
+import asyncio
+import json
+import time
+from asgiref.wsgi import WsgiToAsgi
+from flask import request, jsonify
+from flask_cors.core import get_cors_options, get_cors_headers
+from flask_jwt_extended import verify_jwt_in_request
+from werkzeug.datastructures import Headers
+from werkzeug.test import EnvironBuilder
+from app import create_app, CORS_OPTIONS
+from models import db
+from metrics import http_request_seconds
+from discussions import pending_fold, store_summary
+from routes import _begin_chat_turn, _store_ai_turn
+from ai_service_async import async_ai_analyzer
+
+flask_app = create_app()
+async_ai_analyzer.app = flask_app
+wsgi_app = WsgiToAsgi(flask_app)
+cors_options = get_cors_options(flask_app, CORS_OPTIONS)
+
+# Summary tasks still running after their response was sent
+_background_tasks = set()
+
+SSE_HEADERS = [
+    ('Content-Type', 'text/event-stream; charset=utf-8'),
+    ('Cache-Control', 'no-cache'),
+    ('X-Accel-Buffering', 'no')
+]
+
+
+def _in_request(scope, body, func):
+    """
+    Run func(json body) in a Flask request context rebuilt from the ASGI request
+
+    func returns (value, error response or None) like the route helpers.
+    JWT errors go through the app's error handlers; anything else is a 500.
+
+    Returns:
+        Tuple of (value, Flask response or None)
+    """
+    environ = EnvironBuilder(
+        path=scope['path'],
+        method=scope['method'],
+        query_string=scope.get('query_string', b'').decode('latin-1'),
+        headers=[(k.decode('latin-1'), v.decode('latin-1')) for k, v in scope['headers']],
+        data=body
+    ).get_environ()
+
+    with flask_app.request_context(environ):
+        try:
+            verify_jwt_in_request()
+            value, error = func(request.get_json())
+            return value, flask_app.make_response(error) if error else None
+        except Exception as e:
+            db.session.rollback()
+            try:
+                return None, flask_app.make_response(flask_app.handle_user_exception(e))
+            except Exception:
+                return None, flask_app.make_response((jsonify({'error': str(e)}), 500))
+
+
+async def _read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+
+def _in_app(func, *args):
+    with flask_app.app_context():
+        return func(*args)
+
+
+def _encode_headers(headers):
+    return [(k.encode('latin-1'), str(v).encode('latin-1')) for k, v in headers]
+
+
+def _cors_headers(scope):
+    """The headers Flask-CORS adds to Flask routes, for a native response"""
+    request_headers = Headers([(k.decode('latin-1'), v.decode('latin-1')) for k, v in scope['headers']])
+    return _encode_headers(get_cors_headers(cors_options, request_headers, scope['method']).items(multi=True))
+
+
+def _spawn(coro):
+    task = asyncio.ensure_future(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+async def _send_response(send, response):
+    """Send a complete Flask response"""
+    await send({
+        'type': 'http.response.start',
+        'status': response.status_code,
+        'headers': _encode_headers(response.headers.items())
+    })
+    await send({'type': 'http.response.body', 'body': response.get_data()})
+    return response.status_code
+
+
+async def _send_json(send, payload, status=200):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': _encode_headers([('Content-Type', 'application/json')])
+    })
+    await send({'type': 'http.response.body', 'body': flask_app.json.dumps(payload).encode('utf-8')})
+    return status
+
+
+def _prepare_chat(data):
+    """Validate a chat request and start its turn; value is (message, discussion_id, summary, history)"""
+    doctor_message = data.get('message', '')
+    if not doctor_message:
+        return None, (jsonify({'error': 'Message is required'}), 400)
+
+    turn = (None, None, data.get('conversation_history', []))
+    if data.get('discussion_id') or data.get('patient_id'):
+        turn, error = _begin_chat_turn(data, doctor_message)
+        if error:
+            return None, error
+    return (doctor_message,) + turn, None
+
+
+async def _fold_discussion(discussion_id):
+    """Async routes._fold_discussion: the summary call runs on the loop, outside any row lock"""
+    try:
+        fold = await asyncio.to_thread(
+            _in_app, pending_fold, discussion_id,
+            flask_app.config['CHAT_CONTEXT_WINDOW'], flask_app.config['CHAT_SUMMARY_BATCH']
+        )
+        if fold is None:
+            return
+        summary = await async_ai_analyzer.summarize_discussion(fold['summary'], fold['turns'])
+        if summary:
+            await asyncio.to_thread(_in_app, store_summary, discussion_id, fold, summary)
+    except Exception as e:
+        print(f"Error folding discussion {discussion_id}: {e}")
+
+
+async def _record_turn(scope, body, discussion_id, ai_response):
+    """Store the AI reply, then fold the discussion's summary in the background"""
+    stored, error = await asyncio.to_thread(
+        _in_request, scope, body, lambda data: (_store_ai_turn(discussion_id, ai_response), None)
+    )
+    if stored:
+        _spawn(_fold_discussion(discussion_id))
+    return error
+
+
+async def chat(scope, body, send):
+    """Async /api/ai/chat"""
+    chat_turn, error = await asyncio.to_thread(_in_request, scope, body, _prepare_chat)
+    if error:
+        return await _send_response(send, error)
+    doctor_message, discussion_id, summary, history = chat_turn
+
+    ai_response = await async_ai_analyzer.chat_with_doctor(history, doctor_message, summary=summary)
+    payload = {'message': 'AI response generated', 'ai_response': ai_response}
+
+    if discussion_id:
+        error = await _record_turn(scope, body, discussion_id, ai_response)
+        if error:
+            return await _send_response(send, error)
+        payload['discussion_id'] = discussion_id
+    return await _send_json(send, payload)
+
+
+async def chat_stream(scope, body, send):
+    """Async /api/ai/chat/stream, streaming the reply as Server-Sent Events"""
+    chat_turn, error = await asyncio.to_thread(_in_request, scope, body, _prepare_chat)
+    if error:
+        return await _send_response(send, error)
+    doctor_message, discussion_id, summary, history = chat_turn
+
+    await send({'type': 'http.response.start', 'status': 200, 'headers': _encode_headers(SSE_HEADERS)})
+    parts = []
+    async for delta in async_ai_analyzer.stream_chat_with_doctor(history, doctor_message, summary=summary):
+        parts.append(delta)
+        await send({
+            'type': 'http.response.body',
+            'body': f"data: {json.dumps({'delta': delta})}\n\n".encode('utf-8'),
+            'more_body': True
+        })
+
+    if discussion_id:
+        await _record_turn(scope, body, discussion_id, "".join(parts))
+    await send({
+        'type': 'http.response.body',
+        'body': f"event: done\ndata: {json.dumps({'discussion_id': discussion_id})}\n\n".encode('utf-8')
+    })
+    return 200
+
+
+async def proposal(scope, body, send):
+    """Async /api/ai/proposal"""
+    inputs, error = await asyncio.to_thread(
+        _in_request, scope, body,
+        lambda data: ((data.get('patient_context', {}), data.get('ai_analysis', {})), None)
+    )
+    if error:
+        return await _send_response(send, error)
+
+    treatment_proposal = await async_ai_analyzer.generate_treatment_proposal(*inputs)
+    return await _send_json(send, {
+        'message': 'Treatment proposal generated',
+        'proposal': treatment_proposal
+    })
+
+
+# POST routes served on the event loop; everything else goes to Flask
+NATIVE_ROUTES = {
+    '/api/ai/chat': chat,
+    '/api/ai/chat/stream': chat_stream,
+    '/api/ai/proposal': proposal
+}
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await _lifespan(receive, send)
+
+    handler = NATIVE_ROUTES.get(scope['path']) if scope['type'] == 'http' and scope['method'] == 'POST' else None
+    if handler is None:
+        return await wsgi_app(scope, receive, send)
+
+    cors = _cors_headers(scope)
+
+    async def send_with_cors(message):
+        if message['type'] == 'http.response.start':
+            message = dict(message, headers=list(message['headers']) + cors)
+        await send(message)
+
+    started = time.perf_counter()
+    status = 500
+    try:
+        status = await handler(scope, await _read_body(receive), send_with_cors)
+    except Exception as e:
+        print(f"Error serving {scope['path']}: {e}")
+        await _send_json(send_with_cors, {'error': str(e)}, 500)
+    finally:
+        http_request_seconds.observe(
+            time.perf_counter() - started,
+            method='POST',
+            route=scope['path'],
+            status=status
+        )
@@ -0,0 +1,109 @@
+import threading
+import time
+from functools import wraps
+from flask import g, jsonify
+from flask_jwt_extended import create_access_token, jwt_required, get_jwt, get_jwt_identity
+from sqlalchemy.orm import joinedload
+from config import Config
+from models import db, User
+
+
+def profile_claims(user):
+    """Role and profile ids embedded in access tokens"""
+    return {
+        'role': user.role,
+        'patient_id': user.patient_profile[0].id if user.patient_profile else None,
+        'doctor_id': user.doctor_profile[0].id if user.doctor_profile else None
+    }
+
+
+def create_user_token(user):
+    """Access token whose claims let routes authorize without loading the user"""
+    return create_access_token(identity=user.id, additional_claims=profile_claims(user))
+
+
+def load_user_with_profiles(**filters):
+    """Load a user together with its patient and doctor profiles in one query"""
+    return User.query.options(
+        joinedload(User.patient_profile),
+        joinedload(User.doctor_profile)
+    ).filter_by(**filters).first()
+
+
+def current_claims():
+    """
+    Role/profile claims of the current request's token
+
+    Tokens issued before claims were added only carry the identity, so for
+    those the claims are rebuilt from the database once per request.
+    """
+    claims = get_jwt()
+    if 'role' in claims:
+        return claims
+    if 'legacy_claims' not in g:
+        user = load_user_with_profiles(id=get_jwt_identity())
+        g.legacy_claims = profile_claims(user) if user else {}
+    return g.legacy_claims
+
+
+def role_required(*roles):
+    """jwt_required() that also answers 403 unless the token's role is one of roles"""
+    def decorator(view):
+        @wraps(view)
+        @jwt_required()
+        def wrapper(*args, **kwargs):
+            if current_claims().get('role') not in roles:
+                return jsonify({'error': 'Unauthorized'}), 403
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class UserStatusCache:
+    """
+    Per-process TTL cache of users.is_active
+
+    Checked for every token so deactivated (or deleted) users are locked out
+    within ttl seconds, at the cost of one lookup per user per ttl instead of
+    one per request.
+    """
+
+    def __init__(self, ttl=60, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def is_active(self, user_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+        if entry is not None and entry[0] > now:
+            return entry[1]
+
+        row = db.session.query(User.is_active).filter(User.id == user_id).first()
+        active = row is not None and row[0] is not False
+
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                self._entries = {k: v for k, v in self._entries.items() if v[0] > now}
+            self._entries[user_id] = (now + self.ttl, active)
+        return active
+
+    def invalidate(self, user_id=None):
+        """Forget one user's status (or everyone's) so the next request re-reads it"""
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(user_id, None)
+
+
+user_status = UserStatusCache(ttl=Config.AUTH_STATUS_CACHE_TTL)
+
+
+def init_auth(jwt):
+    """Reject tokens of users that are no longer active"""
+    @jwt.token_in_blocklist_loader
+    def token_revoked(jwt_header, jwt_payload):
+        return not user_status.is_active(jwt_payload['sub'])
@@ -0,0 +1,163 @@
+"""
+Local stand-in for the OpenAI chat completions API
+
+Answers POST /v1/chat/completions (plain and streaming) after a configurable
+delay with a configurable number of output tokens, so benchmarks measure
+this app rather than OpenAI. Point the app at it with
+OPENAI_BASE_URL=http://127.0.0.1:<port>/v1.
+
+    python benchmarks/fake_openai.py --port 8765 --latency-ms 400 --completion-tokens 200
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = ('heart', 'rate', 'sleep', 'trend', 'stable', 'review', 'monitor', 'patient', 'normal', 'follow-up')
+
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency_ms=300, jitter_ms=50, completion_tokens=150, error_rate=0.0):
+        super().__init__(address, FakeOpenAIHandler)
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.completion_tokens = completion_tokens
+        self.error_rate = error_rate
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}/v1'
+
+    def start(self):
+        """Serve on a daemon thread and return self"""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def count_request(self):
+        with self._lock:
+            self.requests += 1
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        request = json.loads(self.rfile.read(length) or b'{}')
+        server = self.server
+        server.count_request()
+
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self._send_json(404, {'error': {'message': f'Unknown path {self.path}'}})
+            return
+
+        delay = server.latency_ms + random.uniform(-server.jitter_ms, server.jitter_ms)
+        time.sleep(max(delay, 0) / 1000)
+
+        if server.error_rate and random.random() < server.error_rate:
+            self._send_json(500, {'error': {'message': 'Injected failure', 'type': 'server_error'}})
+            return
+
+        prompt_tokens = sum(len(str(m.get('content', ''))) for m in request.get('messages', [])) // 4
+        completion_tokens = min(server.completion_tokens, request.get('max_tokens') or server.completion_tokens)
+        text = ' '.join(random.choice(WORDS) for _ in range(completion_tokens))
+
+        if (request.get('response_format') or {}).get('type') == 'json_object':
+            content = json.dumps({
+                'findings': text,
+                'concerns': ['None significant'],
+                'risk_level': random.choice(['low', 'moderate', 'high']),
+                'recommendations': ['Continue monitoring'],
+                'evidence': ['Synthetic benchmark response']
+            })
+        else:
+            content = text
+
+        completion_id = f'chatcmpl-{uuid.uuid4().hex}'
+        created = int(time.time())
+        model = request.get('model', 'gpt-4o-mini')
+
+        if request.get('stream'):
+            self._stream(completion_id, created, model, content)
+            return
+
+        self._send_json(200, {
+            'id': completion_id,
+            'object': 'chat.completion',
+            'created': created,
+            'model': model,
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': content},
+                'finish_reason': 'stop'
+            }],
+            'usage': {
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': completion_tokens,
+                'total_tokens': prompt_tokens + completion_tokens
+            }
+        })
+
+    def _stream(self, completion_id, created, model, content):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+
+        def event(delta, finish_reason=None):
+            chunk = {
+                'id': completion_id,
+                'object': 'chat.completion.chunk',
+                'created': created,
+                'model': model,
+                'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}]
+            }
+            self.wfile.write(f'data: {json.dumps(chunk)}\n\n'.encode('utf-8'))
+
+        event({'role': 'assistant', 'content': ''})
+        for word in content.split(' '):
+            event({'content': word + ' '})
+        event({}, finish_reason='stop')
+        self.wfile.write(b'data: [DONE]\n\n')
+        self.wfile.flush()
+        self.close_connection = True
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fake OpenAI chat completions server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency-ms', type=float, default=300)
+    parser.add_argument('--jitter-ms', type=float, default=50)
+    parser.add_argument('--completion-tokens', type=int, default=150)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = FakeOpenAIServer(
+        (args.host, args.port),
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        completion_tokens=args.completion_tokens,
+        error_rate=args.error_rate
+    )
+    print(f"Fake OpenAI listening on {server.base_url}")
+    server.serve_forever()
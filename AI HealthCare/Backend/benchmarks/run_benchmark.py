@@ -0,0 +1,282 @@
+"""
+Throughput and latency benchmark for the API
+
+Boots create_app() on a local threaded server against the given database
+(SQLite by default, or a local Postgres via --database) with OpenAI replaced
+by benchmarks/fake_openai.py, seeds doctors and patients, then drives the
+login, patient listing, analyze, chat and decision workflows at each
+concurrency level. Reports requests/s and p50/p95/p99 latency per endpoint;
+--json writes the same numbers to a file for comparing releases.
+
+    cd Backend
+    python benchmarks/run_benchmark.py --concurrency 1,8,32 --requests 200
+    python benchmarks/run_benchmark.py --database postgresql://localhost/ai_healthcare_bench \\
+        --workflows patients,decision --json results.json
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from benchmarks.fake_openai import FakeOpenAIServer  # noqa: E402
+
+WORKFLOWS = ('login', 'patients', 'analyze', 'chat', 'decision')
+PASSWORD = 'benchmark-password'
+
+
+class Client:
+    """Minimal JSON HTTP client recording latency per endpoint name"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def call(self, name, method, path, body=None, token=None, record=True):
+        data = json.dumps(body).encode('utf-8') if body is not None else None
+        request = urllib.request.Request(self.base_url + path, data=data, method=method)
+        request.add_header('Content-Type', 'application/json')
+        if token:
+            request.add_header('Authorization', f'Bearer {token}')
+
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=120) as response:
+                payload = response.read()
+                status = response.status
+        except urllib.error.HTTPError as e:
+            payload = e.read()
+            status = e.code
+        except OSError:
+            payload, status = b'', 0
+        elapsed = time.perf_counter() - started
+
+        if record:
+            with self._lock:
+                self.samples[name].append(elapsed)
+                if not 200 <= status < 400:
+                    self.errors[name] += 1
+
+        if payload and payload.lstrip()[:1] in (b'{', b'['):
+            return status, json.loads(payload)
+        return status, payload
+
+    def reset(self):
+        with self._lock:
+            self.samples = defaultdict(list)
+            self.errors = defaultdict(int)
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def start_app(args, llm_base_url):
+    """Configure the environment, create the schema and serve create_app() on a free port"""
+    os.environ['DATABASE_URL'] = args.database
+    os.environ['OPENAI_BASE_URL'] = llm_base_url
+    os.environ.setdefault('OPENAI_API_KEY', 'sk-benchmark')
+    os.environ['QUERY_BUDGET'] = '0'
+    os.environ['LLM_CACHE_ENABLED'] = 'true' if args.llm_cache else 'false'
+    os.environ.setdefault('BCRYPT_LOG_ROUNDS', str(args.bcrypt_rounds))
+
+    from werkzeug.serving import make_server, WSGIRequestHandler
+    from app import create_app
+    from models import db
+
+    app = create_app()
+    app.config['DEBUG'] = False
+    with app.app_context():
+        if args.reset:
+            db.drop_all()
+        db.create_all()
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}/api'
+
+
+def seed(client, doctors, patients):
+    """Register benchmark users; returns (doctor logins, patient ids)"""
+    run_id = uuid.uuid4().hex[:8]
+    doctor_logins = []
+    for i in range(doctors):
+        email = f'bench-doctor-{run_id}-{i}@example.com'
+        status, body = client.call('seed', 'POST', '/auth/register', {
+            'email': email, 'password': PASSWORD, 'role': 'doctor',
+            'first_name': 'Bench', 'last_name': f'Doctor{i}',
+            'license_number': f'BENCH-{run_id}-{i}', 'specialization': 'Internal Medicine'
+        }, record=False)
+        if status != 201:
+            raise RuntimeError(f'Could not register doctor: {status} {body}')
+        doctor_logins.append((email, body['access_token']))
+
+    for i in range(patients):
+        status, body = client.call('seed', 'POST', '/auth/register', {
+            'email': f'bench-patient-{run_id}-{i}@example.com', 'password': PASSWORD, 'role': 'patient',
+            'first_name': 'Bench', 'last_name': f'Patient{i}',
+            'date_of_birth': '1975-06-15', 'gender': 'Female' if i % 2 else 'Male'
+        }, record=False)
+        if status != 201:
+            raise RuntimeError(f'Could not register patient: {status} {body}')
+
+    _, page = client.call('seed', 'GET', '/patients?limit=200&fields=id', token=doctor_logins[0][1], record=False)
+    patient_ids = [patient['id'] for patient in page['patients']]
+    return doctor_logins, patient_ids
+
+
+def make_workflows(client, doctor_logins, patient_ids):
+    """One callable per workflow taking the iteration number"""
+    def doctor(i):
+        return doctor_logins[i % len(doctor_logins)]
+
+    def patient(i):
+        return patient_ids[i % len(patient_ids)]
+
+    def login(i):
+        client.call('POST /auth/login', 'POST', '/auth/login', {'email': doctor(i)[0], 'password': PASSWORD})
+
+    def patients(i):
+        token = doctor(i)[1]
+        status, body = client.call('GET /patients', 'GET', '/patients?limit=50', token=token)
+        if status == 200 and body.get('next_cursor'):
+            client.call('GET /patients (page 2)', 'GET', f"/patients?limit=50&cursor={body['next_cursor']}", token=token)
+
+    def analyze(i):
+        client.call('POST /ai/analyze/<id>', 'POST', f'/ai/analyze/{patient(i)}', token=doctor(i)[1])
+
+    def chat(i):
+        token = doctor(i)[1]
+        status, body = client.call('POST /ai/chat (new)', 'POST', '/ai/chat', {
+            'patient_id': patient(i), 'message': f'What stands out for this patient? ({i})'
+        }, token=token)
+        if status == 200:
+            client.call('POST /ai/chat (follow-up)', 'POST', '/ai/chat', {
+                'discussion_id': body['discussion_id'], 'message': 'Any medication changes to consider?'
+            }, token=token)
+
+    def decision(i):
+        token = doctor(i)[1]
+        client.call('POST /decisions/create', 'POST', '/decisions/create', {
+            'patient_id': patient(i),
+            'treatment_plan': {'summary': 'Benchmark plan'},
+            'medications': ['Lisinopril 10mg'],
+            'ai_contributions': ['trend analysis'],
+            'doctor_contributions': ['dose choice']
+        }, token=token)
+        client.call('GET /decisions/patient/<id>', 'GET', f'/decisions/patient/{patient(i)}', token=token)
+
+    return {
+        'login': login,
+        'patients': patients,
+        'analyze': analyze,
+        'chat': chat,
+        'decision': decision
+    }
+
+
+def run_level(client, workflow, iterations, concurrency):
+    client.reset()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(workflow, range(iterations)))
+    wall = time.perf_counter() - started
+
+    results = {}
+    for name, samples in client.samples.items():
+        samples = sorted(samples)
+        results[name] = {
+            'requests': len(samples),
+            'errors': client.errors.get(name, 0),
+            'throughput_rps': round(len(samples) / wall, 2) if wall else 0.0,
+            'p50_ms': round(percentile(samples, 0.50) * 1000, 2),
+            'p95_ms': round(percentile(samples, 0.95) * 1000, 2),
+            'p99_ms': round(percentile(samples, 0.99) * 1000, 2)
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark AI HealthCare API workflows')
+    parser.add_argument('--database', default='sqlite:////tmp/ai_healthcare_bench.db')
+    parser.add_argument('--reset', action='store_true', help='Drop and recreate all tables first')
+    parser.add_argument('--workflows', default=','.join(WORKFLOWS))
+    parser.add_argument('--concurrency', default='1,8,32', help='Comma-separated concurrency levels')
+    parser.add_argument('--requests', type=int, default=100, help='Workflow iterations per level')
+    parser.add_argument('--doctors', type=int, default=4)
+    parser.add_argument('--patients', type=int, default=60)
+    parser.add_argument('--bcrypt-rounds', type=int, default=12)
+    parser.add_argument('--llm-latency-ms', type=float, default=300)
+    parser.add_argument('--llm-jitter-ms', type=float, default=50)
+    parser.add_argument('--llm-completion-tokens', type=int, default=150)
+    parser.add_argument('--llm-error-rate', type=float, default=0.0)
+    parser.add_argument('--llm-cache', action='store_true', help='Leave the LLM response cache enabled')
+    parser.add_argument('--json', dest='json_path', help='Write results to this file')
+    args = parser.parse_args()
+
+    workflows = [w.strip() for w in args.workflows.split(',') if w.strip()]
+    unknown = set(workflows) - set(WORKFLOWS)
+    if unknown:
+        parser.error(f"Unknown workflows: {', '.join(sorted(unknown))}")
+    levels = [int(level) for level in args.concurrency.split(',')]
+
+    llm = FakeOpenAIServer(
+        ('127.0.0.1', 0),
+        latency_ms=args.llm_latency_ms,
+        jitter_ms=args.llm_jitter_ms,
+        completion_tokens=args.llm_completion_tokens,
+        error_rate=args.llm_error_rate
+    ).start()
+    server, api_url = start_app(args, llm.base_url)
+
+    client = Client(api_url)
+    doctor_logins, patient_ids = seed(client, args.doctors, args.patients)
+    runners = make_workflows(client, doctor_logins, patient_ids)
+
+    report = {
+        'database': args.database.split('://')[0],
+        'llm_latency_ms': args.llm_latency_ms,
+        'requests_per_level': args.requests,
+        'results': []
+    }
+
+    print(f"{'workflow':<10} {'conc':>5} {'endpoint':<30} {'reqs':>6} {'err':>5} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for workflow in workflows:
+        for concurrency in levels:
+            results = run_level(client, runners[workflow], args.requests, concurrency)
+            for endpoint, stats in sorted(results.items()):
+                print(f"{workflow:<10} {concurrency:>5} {endpoint:<30} {stats['requests']:>6} {stats['errors']:>5} "
+                      f"{stats['throughput_rps']:>9} {stats['p50_ms']:>9} {stats['p95_ms']:>9} {stats['p99_ms']:>9}")
+                report['results'].append(dict(stats, workflow=workflow, concurrency=concurrency, endpoint=endpoint))
+
+    print(f"Fake OpenAI served {llm.requests} completions")
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.json_path}")
+
+    server.shutdown()
+    llm.shutdown()
+
+
+if __name__ == '__main__':
+    main()
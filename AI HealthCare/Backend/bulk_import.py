@@ -0,0 +1,287 @@
+import csv
+import io
+import json
+import uuid
+from datetime import date, datetime
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql, sqlite
+from models import db, User, Patient, Doctor
+from password_hashing import password_hasher
+from wearables import NDJSON_MIMETYPES
+
+CSV_MIMETYPES = ('text/csv', 'application/csv')
+
+REQUIRED_FIELDS = ('email', 'password', 'role', 'first_name', 'last_name')
+
+ROLES = ('patient', 'doctor')
+
+# Admin accounts are only created by the CLI below or by an existing admin
+ADMIN_ROLES = ROLES + ('admin',)
+
+# Keeps a multi-row INSERT well under Postgres' 65535 bind parameters per statement
+MAX_BATCH_SIZE = 1000
+
+
+def iter_records(stream, mimetype):
+    """
+    Yield (row_number, record) pairs from a CSV, NDJSON or JSON array body
+
+    CSV and NDJSON are read incrementally. A record that cannot be decoded is
+    yielded as a ValueError instead of a dict.
+    """
+    if mimetype in CSV_MIMETYPES:
+        reader = csv.DictReader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+        for row_number, record in enumerate(reader, start=1):
+            yield row_number, {k.strip(): v for k, v in record.items() if k}
+        return
+
+    if mimetype in NDJSON_MIMETYPES:
+        for row_number, line in enumerate(stream, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield row_number, json.loads(line)
+            except ValueError as e:
+                yield row_number, ValueError(f'Invalid JSON: {e}')
+        return
+
+    try:
+        body = json.loads(stream.read() or b'null')
+    except ValueError as e:
+        raise ValueError(f'Invalid JSON body: {e}')
+    if not isinstance(body, list):
+        raise ValueError('Expected a JSON array of users')
+    yield from enumerate(body, start=1)
+
+
+def normalize_user(record, roles=ROLES):
+    """
+    Validate one record and split it into users and profile row dicts
+
+    Admins have no profile row; their profile dict is never inserted.
+
+    Returns:
+        Tuple of (user row, password, profile row)
+    """
+    if not isinstance(record, dict):
+        raise ValueError('Record must be an object')
+
+    # CSV cells are strings; treat blanks as missing
+    record = {k: (v.strip() if isinstance(v, str) else v) for k, v in record.items()}
+    record = {k: v for k, v in record.items() if v not in (None, '')}
+
+    for field in REQUIRED_FIELDS:
+        if field not in record:
+            raise ValueError(f'Missing required field: {field}')
+
+    role = record['role']
+    if role not in roles:
+        raise ValueError(f"role must be one of: {', '.join(roles)}")
+    if '@' not in record['email']:
+        raise ValueError(f"Invalid email: {record['email']}")
+
+    user = {
+        'id': str(uuid.uuid4()),
+        'email': record['email'],
+        'role': role,
+        'first_name': record['first_name'],
+        'last_name': record['last_name'],
+        'is_active': True
+    }
+
+    if role == 'patient':
+        try:
+            date_of_birth = date.fromisoformat(str(record.get('date_of_birth', '2000-01-01')))
+        except ValueError:
+            raise ValueError(f"Invalid date_of_birth: {record['date_of_birth']}")
+        profile = {
+            'date_of_birth': date_of_birth,
+            'gender': record.get('gender'),
+            'blood_type': record.get('blood_type')
+        }
+    elif role == 'doctor':
+        try:
+            years_of_experience = int(record.get('years_of_experience', 0))
+        except (TypeError, ValueError):
+            raise ValueError('Field years_of_experience must be an integer')
+        profile = {
+            'license_number': record.get('license_number'),
+            'specialization': record.get('specialization'),
+            'years_of_experience': years_of_experience
+        }
+    else:
+        profile = {}
+
+    profile['id'] = str(uuid.uuid4())
+    profile['user_id'] = user['id']
+    return user, str(record['password']), profile
+
+
+def _insert_skipping_conflicts(table, rows, conflict_column, returning_column):
+    """
+    Multi-row INSERT that skips rows violating the unique conflict_column
+
+    Uses ON CONFLICT DO NOTHING ... RETURNING where the dialect supports it,
+    so conflicts are detected by the unique index in the same statement;
+    other databases fall back to one IN lookup for the whole batch.
+
+    Returns:
+        Set of returning_column values of the rows actually inserted
+    """
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+        stmt = insert(table).values(rows).on_conflict_do_nothing(
+            index_elements=[table.c[conflict_column]]
+        ).returning(table.c[returning_column])
+        return {value for (value,) in db.session.execute(stmt)}
+
+    keys = [row[conflict_column] for row in rows if row[conflict_column] is not None]
+    existing = set()
+    if keys:
+        existing = {
+            value for (value,) in db.session.execute(
+                select(table.c[conflict_column]).where(table.c[conflict_column].in_(keys))
+            )
+        }
+    rows = [row for row in rows if row[conflict_column] not in existing]
+    if rows:
+        db.session.execute(table.insert(), rows)
+    return {row[returning_column] for row in rows}
+
+
+def import_users(records, batch_size=500, hasher=None, roles=ROLES):
+    """
+    Validate and insert users with their patient/doctor profiles in batches
+
+    Each batch hashes its passwords in parallel on the password pool, then
+    writes users, patients and doctors with one multi-row INSERT each and
+    commits, so a large import keeps only one batch in memory and rows from
+    earlier batches stay imported if a later one fails. Emails (and doctor
+    license numbers) that are already taken are reported per row.
+
+    Args:
+        records: Iterable of (row_number, record) pairs from iter_records
+        batch_size: Number of users per INSERT statement, clamped to 1..MAX_BATCH_SIZE
+        hasher: PasswordHasher to use (defaults to the shared one)
+        roles: Roles records may have; ADMIN_ROLES also allows admin accounts
+
+    Returns:
+        Dict with inserted count, rejected count and per-row errors
+    """
+    hasher = hasher or password_hasher
+    batch_size = max(1, min(batch_size, MAX_BATCH_SIZE))
+    inserted = 0
+    errors = []
+    batch = []
+
+    def flush(batch):
+        passwords = hasher.hash_many(password for _, _, password, _ in batch)
+        created_at = datetime.utcnow()
+        users = []
+        for (_, user, _, _), password_hash in zip(batch, passwords):
+            users.append(dict(user, password_hash=password_hash, created_at=created_at))
+
+        new_ids = _insert_skipping_conflicts(User.__table__, users, 'email', 'id')
+
+        rows = []
+        for row_number, user, _, profile in batch:
+            if user['id'] not in new_ids:
+                errors.append({'row': row_number, 'email': user['email'], 'error': 'Email already registered'})
+                continue
+            rows.append((row_number, user, dict(profile, created_at=created_at)))
+
+        patients = [profile for _, user, profile in rows if user['role'] == 'patient']
+        if patients:
+            db.session.execute(Patient.__table__.insert(), patients)
+
+        # Doctors whose license number is taken are rolled back out of users
+        orphans = []
+        doctors = [profile for _, user, profile in rows if user['role'] == 'doctor']
+        if doctors:
+            placed = _insert_skipping_conflicts(Doctor.__table__, doctors, 'license_number', 'user_id')
+            orphans = [(row_number, user) for row_number, user, _ in rows
+                       if user['role'] == 'doctor' and user['id'] not in placed]
+        if orphans:
+            db.session.execute(User.__table__.delete().where(
+                User.__table__.c.id.in_([user['id'] for _, user in orphans])
+            ))
+            for row_number, user in orphans:
+                errors.append({'row': row_number, 'email': user['email'], 'error': 'License number already registered'})
+
+        db.session.commit()
+        return len(rows) - len(orphans)
+
+    seen_emails = set()
+    seen_licenses = set()
+    for row_number, record in records:
+        if isinstance(record, Exception):
+            errors.append({'row': row_number, 'error': str(record)})
+            continue
+
+        try:
+            user, password, profile = normalize_user(record, roles)
+        except ValueError as e:
+            errors.append({'row': row_number, 'error': str(e)})
+            continue
+
+        if user['email'] in seen_emails:
+            errors.append({'row': row_number, 'email': user['email'], 'error': 'Duplicate email in upload'})
+            continue
+        license_number = profile.get('license_number')
+        if license_number and license_number in seen_licenses:
+            errors.append({'row': row_number, 'email': user['email'], 'error': 'Duplicate license_number in upload'})
+            continue
+        seen_emails.add(user['email'])
+        if license_number:
+            seen_licenses.add(license_number)
+
+        batch.append((row_number, user, password, profile))
+        if len(batch) >= batch_size:
+            inserted += flush(batch)
+            batch = []
+
+    if batch:
+        inserted += flush(batch)
+
+    errors.sort(key=lambda error: error['row'])
+    return {
+        'inserted': inserted,
+        'rejected': len(errors),
+        'errors': errors
+    }
+
+
+if __name__ == '__main__':
+    # Onboard a clinic from a file: python bulk_import.py users.csv [--batch-size N] [--workers N]
+    import argparse
+    from app import create_app
+    from config import Config
+    from password_hashing import PasswordHasher
+
+    parser = argparse.ArgumentParser(description='Bulk import patients and doctors')
+    parser.add_argument('path', help='CSV, NDJSON (.ndjson/.jsonl) or JSON array file')
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--workers', type=int, default=Config.PASSWORD_HASH_WORKERS)
+    parser.add_argument('--allow-admin', action='store_true', help='Accept records with role admin')
+    args = parser.parse_args()
+
+    if args.path.endswith('.csv'):
+        mimetype = 'text/csv'
+    elif args.path.endswith(('.ndjson', '.jsonl')):
+        mimetype = 'application/x-ndjson'
+    else:
+        mimetype = 'application/json'
+
+    app = create_app()
+    with app.app_context(), open(args.path, 'rb') as stream:
+        report = import_users(
+            iter_records(stream, mimetype),
+            batch_size=args.batch_size,
+            hasher=PasswordHasher(rounds=Config.BCRYPT_LOG_ROUNDS, workers=args.workers, max_pending=1),
+            roles=ADMIN_ROLES if args.allow_admin else ROLES
+        )
+        for error in report['errors']:
+            print(f"Row {error['row']}: {error['error']}")
+        print(f"Imported {report['inserted']} users, rejected {report['rejected']}")
@@ -0,0 +1,180 @@
+import json
+import uuid
+import numpy as np
+from datetime import datetime, timedelta
+from sqlalchemy import func, case
+from models import db, Patient, WearableData, HealthLog, PatientRiskScore
+from features import VITAL_FIELDS, LOG_FIELDS, _to_matrix
+from rules_engine import rules_engine
+
+# Per-field aggregates computed in SQL, in this order along the last matrix axis
+AGGREGATES = ('mean', 'recent_mean')
+MEAN, RECENT = range(len(AGGREGATES))
+
+RISK_LEVELS = ('low', 'moderate', 'high', 'critical')
+# Upper score bound (inclusive) of each level but the last
+RISK_CUTOFFS = (0.0, 0.5, 1.5)
+
+
+def _aggregate(model, time_column, fields, start, recent_start):
+    """
+    One GROUP BY patient_id pass over a window
+
+    Returns:
+        (patient ids, sample counts of shape (n,), aggregates of shape
+        (n, len(fields), len(AGGREGATES)) with NaN where a field has no data)
+    """
+    columns = [model.patient_id, func.count(time_column)]
+    for field in fields:
+        column = getattr(model, field)
+        columns += [func.avg(column), func.avg(case((time_column >= recent_start, column)))]
+
+    rows = db.session.query(*columns).filter(time_column >= start).group_by(model.patient_id).all()
+    if not rows:
+        return [], np.zeros(0), np.empty((0, len(fields), len(AGGREGATES)))
+
+    M = _to_matrix([row[1:] for row in rows])
+    return [row[0] for row in rows], M[:, 0], M[:, 1:].reshape(len(rows), len(fields), len(AGGREGATES))
+
+
+def _align(cohort_index, ids, counts, stats):
+    """Scatter per-group results into cohort order; patients without data get NaN"""
+    aligned = np.full((len(cohort_index),) + stats.shape[1:], np.nan)
+    aligned_counts = np.zeros(len(cohort_index))
+    if ids:
+        rows = np.fromiter((cohort_index[i] for i in ids), dtype=int, count=len(ids))
+        aligned[rows] = stats
+        aligned_counts[rows] = counts
+    return aligned_counts, aligned
+
+
+def _bounds(fields, thresholds):
+    """(low, high, span) arrays for fields; NaN where a bound is not configured"""
+    low = np.array([thresholds.get(f, {}).get('min') for f in fields], dtype=float)
+    high = np.array([thresholds.get(f, {}).get('max') for f in fields], dtype=float)
+    one_sided = np.fmax(np.abs(np.where(np.isnan(low), high, low)), 1.0)
+    span = np.where(np.isnan(low) | np.isnan(high), one_sided, high - low)
+    return low, high, np.nan_to_num(span, nan=1.0)
+
+
+def score_matrix(stats, fields, thresholds):
+    """
+    Vectorized rules score for a whole cohort
+
+    Mirrors RulesEngine.screen: each field's window mean and recent mean
+    contribute their distance outside the normal range, scaled by the width
+    of the range. Missing values and unconfigured bounds contribute 0.
+
+    Args:
+        stats: Aggregates of shape (patients, fields, len(AGGREGATES))
+        fields: Field names along axis 1
+        thresholds: {field: {'min': ..., 'max': ...}}
+
+    Returns:
+        Per-field contributions, shape (patients, fields)
+    """
+    low, high, span = _bounds(fields, thresholds)
+    values = stats
+    with np.errstate(invalid='ignore'):
+        below = np.nan_to_num(np.fmax(low[None, :, None] - values, 0.0))
+        above = np.nan_to_num(np.fmax(values - high[None, :, None], 0.0))
+    return ((below + above) / span[None, :, None]).sum(axis=2)
+
+
+def risk_levels(scores):
+    """Map scores to RISK_LEVELS with the RISK_CUTOFFS bins"""
+    return np.array(RISK_LEVELS)[np.digitize(scores, RISK_CUTOFFS, right=True)]
+
+
+def score_cohort(days=30, recent_days=3, end=None, min_samples=None, write=True, batch_size=5000):
+    """
+    Score every patient's recent vitals and health logs in vectorized passes
+
+    Wearable and health log windows are reduced per patient in SQL (two
+    GROUP BY queries for the whole cohort), laid out as (patients, fields,
+    aggregates) matrices and scored against the rules pre-screen thresholds
+    with array operations only, so a run costs the same handful of
+    statements whether there are a hundred patients or tens of thousands.
+    Results are bulk-inserted into patient_risk_scores under one scored_at
+    timestamp.
+
+    Returns:
+        Dict with scored_at, patients scored and a count per risk level
+    """
+    end = end or datetime.utcnow()
+    start = end - timedelta(days=days)
+    recent_start = end - timedelta(days=recent_days)
+    min_samples = rules_engine.min_samples if min_samples is None else min_samples
+
+    patient_ids = [row[0] for row in db.session.query(Patient.id).order_by(Patient.id).all()]
+    cohort_index = {patient_id: i for i, patient_id in enumerate(patient_ids)}
+
+    vital_counts, vital_stats = _align(cohort_index, *_aggregate(
+        WearableData, WearableData.recorded_at, VITAL_FIELDS, start, recent_start
+    ))
+    log_counts, log_stats = _align(cohort_index, *_aggregate(
+        HealthLog, HealthLog.log_date, LOG_FIELDS, start.date(), recent_start.date()
+    ))
+
+    fields = VITAL_FIELDS + LOG_FIELDS
+    thresholds = dict(rules_engine.thresholds.get('vitals', {}), **rules_engine.thresholds.get('logs', {}))
+    contributions = np.concatenate([
+        score_matrix(vital_stats, VITAL_FIELDS, thresholds),
+        score_matrix(log_stats, LOG_FIELDS, thresholds)
+    ], axis=1)
+    scores = contributions.sum(axis=1)
+    levels = risk_levels(scores)
+    levels[(vital_counts < min_samples) & (log_counts == 0)] = 'unknown'
+
+    # Fields out of range per patient, largest contribution first
+    order = np.argsort(-contributions, axis=1)
+    flagged = np.take_along_axis(contributions, order, axis=1) > 0
+
+    summary = {'scored_at': end.isoformat(), 'patients': len(patient_ids), 'risk_levels': {}}
+    for level in list(RISK_LEVELS) + ['unknown']:
+        summary['risk_levels'][level] = int((levels == level).sum())
+
+    if not write:
+        return summary
+
+    rows = []
+    for i, patient_id in enumerate(patient_ids):
+        rows.append({
+            'id': str(uuid.uuid4()),
+            'patient_id': patient_id,
+            'scored_at': end,
+            'window_days': days,
+            'wearable_samples': int(vital_counts[i]),
+            'health_logs': int(log_counts[i]),
+            'score': round(float(scores[i]), 3),
+            'risk_level': str(levels[i]),
+            'flags': json.dumps([fields[j] for j in order[i][flagged[i]]])
+        })
+
+    table = PatientRiskScore.__table__
+    for offset in range(0, len(rows), batch_size):
+        db.session.execute(table.insert(), rows[offset:offset + batch_size])
+    db.session.commit()
+    return summary
+
+
+if __name__ == '__main__':
+    # Nightly population triage: python cohort_scoring.py [--days N] [--recent-days N] [--dry-run]
+    import argparse
+    import time
+    from app import create_app
+    from config import Config
+
+    parser = argparse.ArgumentParser(description='Score every patient from recent vitals and health logs')
+    parser.add_argument('--days', type=int, default=Config.ANALYSIS_WINDOW_DAYS)
+    parser.add_argument('--recent-days', type=int, default=3)
+    parser.add_argument('--dry-run', action='store_true', help='Print the summary without writing scores')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        started = time.perf_counter()
+        summary = score_cohort(days=args.days, recent_days=args.recent_days, write=not args.dry_run)
+        elapsed = time.perf_counter() - started
+        levels = ', '.join(f'{level} {count}' for level, count in summary['risk_levels'].items())
+        print(f"Scored {summary['patients']} patients in {elapsed:.2f}s ({levels})")
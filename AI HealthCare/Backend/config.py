@@ -1,3 +1,4 @@
+import json
 import os
 from dotenv import load_dotenv
 
@@ -6,8 +7,97 @@ load_dotenv()
 class Config:
     SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': int(os.getenv('DB_POOL_SIZE', 10)),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 20)),
+        'pool_timeout': int(os.getenv('DB_POOL_TIMEOUT', 30)),
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': os.getenv('DB_POOL_PRE_PING', 'true').lower() == 'true'
+    }
+    # Optional read replica; GET requests read from it (see db_routing.py)
+    DATABASE_REPLICA_URL = os.getenv('DATABASE_REPLICA_URL')
+    SQLALCHEMY_BINDS = {'replica': DATABASE_REPLICA_URL} if DATABASE_REPLICA_URL else {}
+    REPLICA_READ_YOUR_WRITES = int(os.getenv('REPLICA_READ_YOUR_WRITES', 10))  # Seconds a writer's reads stay on the primary
     SECRET_KEY = os.getenv('SECRET_KEY', 'dev-secret-key')
     JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY', 'jwt-secret-key')
     JWT_ACCESS_TOKEN_EXPIRES = 86400
+    AUTH_STATUS_CACHE_TTL = int(os.getenv('AUTH_STATUS_CACHE_TTL', 60))  # Seconds a user's is_active flag is trusted
+    
+    # Password hashing (existing hashes are upgraded on login when BCRYPT_LOG_ROUNDS changes)
+    BCRYPT_LOG_ROUNDS = int(os.getenv('BCRYPT_LOG_ROUNDS', 12))
+    PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', 2))  # 0 hashes inline
+    PASSWORD_HASH_MAX_PENDING = int(os.getenv('PASSWORD_HASH_MAX_PENDING', 32))
     OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
+    
+    # Wearable ingestion
+    WEARABLE_INGEST_BATCH_SIZE = int(os.getenv('WEARABLE_INGEST_BATCH_SIZE', 1000))
+    WEARABLE_INGEST_MAX_SAMPLES = int(os.getenv('WEARABLE_INGEST_MAX_SAMPLES', 50000))
+    
+    # AI analysis feature window
+    ANALYSIS_WINDOW_DAYS = int(os.getenv('ANALYSIS_WINDOW_DAYS', 30))
+    ANALYSIS_OUTLIER_Z = float(os.getenv('ANALYSIS_OUTLIER_Z', 3.0))
+    
+    # Rules pre-screen: clearly normal patients skip the LLM (see rules_engine.py)
+    ANALYSIS_RULES_ENABLED = os.getenv('ANALYSIS_RULES_ENABLED', 'true').lower() == 'true'
+    ANALYSIS_RULES_MIN_SAMPLES = int(os.getenv('ANALYSIS_RULES_MIN_SAMPLES', 24))
+    ANALYSIS_RULES_MAX_OUTLIERS = int(os.getenv('ANALYSIS_RULES_MAX_OUTLIERS', 2))
+    # JSON overrides, e.g. {"vitals": {"heart_rate": {"min": 45, "max": 110}}}
+    ANALYSIS_RULES_THRESHOLDS = json.loads(os.getenv('ANALYSIS_RULES_THRESHOLDS') or '{}')
+    
+    # Prompt token budgets
+    ANALYSIS_PROMPT_TOKEN_BUDGET = int(os.getenv('ANALYSIS_PROMPT_TOKEN_BUDGET', 1500))
+    PROPOSAL_PROMPT_TOKEN_BUDGET = int(os.getenv('PROPOSAL_PROMPT_TOKEN_BUDGET', 2000))
+    
+    # OpenAI call resilience
+    LLM_TIMEOUT = float(os.getenv('LLM_TIMEOUT', 30))  # Default deadline per call, all attempts included
+    # Per-method deadline overrides, e.g. {"chat_with_doctor": 15, "analyze_patient_data": 45}
+    LLM_METHOD_TIMEOUTS = json.loads(os.getenv('LLM_METHOD_TIMEOUTS') or '{}')
+    LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', 2))
+    LLM_RETRY_BACKOFF = float(os.getenv('LLM_RETRY_BACKOFF', 0.5))  # Seconds, doubled per retry with full jitter
+    LLM_RETRY_BACKOFF_MAX = float(os.getenv('LLM_RETRY_BACKOFF_MAX', 8))
+    LLM_HEDGE_AFTER = float(os.getenv('LLM_HEDGE_AFTER', 0))  # Seconds before a hedged second request (0 disables)
+    LLM_BREAKER_FAILURES = int(os.getenv('LLM_BREAKER_FAILURES', 5))  # Consecutive failures that open the breaker
+    LLM_BREAKER_RESET = float(os.getenv('LLM_BREAKER_RESET', 30))  # Seconds open before a probe call
+    
+    # LLM response cache
+    LLM_CACHE_ENABLED = os.getenv('LLM_CACHE_ENABLED', 'true').lower() == 'true'
+    LLM_CACHE_TTL = int(os.getenv('LLM_CACHE_TTL', 86400))
+    LLM_CACHE_MAX_ENTRIES = int(os.getenv('LLM_CACHE_MAX_ENTRIES', 1024))
+    LLM_CACHE_SHARED = os.getenv('LLM_CACHE_SHARED', 'true').lower() == 'true'
+    
+    # Batch AI analysis
+    AI_BATCH_MAX_PATIENTS = int(os.getenv('AI_BATCH_MAX_PATIENTS', 500))
+    AI_BATCH_MAX_WORKERS = int(os.getenv('AI_BATCH_MAX_WORKERS', 8))
+    AI_BATCH_RATE_LIMIT = float(os.getenv('AI_BATCH_RATE_LIMIT', 10))
+    
+    # Analyses of unchanged patient data are reused on the same day of the analysis window, and
+    # changed data is sent as a delta against the previous analysis while it is younger than
+    # ANALYSIS_REUSE_MAX_AGE
+    ANALYSIS_REUSE_MAX_AGE = int(os.getenv('ANALYSIS_REUSE_MAX_AGE', 7 * 86400))
+    ANALYSIS_INCREMENTAL_ENABLED = os.getenv('ANALYSIS_INCREMENTAL_ENABLED', 'true').lower() == 'true'
+    ANALYSIS_COALESCE_TIMEOUT = int(os.getenv('ANALYSIS_COALESCE_TIMEOUT', 120))  # Max wait on an in-flight call
+    
+    # Background AI analysis jobs
+    AI_JOB_WORKERS = int(os.getenv('AI_JOB_WORKERS', 4))
+    AI_JOB_MAX_PENDING = int(os.getenv('AI_JOB_MAX_PENDING', 100))
+    # Polled jobs older than this are treated as lost and failed (their owner's exit is caught sooner when on this host)
+    AI_JOB_STALE_AFTER = int(os.getenv('AI_JOB_STALE_AFTER', 1800))
+    # Set when one process serves the app, so startup fails every job left queued/running
+    AI_JOB_SINGLE_PROCESS = os.getenv('AI_JOB_SINGLE_PROCESS', 'false').lower() == 'true'
+    
+    # Server-side discussion context
+    CHAT_CONTEXT_WINDOW = int(os.getenv('CHAT_CONTEXT_WINDOW', 6))
+    CHAT_SUMMARY_BATCH = int(os.getenv('CHAT_SUMMARY_BATCH', 4))
+    CHAT_SUMMARY_WORKERS = int(os.getenv('CHAT_SUMMARY_WORKERS', 2))  # Background summary threads
+    
+    # Seconds clients may reuse decision/analysis reads before revalidating with If-None-Match
+    HTTP_CACHE_MAX_AGE = int(os.getenv('HTTP_CACHE_MAX_AGE', 0))
+    
+    # Bearer token required to scrape /api/metrics (unset leaves it open)
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+    
+    # Per-request SQL query budget, checked in debug mode (0 disables)
+    QUERY_BUDGET = int(os.getenv('QUERY_BUDGET', 15))
+    QUERY_BUDGET_STRICT = os.getenv('QUERY_BUDGET_STRICT', 'false').lower() == 'true'
+    
     DEBUG = True
\ No newline at end of file
@@ -0,0 +1,82 @@
+import time
+import sqlalchemy as sa
+from flask import request, current_app
+from flask_sqlalchemy.session import Session
+
+REPLICA_BIND = 'replica'
+
+# Set after a client's writes; its reads stay on the primary until the time it holds
+RECENT_WRITE_COOKIE = 'read_primary_until'
+
+
+def use_primary(view):
+    """Keep a GET view on the primary, e.g. when clients read right after their own writes"""
+    view._use_primary = True
+    return view
+
+
+def _is_plain_select(clause):
+    return isinstance(clause, sa.Select) and clause._for_update_arg is None
+
+
+class RoutingSession(Session):
+    """
+    Session that sends reads to the read replica while marked read-only
+
+    A session is read-only when session.info['read_only'] is set (done per
+    request for GET/HEAD, see init_db_routing). Flushes, INSERT/UPDATE/DELETE
+    and SELECT ... FOR UPDATE always use the primary, and the first of them
+    pins the rest of the session to the primary so it reads its own writes.
+    Without a 'replica' bind everything goes to the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self.info.get('read_only') and not self.info.get('wrote'):
+            if not self._flushing and _is_plain_select(clause):
+                replica = self._db.engines.get(REPLICA_BIND)
+                if replica is not None:
+                    return replica
+            else:
+                self.info['wrote'] = True
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _wrote_recently():
+    try:
+        return float(request.cookies.get(RECENT_WRITE_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def init_db_routing(app, db):
+    """
+    Mark the session of every GET/HEAD request read-only unless the view opts out
+
+    A successful write request sets a cookie that keeps the client's reads
+    on the primary for REPLICA_READ_YOUR_WRITES seconds, so it sees its own
+    writes while the replica catches up. Other clients keep reading from
+    the replica.
+    """
+    @app.before_request
+    def route_reads_to_replica():
+        view = current_app.view_functions.get(request.endpoint)
+        db.session.info['read_only'] = (
+            request.method in ('GET', 'HEAD')
+            and not getattr(view, '_use_primary', False)
+            and not _wrote_recently()
+        )
+        db.session.info.pop('wrote', None)
+
+    @app.after_request
+    def mark_recent_write(response):
+        window = current_app.config.get('REPLICA_READ_YOUR_WRITES', 0)
+        if (window and REPLICA_BIND in current_app.config.get('SQLALCHEMY_BINDS', {})
+                and request.method not in ('GET', 'HEAD', 'OPTIONS') and response.status_code < 400):
+            response.set_cookie(
+                RECENT_WRITE_COOKIE,
+                str(time.time() + window),
+                max_age=window,
+                httponly=True,
+                samesite='Lax'
+            )
+        return response
@@ -0,0 +1,143 @@
+from sqlalchemy import func
+from models import db, CollaborativeDiscussion, DiscussionMessage
+
+
+def lock_discussion(discussion_id):
+    """Load a discussion row locked for update so turns get consecutive message_order values"""
+    return CollaborativeDiscussion.query.filter_by(id=discussion_id).with_for_update().first()
+
+
+def build_context(discussion):
+    """
+    Context for the next model call: the rolling summary plus every turn not yet folded into it
+
+    Returns:
+        Tuple of (summary or None, conversation_history list of {speaker, content})
+    """
+    turns = db.session.query(
+        DiscussionMessage.speaker, DiscussionMessage.content
+    ).filter(
+        DiscussionMessage.discussion_id == discussion.id,
+        DiscussionMessage.message_order > (discussion.summarized_through or 0)
+    ).order_by(DiscussionMessage.message_order).all()
+
+    history = [{'speaker': speaker, 'content': content} for speaker, content in turns]
+    return discussion.summary, history
+
+
+def append_turns(discussion, turns):
+    """Append (speaker, content) turns after the discussion's last message"""
+    last_order = db.session.query(
+        func.coalesce(func.max(DiscussionMessage.message_order), 0)
+    ).filter(DiscussionMessage.discussion_id == discussion.id).scalar()
+
+    messages = []
+    for offset, (speaker, content) in enumerate(turns, start=1):
+        message = DiscussionMessage(
+            discussion_id=discussion.id,
+            speaker=speaker,
+            message_order=last_order + offset,
+            content=content
+        )
+        db.session.add(message)
+        messages.append(message)
+    return messages
+
+
+def analysis_turn(analysis):
+    """AI turn opening a discussion of a stored analysis, so the model sees what is being discussed"""
+    def as_list(value):
+        if isinstance(value, (list, tuple)):
+            return '\n'.join(f'{i}. {item}' for i, item in enumerate(value, start=1))
+        return value or 'None'
+
+    return (
+        f"Patient analysis ({analysis.get('analysis_timestamp') or 'date unknown'})\n"
+        f"Key findings: {analysis.get('findings') or 'None'}\n"
+        f"Concerns:\n{as_list(analysis.get('concerns'))}\n"
+        f"Risk level: {analysis.get('risk_level') or 'unknown'}\n"
+        f"Recommendations:\n{as_list(analysis.get('recommendations'))}"
+    )
+
+
+def pending_fold(discussion_id, window=6, batch=4):
+    """
+    Turns that fell out of the recent window, once there are enough to summarize
+
+    Args:
+        discussion_id: Discussion to check (read without a row lock)
+        window: Number of most recent turns always sent verbatim
+        batch: Minimum number of out-of-window turns before summarizing
+
+    Returns:
+        Dict with the previous summary, summarized_through, the evicted
+        turns and the message_order they run through, or None
+    """
+    discussion = CollaborativeDiscussion.query.get(discussion_id)
+    if discussion is None:
+        return None
+
+    turns = DiscussionMessage.query.filter(
+        DiscussionMessage.discussion_id == discussion_id,
+        DiscussionMessage.message_order > (discussion.summarized_through or 0)
+    ).order_by(DiscussionMessage.message_order).all()
+
+    evicted = turns[:max(len(turns) - window, 0)]
+    if len(evicted) < batch:
+        return None
+
+    return {
+        'summary': discussion.summary,
+        'summarized_through': discussion.summarized_through or 0,
+        'turns': [{'speaker': m.speaker, 'content': m.content} for m in evicted],
+        'through': evicted[-1].message_order
+    }
+
+
+def store_summary(discussion_id, fold, summary):
+    """
+    Save the summary of a pending_fold result
+
+    Skipped when another fold of the same discussion was stored in the
+    meantime, so concurrent folds cannot move summarized_through backwards.
+
+    Returns:
+        True if the summary was stored
+    """
+    discussion = lock_discussion(discussion_id)
+    if discussion is None or (discussion.summarized_through or 0) != fold['summarized_through']:
+        db.session.rollback()
+        return False
+
+    discussion.summary = summary
+    discussion.summarized_through = fold['through']
+    db.session.commit()
+    return True
+
+
+def fold_old_turns(discussion_id, summarize, window=6, batch=4):
+    """
+    Fold turns that fell out of the recent window into the rolling summary
+
+    Summarization only runs once at least `batch` turns have left the window,
+    and only those turns are sent to the model together with the previous
+    summary, so each update costs the same regardless of discussion length.
+    No row lock is held during the model call; the discussion is only
+    locked to store the result.
+
+    Args:
+        discussion_id: Discussion to fold
+        summarize: Callable(previous_summary, turns) -> new summary text
+
+    Returns:
+        True if the summary was updated
+    """
+    fold = pending_fold(discussion_id, window=window, batch=batch)
+    db.session.commit()
+    if fold is None:
+        return False
+
+    summary = summarize(fold['summary'], fold['turns'])
+    if not summary:
+        return False
+    return store_summary(discussion_id, fold, summary)
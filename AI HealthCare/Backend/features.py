@@ -0,0 +1,278 @@
+import hashlib
+import json
+import numpy as np
+from datetime import datetime, date, timedelta
+from sqlalchemy import func
+from models import db, WearableData, HealthLog
+
+SECONDS_PER_DAY = 86400.0
+EPOCH = datetime(1970, 1, 1)
+
+VITAL_FIELDS = (
+    'heart_rate', 'spo2', 'sleep_score', 'heart_rate_variability',
+    'respiratory_rate', 'temperature', 'stress_score'
+)
+
+LOG_FIELDS = (
+    'blood_pressure_systolic', 'blood_pressure_diastolic', 'glucose_mg_dl',
+    'weight_kg', 'symptom_severity'
+)
+
+
+def patient_age(date_of_birth, today=None):
+    """Age in whole years"""
+    if not date_of_birth:
+        return None
+    today = today or date.today()
+    return today.year - date_of_birth.year - (
+        (today.month, today.day) < (date_of_birth.month, date_of_birth.day)
+    )
+
+
+def data_fingerprint(patient_id, days):
+    """
+    Cheap marker that changes whenever a patient's analysis inputs change
+
+    Wearable samples and health logs are append-only, so their row counts
+    and newest created_at identify the data stored for the patient. The
+    analysis window's bounds, truncated to the day, are included too: as the
+    window moves, data leaves it (or a patient who stopped syncing has less
+    and less recent data), so an analysis is not reused past the day it was
+    computed for.
+
+    Returns:
+        (sha256 hex fingerprint, snapshot dict it was computed from)
+    """
+    wearable_count, wearable_latest = db.session.query(
+        func.count(WearableData.id), func.max(WearableData.created_at)
+    ).filter(WearableData.patient_id == patient_id).one()
+    log_count, log_latest = db.session.query(
+        func.count(HealthLog.id), func.max(HealthLog.created_at)
+    ).filter(HealthLog.patient_id == patient_id).one()
+
+    end = datetime.utcnow().date()
+    snapshot = {
+        'window_days': days,
+        'window_start': (end - timedelta(days=days)).isoformat(),
+        'window_end': end.isoformat(),
+        'wearable_samples': wearable_count,
+        'wearable_latest': wearable_latest.isoformat() if wearable_latest else None,
+        'health_logs': log_count,
+        'health_log_latest': log_latest.isoformat() if log_latest else None
+    }
+    payload = json.dumps([patient_id, snapshot], sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest(), snapshot
+
+
+def features_hash(features):
+    """Hash of the summarized data an analysis prompt is built from, with the window bounds to the day"""
+    window = features['window']
+    content = {key: value for key, value in features.items() if key != 'window'}
+    content['samples'] = [window['wearable_samples'], window['health_logs']]
+    content['window'] = [window['start'][:10], window['end'][:10]]
+    payload = json.dumps(content, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _to_matrix(rows):
+    """Turn a list of column tuples into a float matrix with NaN for missing values"""
+    if not rows:
+        return np.empty((0, 0))
+    values = np.array(rows, dtype=object)
+    values[np.equal(values, None)] = np.nan
+    return values.astype(float)
+
+
+def summarize_matrix(t_days, X, rolling_days=3, outlier_z=3.0):
+    """
+    Compute per-column statistics for a time series matrix in one pass
+
+    Every statistic is a masked reduction over axis 0, so all columns are
+    handled by the same handful of NumPy operations regardless of how many
+    samples are in the window.
+
+    Args:
+        t_days: Sample times in fractional days, shape (n,)
+        X: Sample values, shape (n, k), NaN where a value is missing
+        rolling_days: Width of the trailing rolling mean, in days
+        outlier_z: Absolute z-score above which a sample counts as an outlier
+
+    Returns:
+        Dict of (k,) arrays: count, mean, std, min, max, cv, trend_per_day,
+        rolling_mean, outliers, last; plus day_start/daily_mean for the
+        per-day series
+    """
+    mask = ~np.isnan(X)
+    count = mask.sum(axis=0)
+    safe_count = np.maximum(count, 1)
+    Xz = np.where(mask, X, 0.0)
+
+    mean = Xz.sum(axis=0) / safe_count
+    centered = np.where(mask, X - mean, 0.0)
+    std = np.sqrt((centered ** 2).sum(axis=0) / safe_count)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        x_min = np.where(count > 0, np.where(mask, X, np.inf).min(axis=0), np.nan)
+        x_max = np.where(count > 0, np.where(mask, X, -np.inf).max(axis=0), np.nan)
+
+        # Least-squares slope per column, using only the samples present in that column
+        t = t_days[:, None]
+        t_mean = (t * mask).sum(axis=0) / safe_count
+        t_centered = np.where(mask, t - t_mean, 0.0)
+        t_var = (t_centered ** 2).sum(axis=0)
+        trend = np.where(t_var > 0, (t_centered * centered).sum(axis=0) / t_var, np.nan)
+
+        cv = np.where(mean != 0, std / np.abs(mean), np.nan)
+        z = np.where(std > 0, centered / std, 0.0)
+    outliers = (np.abs(z) > outlier_z).sum(axis=0)
+
+    # Daily means via scatter-add into (days, k) buckets
+    day_index = np.floor(t_days - np.floor(t_days.min())).astype(int)
+    n_days = day_index.max() + 1
+    day_sum = np.zeros((n_days, X.shape[1]))
+    day_count = np.zeros((n_days, X.shape[1]))
+    np.add.at(day_sum, day_index, Xz)
+    np.add.at(day_count, day_index, mask)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        daily_mean = day_sum / day_count
+        recent = slice(max(n_days - rolling_days, 0), n_days)
+        rolling_mean = day_sum[recent].sum(axis=0) / day_count[recent].sum(axis=0)
+
+    # Most recent non-missing value per column
+    last_index = np.where(count > 0, X.shape[0] - 1 - np.argmax(mask[::-1], axis=0), 0)
+    last = np.where(count > 0, X[last_index, np.arange(X.shape[1])], np.nan)
+
+    return {
+        'count': count,
+        'mean': mean,
+        'std': std,
+        'min': x_min,
+        'max': x_max,
+        'cv': cv,
+        'trend_per_day': trend,
+        'rolling_mean': rolling_mean,
+        'outliers': outliers,
+        'last': last,
+        'day_start': np.floor(t_days.min()),
+        'daily_mean': daily_mean,
+    }
+
+
+def _round(value, digits=1):
+    if value is None or np.isnan(value):
+        return None
+    return int(round(float(value))) if digits == 0 else round(float(value), digits)
+
+
+def _column_summaries(fields, stats, rolling_days):
+    summaries = {}
+    for i, field in enumerate(fields):
+        if not stats['count'][i]:
+            continue
+        summaries[field] = {
+            'n': int(stats['count'][i]),
+            'mean': _round(stats['mean'][i]),
+            'std': _round(stats['std'][i]),
+            'min': _round(stats['min'][i]),
+            'max': _round(stats['max'][i]),
+            'cv': _round(stats['cv'][i], 3),
+            'trend_per_day': _round(stats['trend_per_day'][i], 2),
+            f'rolling_mean_{rolling_days}d': _round(stats['rolling_mean'][i]),
+            'outliers': int(stats['outliers'][i]),
+            'last': _round(stats['last'][i])
+        }
+    return summaries
+
+
+def extract_patient_features(patient_id, days=30, end=None, rolling_days=3, outlier_z=3.0,
+                             daily_points=7, recent_logs=5, wearable_created_after=None,
+                             log_created_after=None):
+    """
+    Load a patient's wearable and health log window and summarize it
+
+    wearable_created_after / log_created_after restrict the window to rows
+    stored after those times, for summarizing only what is new since a
+    previous analysis.
+
+    Returns:
+        Dict with the analysis window, per-vital and per-log-field statistics,
+        a short daily series (the shape _format_vital_signs expects) and the
+        most recent health logs (the shape _format_health_logs expects)
+    """
+    end = end or datetime.utcnow()
+    start = end - timedelta(days=days)
+
+    wearable_query = db.session.query(
+        WearableData.recorded_at,
+        *[getattr(WearableData, field) for field in VITAL_FIELDS]
+    ).filter(
+        WearableData.patient_id == patient_id,
+        WearableData.recorded_at >= start,
+        WearableData.recorded_at < end
+    )
+    if wearable_created_after is not None:
+        wearable_query = wearable_query.filter(WearableData.created_at > wearable_created_after)
+    wearable_rows = wearable_query.order_by(WearableData.recorded_at).all()
+
+    log_query = db.session.query(
+        HealthLog.log_date,
+        *[getattr(HealthLog, field) for field in LOG_FIELDS],
+        HealthLog.notes
+    ).filter(
+        HealthLog.patient_id == patient_id,
+        HealthLog.log_date >= start.date(),
+        HealthLog.log_date <= end.date()
+    )
+    if log_created_after is not None:
+        log_query = log_query.filter(HealthLog.created_at > log_created_after)
+    log_rows = log_query.order_by(HealthLog.log_date).all()
+
+    features = {
+        'window': {
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'days': days,
+            'wearable_samples': len(wearable_rows),
+            'health_logs': len(log_rows)
+        },
+        'vitals': {},
+        'logs': {},
+        'daily': [],
+        'recent_logs': []
+    }
+
+    if wearable_rows:
+        t_days = np.fromiter(
+            ((row[0] - EPOCH).total_seconds() for row in wearable_rows), dtype=float, count=len(wearable_rows)
+        ) / SECONDS_PER_DAY
+        X = _to_matrix([row[1:] for row in wearable_rows])
+        stats = summarize_matrix(t_days, X, rolling_days=rolling_days, outlier_z=outlier_z)
+        features['vitals'] = _column_summaries(VITAL_FIELDS, stats, rolling_days)
+
+        daily = stats['daily_mean']
+        columns = {field: VITAL_FIELDS.index(field) for field in ('heart_rate', 'spo2', 'sleep_score')}
+        for offset in range(max(len(daily) - daily_points, 0), len(daily)):
+            day = (EPOCH + timedelta(days=float(stats['day_start']) + offset)).date()
+            point = {'date': day.isoformat()}
+            point.update({field: _round(daily[offset, i], 0) for field, i in columns.items()})
+            if any(point[field] is not None for field in columns):
+                features['daily'].append(point)
+
+    if log_rows:
+        t_days = np.fromiter(
+            (row[0].toordinal() for row in log_rows), dtype=float, count=len(log_rows)
+        )
+        X = _to_matrix([row[1:-1] for row in log_rows])
+        stats = summarize_matrix(t_days, X, rolling_days=rolling_days, outlier_z=outlier_z)
+        features['logs'] = _column_summaries(LOG_FIELDS, stats, rolling_days)
+
+        for row in log_rows[-recent_logs:]:
+            systolic, diastolic = row[1], row[2]
+            features['recent_logs'].append({
+                'date': row[0].isoformat(),
+                'blood_pressure': f'{systolic}/{diastolic}' if systolic and diastolic else None,
+                'glucose': row[3],
+                'notes': row[-1]
+            })
+
+    return features
@@ -0,0 +1,36 @@
+import hashlib
+from datetime import date, datetime
+from flask import request, jsonify, current_app
+
+
+def make_etag(*parts):
+    """Strong ETag value (unquoted) for a version tuple such as (id, count, max(created_at))"""
+    payload = '|'.join(
+        part.isoformat() if isinstance(part, (date, datetime)) else str(part)
+        for part in parts
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]
+
+
+def cache_control():
+    """Cache-Control for per-user clinical data: never shared, revalidated after max-age"""
+    max_age = current_app.config.get('HTTP_CACHE_MAX_AGE', 0)
+    return f'private, max-age={max_age}, must-revalidate' if max_age else 'private, no-cache'
+
+
+def conditional_json(etag, build, status=200):
+    """
+    Answer 304 Not Modified if the client already holds etag, else the JSON from build()
+
+    build is only called when the client's copy is stale, so a repeat poll
+    costs just the version lookup that produced etag.
+    """
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = jsonify(build())
+        response.status_code = status
+
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = cache_control()
+    return response
@@ -0,0 +1,161 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from flask import has_app_context
+from sqlalchemy.dialects import postgresql, sqlite
+from models import db, LLMCacheEntry
+
+
+class LLMCache:
+    """
+    Two-tier cache for chat completion responses
+
+    The in-process tier is an LRU dict with per-entry TTL. The shared tier is
+    the llm_cache table, so workers and processes behind the same database
+    reuse each other's responses. Shared-tier reads and writes run on their
+    own connection and never join the caller's transaction.
+    """
+
+    def __init__(self, ttl=86400, max_entries=1024, shared=True, purge_every=200):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.shared = shared
+        self.purge_every = purge_every
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {
+            'memory_hits': 0,
+            'shared_hits': 0,
+            'misses': 0,
+            'stores': 0,
+            'evictions': 0,
+            'expirations': 0,
+            'shared_errors': 0
+        }
+
+    @staticmethod
+    def make_key(model, messages, **params):
+        """Hash model, whitespace-normalized messages and request parameters"""
+        normalized = [
+            {'role': m['role'], 'content': ' '.join(str(m['content']).split())}
+            for m in messages
+        ]
+        payload = json.dumps(
+            {'model': model, 'messages': normalized, 'params': params},
+            sort_keys=True,
+            separators=(',', ':'),
+            default=str
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def get(self, key):
+        """Return the cached response for key, or None"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self._stats['memory_hits'] += 1
+                    return value
+                del self._entries[key]
+                self._stats['expirations'] += 1
+
+        value = self._shared_get(key)
+        if value is not None:
+            self._count('shared_hits')
+            self._memory_set(key, value)
+            return value
+
+        self._count('misses')
+        return None
+
+    def set(self, key, value, model=None):
+        """Store a response in both tiers"""
+        self._memory_set(key, value)
+        self._shared_set(key, value, model)
+        self._count('stores')
+
+    def _memory_set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def _shared_enabled(self):
+        return self.shared and has_app_context()
+
+    def _shared_get(self, key):
+        if not self._shared_enabled():
+            return None
+        table = LLMCacheEntry.__table__
+        try:
+            with db.engine.connect() as conn:
+                row = conn.execute(
+                    table.select().with_only_columns(table.c.response).where(
+                        table.c.cache_key == key,
+                        table.c.expires_at > datetime.utcnow()
+                    )
+                ).first()
+            return row[0] if row else None
+        except Exception as e:
+            print(f"LLM cache read failed: {e}")
+            self._count('shared_errors')
+            return None
+
+    def _shared_set(self, key, value, model):
+        if not self._shared_enabled():
+            return
+        table = LLMCacheEntry.__table__
+        now = datetime.utcnow()
+        values = {
+            'cache_key': key,
+            'model': model,
+            'response': value,
+            'created_at': now,
+            'expires_at': now + timedelta(seconds=self.ttl)
+        }
+        try:
+            with db.engine.begin() as conn:
+                dialect = conn.dialect.name
+                if dialect in ('postgresql', 'sqlite'):
+                    insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+                    stmt = insert(table).values(**values)
+                    stmt = stmt.on_conflict_do_update(
+                        index_elements=[table.c.cache_key],
+                        set_={k: stmt.excluded[k] for k in ('response', 'created_at', 'expires_at')}
+                    )
+                    conn.execute(stmt)
+                else:
+                    conn.execute(table.delete().where(table.c.cache_key == key))
+                    conn.execute(table.insert().values(**values))
+
+                if self._stats['stores'] % self.purge_every == 0:
+                    conn.execute(table.delete().where(table.c.expires_at <= now))
+        except Exception as e:
+            print(f"LLM cache write failed: {e}")
+            self._count('shared_errors')
+
+    def clear(self):
+        """Drop the in-process tier (the shared tier expires on its own)"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['memory_entries'] = len(self._entries)
+        hits = stats['memory_hits'] + stats['shared_hits']
+        lookups = hits + stats['misses']
+        stats['hit_ratio'] = round(hits / lookups, 4) if lookups else 0.0
+        return stats
@@ -0,0 +1,177 @@
+import bisect
+import threading
+import time
+from flask import g, request
+
+# Seconds; spans fast SQL statements up to slow LLM completions
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.label_names)
+
+    def _header(self):
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+
+
+class Counter(_Metric):
+    """Monotonic counter per label set"""
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def render(self):
+        with self._lock:
+            series = dict(self._series)
+        lines = self._header()
+        for key, value in sorted(series.items()):
+            lines.append(f'{self.name}{_format_labels(self.label_names, key)} {value}')
+        return lines
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram per label set"""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self):
+        with self._lock:
+            series = {key: (list(counts), total) for key, (counts, total) in self._series.items()}
+        lines = self._header()
+        for key, (counts, total) in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                labels = _format_labels(self.label_names, key, ('le', bound))
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.label_names, key)
+            lines.append(f'{self.name}_sum{labels} {total}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class CollectedMetric(_Metric):
+    """Samples read from a callback at scrape time, for stats kept elsewhere"""
+
+    def __init__(self, name, documentation, labels=(), collect=None, kind='gauge'):
+        super().__init__(name, documentation, labels)
+        self.collect = collect
+        self.kind = kind
+
+    def render(self):
+        lines = self._header()
+        try:
+            samples = list(self.collect()) if self.collect else []
+        except Exception as e:
+            print(f"Metrics collector {self.name} failed: {e}")
+            samples = []
+        for labels, value in samples:
+            lines.append(f'{self.name}{_format_labels(self.label_names, self._key(labels))} {value}')
+        return lines
+
+
+class Registry:
+    """Set of metrics rendered together in Prometheus text format"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+http_request_seconds = registry.register(Histogram(
+    'http_request_duration_seconds', 'HTTP request latency by route', ('method', 'route', 'status')
+))
+sql_query_seconds = registry.register(Histogram(
+    'sql_query_duration_seconds', 'SQL statement execution time'
+))
+llm_request_seconds = registry.register(Histogram(
+    'llm_request_duration_seconds', 'OpenAI completion latency by AIHealthAnalyzer method', ('method',)
+))
+llm_requests = registry.register(Counter(
+    'llm_requests_total', 'AIHealthAnalyzer completions by method and outcome (ok, error, cached, rejected)',
+    ('method', 'outcome')
+))
+llm_retries = registry.register(Counter(
+    'llm_retries_total', 'OpenAI request retries after timeouts, connection errors, 429s and 5xx', ('method',)
+))
+llm_hedges = registry.register(Counter(
+    'llm_hedged_requests_total', 'Hedged second OpenAI requests sent, and how many beat the first', ('method', 'outcome')
+))
+analysis_paths = registry.register(Counter(
+    'analysis_path_total', 'Patient analyses by path: rules (pre-screen cleared) or llm', ('path',)
+))
+password_hash_seconds = registry.register(Histogram(
+    'password_hash_duration_seconds', 'bcrypt hash/verify latency including queueing', ('operation',)
+))
+password_hash_rejections = registry.register(Counter(
+    'password_hash_rejected_total', 'bcrypt calls shed because the hashing queue was full', ('operation',)
+))
+
+
+def init_metrics(app):
+    """Time every request into http_request_duration_seconds, labelled by URL rule"""
+    @app.before_request
+    def start_request_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def observe_request(response):
+        started = g.get('request_started')
+        if started is not None:
+            http_request_seconds.observe(
+                time.perf_counter() - started,
+                method=request.method,
+                route=request.url_rule.rule if request.url_rule else 'unmatched',
+                status=response.status_code
+            )
+        return response
@@ -1,9 +1,14 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_bcrypt import Bcrypt
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import declared_attr
+from password_hashing import password_hasher
+from db_routing import RoutingSession
 from datetime import datetime
+import json
 import uuid
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 bcrypt = Bcrypt()
 
 class User(db.Model):
@@ -20,10 +25,13 @@ class User(db.Model):
     is_active = db.Column(db.Boolean, default=True)
     
     def set_password(self, password):
-        self.password_hash = bcrypt.generate_password_hash(password).decode('utf-8')
+        self.password_hash = password_hasher.hash(password)
     
     def check_password(self, password):
-        return bcrypt.check_password_hash(self.password_hash, password)
+        return password_hasher.check(password, self.password_hash)
+    
+    def password_needs_rehash(self):
+        return password_hasher.needs_rehash(self.password_hash)
     
     def to_dict(self):
         return {
@@ -47,7 +55,12 @@ class Patient(db.Model):
     weight_kg = db.Column(db.Numeric(5, 2))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
-    user = db.relationship('User', backref='patient_profile')
+    # Patients are almost always shown with their name, so load the user in the same query
+    user = db.relationship('User', backref='patient_profile', lazy='joined')
+    
+    __table_args__ = (
+        db.Index('idx_patients_created', 'created_at', 'id'),
+    )
     
     def to_dict(self):
         return {
@@ -68,7 +81,7 @@ class Doctor(db.Model):
     years_of_experience = db.Column(db.Integer)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
-    user = db.relationship('User', backref='doctor_profile')
+    user = db.relationship('User', backref='doctor_profile', lazy='joined')
     
     def to_dict(self):
         return {
@@ -79,6 +92,171 @@ class Doctor(db.Model):
             'years_of_experience': self.years_of_experience
         }
 
+class WearableData(db.Model):
+    """Smart ring samples uploaded by a patient's wearable device"""
+    __tablename__ = 'wearable_data'
+    
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    patient_id = db.Column(db.String(36), db.ForeignKey('patients.id'), nullable=False)
+    recorded_at = db.Column(db.DateTime, nullable=False)
+    heart_rate = db.Column(db.Integer)
+    heart_rate_variability = db.Column(db.Integer)
+    spo2 = db.Column(db.Integer)
+    temperature = db.Column(db.Numeric(4, 2))
+    respiratory_rate = db.Column(db.Integer)
+    steps = db.Column(db.Integer)
+    calories_burned = db.Column(db.Integer)
+    sleep_duration_minutes = db.Column(db.Integer)
+    deep_sleep_minutes = db.Column(db.Integer)
+    rem_sleep_minutes = db.Column(db.Integer)
+    sleep_score = db.Column(db.Integer)
+    activity_level = db.Column(db.Integer)
+    stress_score = db.Column(db.Integer)
+    readiness_score = db.Column(db.Integer)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('idx_wearable_patient_time', 'patient_id', recorded_at.desc()),
+        db.Index('idx_wearable_patient_created', 'patient_id', 'created_at'),
+    )
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'patient_id': self.patient_id,
+            'recorded_at': self.recorded_at.isoformat() if self.recorded_at else None,
+            'heart_rate': self.heart_rate,
+            'heart_rate_variability': self.heart_rate_variability,
+            'spo2': self.spo2,
+            'temperature': float(self.temperature) if self.temperature is not None else None,
+            'respiratory_rate': self.respiratory_rate,
+            'steps': self.steps,
+            'calories_burned': self.calories_burned,
+            'sleep_duration_minutes': self.sleep_duration_minutes,
+            'deep_sleep_minutes': self.deep_sleep_minutes,
+            'rem_sleep_minutes': self.rem_sleep_minutes,
+            'sleep_score': self.sleep_score,
+            'activity_level': self.activity_level,
+            'stress_score': self.stress_score,
+            'readiness_score': self.readiness_score
+        }
+
+class WearableRollupMixin:
+    """Shared columns for hourly/daily wearable aggregates
+
+    Sums and counts are stored instead of means so new samples can be merged
+    into an existing bucket without re-reading the raw rows.
+    """
+    
+    @declared_attr
+    def patient_id(cls):
+        return db.Column(db.String(36), db.ForeignKey('patients.id'), primary_key=True)
+    
+    bucket_start = db.Column(db.DateTime, primary_key=True)
+    sample_count = db.Column(db.Integer, nullable=False, default=0)
+    heart_rate_sum = db.Column(db.BigInteger, nullable=False, default=0)
+    heart_rate_count = db.Column(db.Integer, nullable=False, default=0)
+    heart_rate_min = db.Column(db.Integer)
+    heart_rate_max = db.Column(db.Integer)
+    spo2_sum = db.Column(db.BigInteger, nullable=False, default=0)
+    spo2_count = db.Column(db.Integer, nullable=False, default=0)
+    spo2_min = db.Column(db.Integer)
+    spo2_max = db.Column(db.Integer)
+    sleep_score_sum = db.Column(db.BigInteger, nullable=False, default=0)
+    sleep_score_count = db.Column(db.Integer, nullable=False, default=0)
+    sleep_score_min = db.Column(db.Integer)
+    sleep_score_max = db.Column(db.Integer)
+    hrv_sum = db.Column(db.BigInteger, nullable=False, default=0)
+    hrv_count = db.Column(db.Integer, nullable=False, default=0)
+    steps_sum = db.Column(db.BigInteger, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    @staticmethod
+    def _mean(total, count):
+        return round(total / count, 1) if count else None
+    
+    def to_dict(self):
+        return {
+            'patient_id': self.patient_id,
+            'bucket_start': self.bucket_start.isoformat() if self.bucket_start else None,
+            'samples': self.sample_count,
+            'heart_rate': {
+                'mean': self._mean(self.heart_rate_sum, self.heart_rate_count),
+                'min': self.heart_rate_min,
+                'max': self.heart_rate_max
+            },
+            'spo2': {
+                'mean': self._mean(self.spo2_sum, self.spo2_count),
+                'min': self.spo2_min,
+                'max': self.spo2_max
+            },
+            'sleep_score': {
+                'mean': self._mean(self.sleep_score_sum, self.sleep_score_count),
+                'min': self.sleep_score_min,
+                'max': self.sleep_score_max
+            },
+            'heart_rate_variability_mean': self._mean(self.hrv_sum, self.hrv_count),
+            'steps': self.steps_sum
+        }
+
+class WearableRollupHourly(WearableRollupMixin, db.Model):
+    """Hourly wearable aggregates per patient"""
+    __tablename__ = 'wearable_rollups_hourly'
+
+class WearableRollupDaily(WearableRollupMixin, db.Model):
+    """Daily wearable aggregates per patient"""
+    __tablename__ = 'wearable_rollups_daily'
+
+class WearableRollupWatermark(db.Model):
+    """Per-patient high-water mark of wearable_data rows already rolled up"""
+    __tablename__ = 'wearable_rollup_watermarks'
+    
+    patient_id = db.Column(db.String(36), db.ForeignKey('patients.id'), primary_key=True)
+    last_created_at = db.Column(db.DateTime)
+    last_recorded_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'patient_id': self.patient_id,
+            'last_created_at': self.last_created_at.isoformat() if self.last_created_at else None,
+            'last_recorded_at': self.last_recorded_at.isoformat() if self.last_recorded_at else None
+        }
+
+class HealthLog(db.Model):
+    """Manual health log entries reported by the patient"""
+    __tablename__ = 'health_logs'
+    
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    patient_id = db.Column(db.String(36), db.ForeignKey('patients.id'), nullable=False)
+    log_date = db.Column(db.Date, nullable=False)
+    blood_pressure_systolic = db.Column(db.Integer)
+    blood_pressure_diastolic = db.Column(db.Integer)
+    glucose_mg_dl = db.Column(db.Integer)
+    weight_kg = db.Column(db.Numeric(5, 2))
+    symptoms = db.Column(db.JSON)
+    symptom_severity = db.Column(db.Integer)
+    notes = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('idx_health_logs_patient_date', 'patient_id', log_date.desc()),
+    )
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'patient_id': self.patient_id,
+            'log_date': self.log_date.isoformat() if self.log_date else None,
+            'blood_pressure_systolic': self.blood_pressure_systolic,
+            'blood_pressure_diastolic': self.blood_pressure_diastolic,
+            'glucose_mg_dl': self.glucose_mg_dl,
+            'weight_kg': float(self.weight_kg) if self.weight_kg is not None else None,
+            'symptoms': self.symptoms if self.symptoms else [],
+            'symptom_severity': self.symptom_severity,
+            'notes': self.notes
+        }
+
 class AIAnalyses(db.Model):
     """AI Analysis model"""
     __tablename__ = 'ai_analyses'
@@ -87,13 +265,25 @@ class AIAnalyses(db.Model):
     patient_id = db.Column(db.String(36), db.ForeignKey('patients.id'), nullable=False)
     analysis_timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     findings = db.Column(db.Text)
-    concerns = db.Column(db.Text)  # Store as JSON string or comma-separated
+    concerns = db.Column(db.JSON().with_variant(postgresql.ARRAY(db.Text), 'postgresql'))  # TEXT[] in schema.sql
     risk_level = db.Column(db.String(20))
     recommendations = db.Column(db.Text)
     confidence_score = db.Column(db.Numeric(3, 2))
     status = db.Column(db.String(20), default='pending')
+    job_status = db.Column(db.String(20))  # queued/running/completed/failed for async jobs
+    job_error = db.Column(db.Text)
+    job_owner = db.Column(db.String(128))  # ai_jobs.process_token() of the process running the job
+    analysis_path = db.Column(db.String(10))  # 'rules' when the pre-screen cleared the patient, else 'llm'
+    input_fingerprint = db.Column(db.String(64))  # features.data_fingerprint of the data analyzed
+    data_analyzed = db.Column(db.JSON)  # Snapshot, content hash and mode (full/incremental) of the inputs
+    reused_analysis_id = db.Column(db.String(36), db.ForeignKey('ai_analyses.id'))  # Job answered by an existing analysis
     
     patient = db.relationship('Patient', backref='ai_analyses')
+    reused_analysis = db.relationship('AIAnalyses', remote_side=[id])
+    
+    __table_args__ = (
+        db.Index('idx_ai_analyses_fingerprint', 'patient_id', 'input_fingerprint'),
+    )
     
     def to_dict(self):
         return {
@@ -105,7 +295,71 @@ class AIAnalyses(db.Model):
             'risk_level': self.risk_level,
             'recommendations': self.recommendations,
             'confidence_score': float(self.confidence_score) if self.confidence_score else 0,
-            'status': self.status
+            'status': self.status,
+            'job_status': self.job_status,
+            'job_error': self.job_error,
+            'analysis_path': self.analysis_path,
+            'data_analyzed': self.data_analyzed,
+            'reused_analysis_id': self.reused_analysis_id
+        }
+
+class CollaborativeDiscussion(db.Model):
+    """Doctor-AI discussion about a patient"""
+    __tablename__ = 'collaborative_discussions'
+    
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    patient_id = db.Column(db.String(36), db.ForeignKey('patients.id'), nullable=False)
+    doctor_id = db.Column(db.String(36), db.ForeignKey('doctors.id'))
+    ai_analysis_id = db.Column(db.String(36), db.ForeignKey('ai_analyses.id'))
+    topic = db.Column(db.String(255))
+    status = db.Column(db.String(30), default='ongoing')
+    summary = db.Column(db.Text)  # Rolling summary of turns that left the context window
+    summarized_through = db.Column(db.Integer, default=0)  # Last message_order folded into summary
+    started_at = db.Column(db.DateTime, default=datetime.utcnow)
+    concluded_at = db.Column(db.DateTime)
+    
+    patient = db.relationship('Patient', backref='discussions')
+    doctor = db.relationship('Doctor', backref='discussions')
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'patient_id': self.patient_id,
+            'doctor_id': self.doctor_id,
+            'ai_analysis_id': self.ai_analysis_id,
+            'topic': self.topic,
+            'status': self.status,
+            'summary': self.summary,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'concluded_at': self.concluded_at.isoformat() if self.concluded_at else None
+        }
+
+class DiscussionMessage(db.Model):
+    """Single turn of a collaborative discussion"""
+    __tablename__ = 'discussion_messages'
+    
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    discussion_id = db.Column(db.String(36), db.ForeignKey('collaborative_discussions.id'), nullable=False)
+    speaker = db.Column(db.String(10), nullable=False)
+    message_order = db.Column(db.Integer, nullable=False)
+    content = db.Column(db.Text, nullable=False)
+    message_type = db.Column(db.String(30))
+    structured_data = db.Column(db.JSON)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('idx_messages_discussion', 'discussion_id', 'message_order'),
+    )
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'discussion_id': self.discussion_id,
+            'speaker': self.speaker,
+            'message_order': self.message_order,
+            'content': self.content,
+            'message_type': self.message_type,
+            'created_at': self.created_at.isoformat() if self.created_at else None
         }
 
 class FinalDecisions(db.Model):
@@ -131,6 +385,11 @@ class FinalDecisions(db.Model):
     patient = db.relationship('Patient', backref='decisions')
     doctor = db.relationship('Doctor', backref='decisions')
     
+    __table_args__ = (
+        db.Index('idx_decisions_patient', 'patient_id', created_at.desc()),
+        db.Index('idx_decisions_doctor', 'doctor_id', created_at.desc()),
+    )
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -147,4 +406,75 @@ class FinalDecisions(db.Model):
             'doctor_contributions': self.doctor_contributions if self.doctor_contributions else [],
             'decision_confidence': float(self.decision_confidence) if self.decision_confidence else 0,
             'created_at': self.created_at.isoformat() if self.created_at else None
-        }
\ No newline at end of file
+        }
+    
+    @staticmethod
+    def row_to_dict(row):
+        """
+        to_dict for a column-tuple row of final_decisions
+        
+        Used by listings that select columns instead of hydrating ORM objects;
+        Decimal and date values are left for the JSON provider to encode.
+        """
+        return {
+            'id': row.id,
+            'discussion_id': row.discussion_id,
+            'patient_id': row.patient_id,
+            'doctor_id': row.doctor_id,
+            'treatment_plan': row.treatment_plan,
+            'medications': row.medications,
+            'lifestyle_recommendations': row.lifestyle_recommendations,
+            'follow_up_date': row.follow_up_date,
+            'ai_contribution_percent': row.ai_contribution_percent or 0,
+            'doctor_contribution_percent': row.doctor_contribution_percent or 0,
+            'ai_contributions': row.ai_contributions or [],
+            'doctor_contributions': row.doctor_contributions or [],
+            'decision_confidence': row.decision_confidence or 0,
+            'created_at': row.created_at
+        }
+
+class LLMCacheEntry(db.Model):
+    """Shared tier of the LLM response cache"""
+    __tablename__ = 'llm_cache'
+    
+    cache_key = db.Column(db.String(64), primary_key=True)
+    model = db.Column(db.String(50))
+    response = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False)
+    
+    __table_args__ = (
+        db.Index('idx_llm_cache_expires', 'expires_at'),
+    )
+
+class PatientRiskScore(db.Model):
+    """Cohort-wide risk score written by the nightly cohort_scoring job"""
+    __tablename__ = 'patient_risk_scores'
+    
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    patient_id = db.Column(db.String(36), db.ForeignKey('patients.id'), nullable=False)
+    scored_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    window_days = db.Column(db.Integer)
+    wearable_samples = db.Column(db.Integer, default=0)
+    health_logs = db.Column(db.Integer, default=0)
+    score = db.Column(db.Numeric(7, 3))
+    risk_level = db.Column(db.String(20))
+    flags = db.Column(db.Text)  # JSON list of out-of-range fields, worst first
+    
+    __table_args__ = (
+        db.Index('idx_risk_scores_patient', 'patient_id', scored_at.desc()),
+        db.Index('idx_risk_scores_run', 'scored_at', score.desc()),
+    )
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'patient_id': self.patient_id,
+            'scored_at': self.scored_at.isoformat() if self.scored_at else None,
+            'window_days': self.window_days,
+            'wearable_samples': self.wearable_samples,
+            'health_logs': self.health_logs,
+            'score': float(self.score) if self.score is not None else None,
+            'risk_level': self.risk_level,
+            'flags': json.loads(self.flags) if self.flags else []
+        }
@@ -0,0 +1,67 @@
+import base64
+import json
+from datetime import date, datetime
+from sqlalchemy import tuple_
+from sqlalchemy.types import DateTime
+
+
+def encode_cursor(*values):
+    """Opaque, URL-safe cursor for the sort key of the last row on a page"""
+    payload = json.dumps(
+        [v.isoformat() if isinstance(v, (date, datetime)) else v for v in values],
+        separators=(',', ':')
+    )
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; raises ValueError for malformed cursors"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except Exception:
+        raise ValueError('Invalid cursor')
+    if not isinstance(values, list):
+        raise ValueError('Invalid cursor')
+    return values
+
+
+def keyset_page(query, sort_columns, cursor=None, limit=50):
+    """
+    Apply keyset pagination to a query ordered by sort_columns (ascending)
+
+    The last column must be unique (normally the primary key) so the order
+    is total. Seeking with a row-value comparison lets the database start
+    the scan at the cursor using the matching composite index instead of
+    counting past OFFSET rows.
+
+    Returns:
+        Tuple of (rows, next_cursor or None)
+    """
+    if cursor:
+        values = decode_cursor(cursor)
+        if len(values) != len(sort_columns):
+            raise ValueError('Invalid cursor')
+        values = [
+            datetime.fromisoformat(v) if isinstance(col.type, DateTime) and v is not None else v
+            for col, v in zip(sort_columns, values)
+        ]
+        query = query.filter(tuple_(*sort_columns) > tuple_(*values))
+
+    rows = query.order_by(*sort_columns).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]._mapping
+        next_cursor = encode_cursor(*[last[col.key] for col in sort_columns])
+    return rows, next_cursor
+
+
+def serialize_row(row):
+    """Dict of a column-tuple row, without hydrating an ORM object
+
+    Values are passed through as-is; the app's JSON provider encodes
+    Decimal and date/datetime values.
+    """
+    return row._asdict()
@@ -0,0 +1,175 @@
+import multiprocessing
+import threading
+import time
+import bcrypt
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from config import Config
+from metrics import password_hash_seconds, password_hash_rejections
+
+BCRYPT_MAX_BYTES = 72  # bcrypt only looks at the first 72 bytes of a password
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when too many hash/verify calls are already queued; callers should answer 503"""
+
+
+def _secret(password):
+    return password.encode('utf-8')[:BCRYPT_MAX_BYTES]
+
+
+def _hash_password(password, rounds):
+    return bcrypt.hashpw(_secret(password), bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _hash_passwords(passwords, rounds):
+    return [_hash_password(password, rounds) for password in passwords]
+
+
+def _check_password(password, password_hash):
+    try:
+        return bcrypt.checkpw(_secret(password), password_hash.encode('utf-8'))
+    except ValueError:  # Malformed stored hash
+        return False
+
+
+def hash_rounds(password_hash):
+    """Cost factor of a stored bcrypt hash ($2b$<rounds>$...), or None if unreadable"""
+    try:
+        return int(password_hash.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+class PasswordHasher:
+    """
+    bcrypt hashing and verification on a dedicated process pool
+
+    bcrypt holds the CPU for the whole cost factor, so running it inline lets
+    a login burst occupy every request thread. Work is sent to a small pool
+    of processes instead, and at most max_pending calls may be queued or
+    running; beyond that PasswordHasherBusy is raised immediately so the
+    request can be shed with 503 rather than waiting behind the queue.
+    A slot is held until the work has actually finished, so calls that time
+    out cannot let the backlog grow past max_pending. Workers are started
+    with spawn, never by forking the multi-threaded server process.
+    With workers=0 hashing runs inline in the calling thread.
+    """
+
+    def __init__(self, rounds=12, workers=2, max_pending=32, timeout=10):
+        self.rounds = rounds
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+            return self._executor
+
+    def _submit(self, operation, calls):
+        """
+        Take one queue slot and submit (func, *args) calls to the pool
+
+        The slot is released only once every call has finished or been
+        cancelled, not when the caller stops waiting.
+        """
+        if not self._slots.acquire(blocking=False):
+            password_hash_rejections.inc(operation=operation)
+            raise PasswordHasherBusy('Password hashing queue is full')
+
+        futures = []
+        error = None
+        try:
+            for func, *args in calls:
+                futures.append(self._pool().submit(func, *args))
+        except Exception as e:  # e.g. a broken pool; already submitted calls are cancelled
+            error = e
+            for future in futures:
+                future.cancel()
+
+        if not futures:
+            self._slots.release()
+        else:
+            remaining = [len(futures)]
+            lock = threading.Lock()
+
+            def done(_):
+                with lock:
+                    remaining[0] -= 1
+                    last = remaining[0] == 0
+                if last:
+                    self._slots.release()
+
+            for future in futures:
+                future.add_done_callback(done)
+
+        if error is not None:
+            raise error
+        return futures
+
+    def _wait(self, futures, timeout):
+        """Results of futures in order; on timeout the ones not yet started are cancelled"""
+        deadline = time.monotonic() + timeout
+        try:
+            return [future.result(timeout=max(deadline - time.monotonic(), 0)) for future in futures]
+        except FutureTimeout:
+            for future in futures:
+                future.cancel()
+            raise
+
+    def _run(self, operation, func, *args):
+        if not self.workers:
+            started = time.perf_counter()
+            try:
+                return func(*args)
+            finally:
+                password_hash_seconds.observe(time.perf_counter() - started, operation=operation)
+
+        futures = self._submit(operation, [(func, *args)])
+        started = time.perf_counter()
+        try:
+            return self._wait(futures, self.timeout)[0]
+        finally:
+            password_hash_seconds.observe(time.perf_counter() - started, operation=operation)
+
+    def hash(self, password):
+        return self._run('hash', _hash_password, password, self.rounds)
+
+    def hash_many(self, passwords):
+        """Hash a batch of passwords spread across the whole pool (the batch takes one queue slot)"""
+        passwords = list(passwords)
+        if not self.workers:
+            return _hash_passwords(passwords, self.rounds)
+        if not passwords:
+            return []
+        per_worker = -(-len(passwords) // self.workers)
+        chunksize = max(per_worker // 4, 1)
+        futures = self._submit('hash_many', [
+            (_hash_passwords, passwords[offset:offset + chunksize], self.rounds)
+            for offset in range(0, len(passwords), chunksize)
+        ])
+        chunks = self._wait(futures, self.timeout * per_worker)
+        return [password_hash for chunk in chunks for password_hash in chunk]
+
+    def check(self, password, password_hash):
+        if not password_hash:
+            return False
+        return self._run('check', _check_password, password, password_hash)
+
+    def needs_rehash(self, password_hash):
+        """True when a stored hash was made with a different cost factor than configured"""
+        return hash_rounds(password_hash) != self.rounds
+
+
+# Shared hasher used by User.set_password/check_password
+password_hasher = PasswordHasher(
+    rounds=Config.BCRYPT_LOG_ROUNDS,
+    workers=Config.PASSWORD_HASH_WORKERS,
+    max_pending=Config.PASSWORD_HASH_MAX_PENDING
+)
@@ -0,0 +1,162 @@
+import json
+import threading
+from functools import lru_cache
+
+try:
+    import tiktoken
+except ImportError:  # Fall back to a character-based estimate
+    tiktoken = None
+
+MESSAGE_OVERHEAD_TOKENS = 4  # Per-message framing tokens added by the chat format
+
+
+@lru_cache(maxsize=8)
+def _encoder(model):
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding('o200k_base')
+    except Exception as e:  # Encoding files are downloaded on first use; set TIKTOKEN_CACHE_DIR on offline hosts
+        print(f"tiktoken unavailable, estimating token counts: {e}")
+        return None
+
+
+def count_tokens(text, model='gpt-4o-mini'):
+    """Number of tokens in text (about 4 characters per token without tiktoken)"""
+    if not text:
+        return 0
+    encoder = _encoder(model)
+    if encoder is None:
+        return (len(text) + 3) // 4
+    return len(encoder.encode(text))
+
+
+def count_message_tokens(messages, model='gpt-4o-mini'):
+    """Approximate prompt tokens for a list of chat messages"""
+    return sum(count_tokens(m['content'], model) + MESSAGE_OVERHEAD_TOKENS for m in messages) + 2
+
+
+def compact_json(value):
+    """JSON without indentation or spaces after separators"""
+    return json.dumps(value, separators=(',', ':'), ensure_ascii=False, default=str)
+
+
+class PromptBuilder:
+    """
+    Assemble a prompt from sections that shrink to fit a token budget
+
+    Each section renders a list of items. When the whole prompt is over
+    budget, the lowest-priority sections give up items first (oldest items
+    by default) down to their min_items, and optional sections are dropped
+    entirely as a last resort. Required sections are never trimmed.
+    """
+
+    def __init__(self, budget, model='gpt-4o-mini'):
+        self.budget = budget
+        self.model = model
+        self._sections = []
+
+    def add(self, name, render, items=None, priority=0, min_items=0, required=False, trim_from='start'):
+        """
+        Add a section
+
+        Args:
+            name: Section name used in the build report
+            render: Callable(items) -> text; called with None for item-less sections
+            items: Optional list of items the section can be trimmed by
+            priority: Higher priority sections are trimmed last
+            min_items: Items to keep before the section is dropped
+            required: Never trim or drop this section
+            trim_from: 'start' drops the oldest items first, 'end' the last ones
+        """
+        self._sections.append({
+            'name': name,
+            'render': render,
+            'items': list(items) if items is not None else None,
+            'priority': priority,
+            'min_items': min_items,
+            'required': required,
+            'trim_from': trim_from,
+            'dropped': False,
+            'trimmed': 0,
+        })
+        return self
+
+    def _render(self, section):
+        if section['dropped']:
+            return ''
+        return section['render'](section['items'])
+
+    def _total(self, rendered):
+        return count_tokens(''.join(rendered), self.model)
+
+    def build(self):
+        """
+        Returns:
+            Tuple of (prompt text, report dict with token count, budget and trimmed sections)
+        """
+        rendered = [self._render(section) for section in self._sections]
+        tokens = self._total(rendered)
+
+        candidates = sorted(
+            (i for i, s in enumerate(self._sections) if not s['required']),
+            key=lambda i: self._sections[i]['priority']
+        )
+
+        for i in candidates:
+            if tokens <= self.budget:
+                break
+            section = self._sections[i]
+            items = section['items']
+
+            while items is not None and len(items) > section['min_items'] and tokens > self.budget:
+                if section['trim_from'] == 'start':
+                    items.pop(0)
+                else:
+                    items.pop()
+                section['trimmed'] += 1
+                rendered[i] = self._render(section)
+                tokens = self._total(rendered)
+
+            if tokens > self.budget:
+                section['dropped'] = True
+                rendered[i] = ''
+                tokens = self._total(rendered)
+
+        report = {
+            'prompt_tokens': tokens,
+            'budget': self.budget,
+            'over_budget': tokens > self.budget,
+            'trimmed': {
+                s['name']: ('dropped' if s['dropped'] else s['trimmed'])
+                for s in self._sections if s['dropped'] or s['trimmed']
+            }
+        }
+        return ''.join(rendered), report
+
+
+class UsageTracker:
+    """Thread-safe per-method token and call counters"""
+
+    FIELDS = ('calls', 'cached_calls', 'prompt_tokens', 'completion_tokens')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_method = {}
+
+    def record(self, method, prompt_tokens=0, completion_tokens=0, cached=False):
+        with self._lock:
+            stats = self._by_method.setdefault(method, dict.fromkeys(self.FIELDS, 0))
+            stats['calls'] += 1
+            if cached:
+                stats['cached_calls'] += 1
+            stats['prompt_tokens'] += prompt_tokens or 0
+            stats['completion_tokens'] += completion_tokens or 0
+
+    def snapshot(self):
+        with self._lock:
+            by_method = {method: dict(stats) for method, stats in self._by_method.items()}
+        totals = {field: sum(stats[field] for stats in by_method.values()) for field in self.FIELDS}
+        return {'totals': totals, 'by_method': by_method}
@@ -0,0 +1,80 @@
+import time
+from flask import g, request, current_app, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from metrics import sql_query_seconds
+
+
+class QueryBudgetExceeded(Exception):
+    """Raised in strict mode when a request runs more SQL statements than its budget"""
+
+
+def query_budget(limit):
+    """Override the default per-request query budget for one view"""
+    def decorator(view):
+        view._query_budget = limit
+        return view
+    return decorator
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get('query_started')
+    if not started:
+        return
+    elapsed = time.perf_counter() - started.pop()
+    sql_query_seconds.observe(elapsed)
+    if not has_request_context():
+        return
+    stats = g.get('query_stats')
+    if stats is not None:
+        stats['count'] += 1
+        stats['seconds'] += elapsed
+
+
+def current_stats():
+    """Query count and SQL time so far in the current request"""
+    stats = g.get('query_stats') if has_request_context() else None
+    return dict(stats) if stats else {'count': 0, 'seconds': 0.0}
+
+
+def _endpoint_budget():
+    view = current_app.view_functions.get(request.endpoint)
+    return getattr(view, '_query_budget', current_app.config.get('QUERY_BUDGET', 0))
+
+
+def init_query_stats(app):
+    """
+    Count SQL statements and time spent in them for every request
+
+    Totals are returned in X-Query-Count / X-Query-Time-Ms headers. In debug
+    mode a request over its query budget (QUERY_BUDGET, or @query_budget on
+    the view) logs a warning, or fails with QueryBudgetExceeded when
+    QUERY_BUDGET_STRICT is set, so N+1 loads show up during development.
+    Statements run outside a request (background jobs) only feed the
+    sql_query_duration_seconds metric.
+    """
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+    @app.before_request
+    def start_query_stats():
+        g.query_stats = {'count': 0, 'seconds': 0.0}
+
+    @app.after_request
+    def report_query_stats(response):
+        stats = current_stats()
+        response.headers['X-Query-Count'] = str(stats['count'])
+        response.headers['X-Query-Time-Ms'] = f"{stats['seconds'] * 1000:.1f}"
+
+        budget = _endpoint_budget() if app.debug else 0
+        if budget and stats['count'] > budget:
+            message = f"{request.method} {request.path} ran {stats['count']} queries (budget {budget})"
+            if app.config.get('QUERY_BUDGET_STRICT'):
+                raise QueryBudgetExceeded(message)
+            print(f"Query budget exceeded: {message}")
+        return response
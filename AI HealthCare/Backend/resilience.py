@@ -0,0 +1,256 @@
+import asyncio
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling the provider while the circuit breaker is open"""
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when a call's deadline leaves no time for another attempt"""
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker
+
+    After failure_threshold failures in a row the breaker opens and calls
+    fail fast with CircuitOpenError. Once reset_timeout seconds have passed
+    one probe call is let through (half-open): success closes the breaker,
+    failure opens it again for another reset_timeout.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.transitions = {self.OPEN: 0, self.HALF_OPEN: 0, self.CLOSED: 0}
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def _transition(self, state):
+        if state != self.state:
+            self.state = state
+            self.transitions[state] += 1
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may go to the provider now"""
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    raise CircuitOpenError(f'Circuit open after {self.failures} consecutive failures')
+                self._transition(self.HALF_OPEN)
+            if self.state == self.HALF_OPEN:
+                if self._probe_in_flight:
+                    raise CircuitOpenError('Circuit half-open, probe call in flight')
+                self._probe_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._probe_in_flight = False
+            self._transition(self.CLOSED)
+
+    def release(self):
+        """Forget a call that was abandoned without an outcome, freeing the half-open probe"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probe_in_flight = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                self._transition(self.OPEN)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'state': self.state,
+                'consecutive_failures': self.failures,
+                'open_for_seconds': round(time.monotonic() - self.opened_at, 1)
+                                    if self.state == self.OPEN else 0,
+                'transitions': dict(self.transitions)
+            }
+
+
+class CallPolicy:
+    """
+    Deadline, bounded retries with jitter, hedging and a circuit breaker for one call
+
+    call(func) invokes func(timeout) with the time left before the deadline.
+    Exceptions of the retryable types count as provider failures: they trip
+    the breaker and are retried after a full-jitter exponential backoff
+    while retries and time remain. Other exceptions are raised at once.
+    With hedge_after set, an attempt still running after that many seconds
+    gets a second identical request and the first to succeed wins; the
+    slower one finishes in the background and is ignored. call_async is the
+    same policy for coroutines, where the slower request is cancelled.
+    """
+
+    def __init__(self, timeout=30, max_retries=2, backoff=0.5, backoff_max=8, hedge_after=0,
+                 breaker=None, retryable=(Exception,), hedge_workers=16):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.hedge_after = hedge_after
+        self.breaker = breaker
+        self.retryable = tuple(retryable)
+        self.hedge_workers = hedge_workers
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.hedge_workers, thread_name_prefix='hedge')
+            return self._executor
+
+    def _attempt(self, func, deadline, hedge, on_hedge):
+        remaining = deadline - time.monotonic()
+        if not hedge or not self.hedge_after or self.hedge_after >= remaining:
+            return func(remaining)
+
+        pool = self._pool()
+        primary = pool.submit(func, remaining)
+        done, _ = wait([primary], timeout=self.hedge_after)
+        if done:
+            return primary.result()
+
+        if on_hedge:
+            on_hedge('sent')
+        hedged = pool.submit(func, max(deadline - time.monotonic(), 0.001))
+        pending = {primary, hedged}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result = future.result()
+                except self.retryable as e:
+                    error = e
+                    continue
+                if future is hedged and on_hedge:
+                    on_hedge('won')
+                return result
+        raise error
+
+    def call(self, func, timeout=None, hedge=True, on_retry=None, on_hedge=None):
+        """
+        Args:
+            func: Callable(timeout seconds) making one request
+            timeout: Overall deadline for all attempts, defaults to self.timeout
+            hedge: Allow a hedged second request (off for streams)
+            on_retry / on_hedge: Optional callbacks for metrics
+
+        Returns:
+            The first successful func result
+        """
+        deadline = time.monotonic() + (timeout or self.timeout)
+        attempt = 0
+        while True:
+            if time.monotonic() >= deadline:
+                raise DeadlineExceeded('Deadline reached before the call could be attempted')
+            if self.breaker is not None:
+                self.breaker.before_call()
+
+            try:
+                result = self._attempt(func, deadline, hedge, on_hedge)
+            except self.retryable:
+                if self.breaker is not None:
+                    self.breaker.record_failure()
+                attempt += 1
+                delay = random.uniform(0, min(self.backoff_max, self.backoff * 2 ** (attempt - 1)))
+                if attempt > self.max_retries or time.monotonic() + delay >= deadline:
+                    raise
+                if on_retry:
+                    on_retry()
+                time.sleep(delay)
+                continue
+            except Exception:
+                # The provider answered (e.g. 400); it is not unhealthy
+                if self.breaker is not None:
+                    self.breaker.record_success()
+                raise
+
+            if self.breaker is not None:
+                self.breaker.record_success()
+            return result
+
+    async def _attempt_async(self, func, deadline, hedge, on_hedge):
+        remaining = deadline - time.monotonic()
+        if not hedge or not self.hedge_after or self.hedge_after >= remaining:
+            return await func(remaining)
+
+        primary = asyncio.ensure_future(func(remaining))
+        done, _ = await asyncio.wait({primary}, timeout=self.hedge_after)
+        if done:
+            return primary.result()
+
+        if on_hedge:
+            on_hedge('sent')
+        hedged = asyncio.ensure_future(func(max(deadline - time.monotonic(), 0.001)))
+        pending = {primary, hedged}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        result = future.result()
+                    except self.retryable as e:
+                        error = e
+                        continue
+                    if future is hedged and on_hedge:
+                        on_hedge('won')
+                    return result
+            raise error
+        finally:
+            for future in pending:
+                future.cancel()
+
+    async def call_async(self, func, timeout=None, hedge=True, on_retry=None, on_hedge=None):
+        """call() for an async func(timeout); backoff sleeps do not block the event loop"""
+        deadline = time.monotonic() + (timeout or self.timeout)
+        attempt = 0
+        while True:
+            if time.monotonic() >= deadline:
+                raise DeadlineExceeded('Deadline reached before the call could be attempted')
+            if self.breaker is not None:
+                self.breaker.before_call()
+
+            try:
+                result = await self._attempt_async(func, deadline, hedge, on_hedge)
+            except self.retryable:
+                if self.breaker is not None:
+                    self.breaker.record_failure()
+                attempt += 1
+                delay = random.uniform(0, min(self.backoff_max, self.backoff * 2 ** (attempt - 1)))
+                if attempt > self.max_retries or time.monotonic() + delay >= deadline:
+                    raise
+                if on_retry:
+                    on_retry()
+                await asyncio.sleep(delay)
+                continue
+            except asyncio.CancelledError:
+                if self.breaker is not None:
+                    self.breaker.release()
+                raise
+            except Exception:
+                if self.breaker is not None:
+                    self.breaker.record_success()
+                raise
+
+            if self.breaker is not None:
+                self.breaker.record_success()
+            return result
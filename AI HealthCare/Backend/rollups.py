@@ -0,0 +1,200 @@
+from datetime import datetime
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from models import (
+    db, WearableData, WearableRollupHourly, WearableRollupDaily, WearableRollupWatermark
+)
+
+ROLLUP_MODELS = {
+    'hour': WearableRollupHourly,
+    'day': WearableRollupDaily
+}
+
+# (rollup column prefix, wearable_data column) pairs aggregated as sum/count/min/max
+MEASURES = (
+    ('heart_rate', WearableData.heart_rate),
+    ('spo2', WearableData.spo2),
+    ('sleep_score', WearableData.sleep_score),
+)
+
+
+def _bucket_expr(granularity):
+    """SQL expression truncating recorded_at to the start of its hour/day"""
+    if db.engine.dialect.name == 'sqlite':
+        fmt = '%Y-%m-%d %H:00:00' if granularity == 'hour' else '%Y-%m-%d 00:00:00'
+        return func.strftime(fmt, WearableData.recorded_at)
+    return func.date_trunc(granularity, WearableData.recorded_at)
+
+
+def db_now():
+    """
+    Database wall-clock time (UTC) at statement execution
+
+    created_at is stamped by the database rather than the app host, so clock
+    skew between app hosts cannot order rows behind a watermark. Postgres'
+    now() is frozen at transaction start, so clock_timestamp() is used: rows
+    are stamped after the watermark locks are acquired, not before.
+    """
+    if db.engine.dialect.name == 'sqlite':
+        return func.strftime('%Y-%m-%d %H:%M:%f', 'now')
+    return func.timezone('UTC', func.clock_timestamp())
+
+
+def lock_watermarks(patient_ids):
+    """
+    Lock (creating if needed) the watermark rows for these patients
+
+    Ingestion takes these row locks before inserting samples and holds them
+    until commit, so for any one patient the created_at values of committed
+    wearable_data rows only ever move forward past the watermark. Locks are
+    taken in sorted order to keep concurrent uploads from deadlocking.
+    """
+    watermarks = {}
+    for patient_id in sorted(set(patient_ids)):
+        watermark = WearableRollupWatermark.query.filter_by(
+            patient_id=patient_id
+        ).with_for_update().first()
+
+        if watermark is None:
+            try:
+                with db.session.begin_nested():
+                    db.session.add(WearableRollupWatermark(patient_id=patient_id))
+            except IntegrityError:
+                pass
+            watermark = WearableRollupWatermark.query.filter_by(
+                patient_id=patient_id
+            ).with_for_update().first()
+
+        watermarks[patient_id] = watermark
+    return watermarks
+
+
+def _aggregate_since(patient_id, granularity, since):
+    """Aggregate wearable_data rows newer than the watermark into per-bucket partials"""
+    bucket = _bucket_expr(granularity).label('bucket_start')
+    columns = [bucket, func.count().label('sample_count')]
+    for name, column in MEASURES:
+        columns += [
+            func.coalesce(func.sum(column), 0).label(f'{name}_sum'),
+            func.count(column).label(f'{name}_count'),
+            func.min(column).label(f'{name}_min'),
+            func.max(column).label(f'{name}_max'),
+        ]
+    columns += [
+        func.coalesce(func.sum(WearableData.heart_rate_variability), 0).label('hrv_sum'),
+        func.count(WearableData.heart_rate_variability).label('hrv_count'),
+        func.coalesce(func.sum(WearableData.steps), 0).label('steps_sum'),
+    ]
+
+    query = db.session.query(*columns).filter(WearableData.patient_id == patient_id)
+    if since is not None:
+        query = query.filter(WearableData.created_at > since)
+
+    partials = {}
+    for row in query.group_by(bucket).all():
+        partial = dict(row._mapping)
+        bucket_start = partial.pop('bucket_start')
+        if isinstance(bucket_start, str):
+            bucket_start = datetime.fromisoformat(bucket_start)
+        partials[bucket_start] = partial
+    return partials
+
+
+def _merge(rollup, partial):
+    """Fold a partial aggregate into an existing rollup bucket"""
+    rollup.sample_count = (rollup.sample_count or 0) + partial['sample_count']
+    for name, _ in MEASURES:
+        setattr(rollup, f'{name}_sum', (getattr(rollup, f'{name}_sum') or 0) + partial[f'{name}_sum'])
+        setattr(rollup, f'{name}_count', (getattr(rollup, f'{name}_count') or 0) + partial[f'{name}_count'])
+        for suffix, pick in (('min', min), ('max', max)):
+            values = [v for v in (getattr(rollup, f'{name}_{suffix}'), partial[f'{name}_{suffix}']) if v is not None]
+            setattr(rollup, f'{name}_{suffix}', pick(values) if values else None)
+    rollup.hrv_sum = (rollup.hrv_sum or 0) + partial['hrv_sum']
+    rollup.hrv_count = (rollup.hrv_count or 0) + partial['hrv_count']
+    rollup.steps_sum = (rollup.steps_sum or 0) + partial['steps_sum']
+
+
+def refresh_rollups(patient_ids):
+    """
+    Bring hourly and daily rollups up to date for the given patients
+
+    Only wearable_data rows created after each patient's watermark are read,
+    so the cost is proportional to the new samples, not the patient's history.
+    The caller owns the transaction; rollups and watermarks commit together
+    with the samples that produced them.
+
+    Returns:
+        Number of rollup buckets touched
+    """
+    touched = 0
+    watermarks = lock_watermarks(patient_ids)
+
+    for patient_id, watermark in watermarks.items():
+        since = watermark.last_created_at
+        latest = db.session.query(
+            func.max(WearableData.created_at), func.max(WearableData.recorded_at)
+        ).filter(WearableData.patient_id == patient_id)
+        if since is not None:
+            latest = latest.filter(WearableData.created_at > since)
+        last_created_at, last_recorded_at = latest.one()
+
+        if last_created_at is None:
+            continue
+
+        for granularity, model in ROLLUP_MODELS.items():
+            partials = _aggregate_since(patient_id, granularity, since)
+            if not partials:
+                continue
+
+            existing = {
+                rollup.bucket_start: rollup
+                for rollup in model.query.filter(
+                    model.patient_id == patient_id,
+                    model.bucket_start.in_(list(partials))
+                ).all()
+            }
+
+            for bucket_start, partial in partials.items():
+                rollup = existing.get(bucket_start)
+                if rollup is None:
+                    rollup = model(patient_id=patient_id, bucket_start=bucket_start)
+                    db.session.add(rollup)
+                _merge(rollup, partial)
+                touched += 1
+
+        watermark.last_created_at = last_created_at
+        if watermark.last_recorded_at is None or last_recorded_at > watermark.last_recorded_at:
+            watermark.last_recorded_at = last_recorded_at
+
+    db.session.flush()
+    return touched
+
+
+def get_rollups(patient_id, granularity='day', start=None, end=None, limit=None):
+    """Read rollup buckets for a patient, oldest first"""
+    model = ROLLUP_MODELS[granularity]
+    query = model.query.filter(model.patient_id == patient_id)
+    if start is not None:
+        query = query.filter(model.bucket_start >= start)
+    if end is not None:
+        query = query.filter(model.bucket_start < end)
+
+    if limit:
+        rollups = query.order_by(model.bucket_start.desc()).limit(limit).all()
+        return list(reversed(rollups))
+    return query.order_by(model.bucket_start).all()
+
+
+if __name__ == '__main__':
+    # Catch-up job: roll up any samples written outside the ingest endpoint
+    from app import create_app
+
+    app = create_app()
+    with app.app_context():
+        patient_ids = [
+            patient_id for (patient_id,) in db.session.query(WearableData.patient_id).distinct()
+        ]
+        for patient_id in patient_ids:
+            buckets = refresh_rollups([patient_id])
+            db.session.commit()
+            print(f"Patient {patient_id}: {buckets} rollup buckets updated")
@@ -1,7 +1,31 @@
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
-from models import db, User, Patient, Doctor, AIAnalyses, FinalDecisions
-from datetime import datetime, date
+from flask import Blueprint, request, jsonify, current_app, Response, stream_with_context
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from models import (
+    db, User, Patient, Doctor, AIAnalyses, FinalDecisions, WearableRollupWatermark,
+    CollaborativeDiscussion, DiscussionMessage
+)
+from wearables import iter_samples, ingest_samples
+from rollups import ROLLUP_MODELS, refresh_rollups, get_rollups
+from features import extract_patient_features, patient_age, data_fingerprint, features_hash
+from pagination import keyset_page, serialize_row
+from ai_jobs import (
+    run_bounded, analysis_jobs, summary_jobs, batch_rate_limiter, JobQueueFull, process_token, owner_is_gone
+)
+from discussions import lock_discussion, build_context, append_turns, fold_old_turns, analysis_turn
+from query_stats import query_budget
+from single_flight import analysis_flights, SingleFlightTimeout
+from metrics import registry as metrics_registry, analysis_paths
+from db_routing import use_primary
+from password_hashing import PasswordHasherBusy
+from bulk_import import iter_records, import_users, ROLES as REGISTER_ROLES, ADMIN_ROLES
+from http_cache import make_etag, conditional_json
+from auth import create_user_token, load_user_with_profiles, current_claims, role_required
+from sqlalchemy import func, or_
+from datetime import datetime, date, timedelta
+import hmac
+import json
+import time
+import uuid
 
 
 api = Blueprint('api', __name__)
@@ -11,9 +35,19 @@ def health_check():
     return jsonify({
         'status': 'healthy',
         'message': 'AI HealthCare API is running!',
-        'timestamp': datetime.utcnow().isoformat()
+        'timestamp': datetime.utcnow().isoformat(),
+        'llm_circuit': llm_breaker.snapshot()
     }), 200
 
+@api.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics for HTTP routes, SQL, bcrypt and OpenAI calls"""
+    token = current_app.config.get('METRICS_TOKEN')
+    if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    return Response(metrics_registry.render(), mimetype='text/plain; version=0.0.4')
+
 @api.route('/auth/register', methods=['POST'])
 def register():
     try:
@@ -24,6 +58,10 @@ def register():
             if field not in data:
                 return jsonify({'error': f'Missing required field: {field}'}), 400
         
+        # Admins are created by the bulk_import CLI or by another admin, never self-registered
+        if data['role'] not in REGISTER_ROLES:
+            return jsonify({'error': f"role must be one of: {', '.join(REGISTER_ROLES)}"}), 400
+        
         if User.query.filter_by(email=data['email']).first():
             return jsonify({'error': 'Email already registered'}), 400
         
@@ -58,7 +96,7 @@ def register():
         
         db.session.commit()
         
-        access_token = create_access_token(identity=user.id)
+        access_token = create_user_token(user)
         
         return jsonify({
             'message': 'User registered successfully',
@@ -66,6 +104,9 @@ def register():
             'access_token': access_token
         }), 201
         
+    except PasswordHasherBusy as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '1'}
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -78,15 +119,19 @@ def login():
         if 'email' not in data or 'password' not in data:
             return jsonify({'error': 'Email and password required'}), 400
         
-        user = User.query.filter_by(email=data['email']).first()
+        user = load_user_with_profiles(email=data['email'])
         
         if not user or not user.check_password(data['password']):
             return jsonify({'error': 'Invalid credentials'}), 401
         
+        # Upgrade hashes made with an old cost factor while the plaintext is at hand
+        if user.password_needs_rehash():
+            user.set_password(data['password'])
+        
         user.last_login = datetime.utcnow()
         db.session.commit()
         
-        access_token = create_access_token(identity=user.id)
+        access_token = create_user_token(user)
         
         return jsonify({
             'message': 'Login successful',
@@ -94,6 +139,8 @@ def login():
             'access_token': access_token
         }), 200
         
+    except PasswordHasherBusy as e:
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '1'}
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -112,87 +159,751 @@ def get_current_user():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# ==================== ADMIN ENDPOINTS ====================
+
+@api.route('/admin/import/users', methods=['POST'])
+@role_required('admin')
+@query_budget(200)  # A few statements per batch
+def import_users_bulk():
+    """Bulk onboard patients, doctors and admins from a CSV, NDJSON or JSON array body"""
+    try:
+        result = import_users(
+            iter_records(request.stream, request.mimetype),
+            batch_size=request.args.get('batch_size', 500, type=int),
+            roles=ADMIN_ROLES
+        )
+        
+        return jsonify({
+            'message': f"Imported {result['inserted']} users",
+            'inserted': result['inserted'],
+            'rejected': result['rejected'],
+            'errors': result['errors'][:1000]
+        }), 201 if result['inserted'] else 400
+        
+    except PasswordHasherBusy as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '5'}
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+PATIENT_LIST_FIELDS = {
+    'id': Patient.id,
+    'user_id': Patient.user_id,
+    'date_of_birth': Patient.date_of_birth,
+    'gender': Patient.gender,
+    'blood_type': Patient.blood_type,
+    'height_cm': Patient.height_cm,
+    'weight_kg': Patient.weight_kg,
+    'created_at': Patient.created_at,
+    'first_name': User.first_name,
+    'last_name': User.last_name,
+    'email': User.email
+}
+
+# Fields read from the joined users row rather than patients
+PATIENT_LIST_USER_FIELDS = ('first_name', 'last_name', 'email')
+
+PATIENT_LIST_DEFAULT_FIELDS = ('id', 'user_id', 'first_name', 'last_name', 'date_of_birth', 'gender', 'blood_type')
+
 @api.route('/patients', methods=['GET'])
-@jwt_required()
+@role_required('doctor')
 def get_patients():
+    """
+    List patients one keyset page at a time
+    
+    Query params: limit, cursor (next_cursor from the previous page),
+    gender, blood_type, risk_level (of the latest AI analysis) and
+    fields (comma-separated subset of PATIENT_LIST_FIELDS).
+    """
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        limit = min(max(request.args.get('limit', 50, type=int), 1), 200)
         
-        if user.role != 'doctor':
-            return jsonify({'error': 'Unauthorized'}), 403
+        fields = request.args.get('fields')
+        fields = [f.strip() for f in fields.split(',') if f.strip()] if fields else list(PATIENT_LIST_DEFAULT_FIELDS)
+        unknown = [f for f in fields if f not in PATIENT_LIST_FIELDS]
+        if unknown:
+            return jsonify({'error': f"Unknown fields: {', '.join(unknown)}"}), 400
+        
+        # Sort key columns are always selected so the next cursor can be built
+        selected = list(dict.fromkeys(fields + ['created_at', 'id']))
+        query = db.session.query(*[PATIENT_LIST_FIELDS[f].label(f) for f in selected])
+        if any(f in PATIENT_LIST_USER_FIELDS for f in selected):
+            query = query.select_from(Patient).join(User, Patient.user_id == User.id)
         
-        patients = Patient.query.all()
+        if request.args.get('gender'):
+            query = query.filter(Patient.gender == request.args['gender'])
+        if request.args.get('blood_type'):
+            query = query.filter(Patient.blood_type == request.args['blood_type'])
+        if request.args.get('risk_level'):
+            latest_timestamp = db.session.query(
+                func.max(AIAnalyses.analysis_timestamp)
+            ).filter(AIAnalyses.patient_id == Patient.id).correlate(Patient).scalar_subquery()
+            query = query.filter(
+                db.session.query(AIAnalyses.id).filter(
+                    AIAnalyses.patient_id == Patient.id,
+                    AIAnalyses.analysis_timestamp == latest_timestamp,
+                    AIAnalyses.risk_level == request.args['risk_level']
+                ).correlate(Patient).exists()
+            )
+        
+        rows, next_cursor = keyset_page(
+            query,
+            [Patient.created_at, Patient.id],
+            cursor=request.args.get('cursor'),
+            limit=limit
+        )
+        
+        patients = []
+        for row in rows:
+            patient = serialize_row(row)
+            patients.append({f: patient[f] for f in fields})
         
         return jsonify({
-            'patients': [p.to_dict() for p in patients]
+            'patients': patients,
+            'next_cursor': next_cursor,
+            'limit': limit
         }), 200
         
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-from ai_service import ai_analyzer
+# ==================== WEARABLE ENDPOINTS ====================
 
-@api.route('/ai/analyze/<patient_id>', methods=['POST'])
+@api.route('/wearables/ingest', methods=['POST'])
 @jwt_required()
-def analyze_patient(patient_id):
-    """Generate AI analysis for a patient"""
+@query_budget(100)  # One INSERT per batch plus rollup refresh
+def ingest_wearable_data():
+    """Bulk upload of smart ring samples (JSON array or NDJSON)"""
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        claims = current_claims()
+        
+        allowed_patient_id = None
+        if claims.get('role') == 'patient':
+            if not claims.get('patient_id'):
+                return jsonify({'error': 'Patient profile not found'}), 404
+            allowed_patient_id = claims['patient_id']
+        elif claims.get('role') not in ('doctor', 'admin'):
+            return jsonify({'error': 'Unauthorized'}), 403
+        
+        samples = iter_samples(request.stream, request.mimetype)
+        if allowed_patient_id is None and request.args.get('patient_id'):
+            default_patient_id = request.args.get('patient_id')
+            samples = (
+                (row_number, dict(sample, patient_id=sample.get('patient_id') or default_patient_id))
+                if isinstance(sample, dict) else (row_number, sample)
+                for row_number, sample in samples
+            )
+        
+        result = ingest_samples(
+            samples,
+            allowed_patient_id=allowed_patient_id,
+            batch_size=current_app.config['WEARABLE_INGEST_BATCH_SIZE'],
+            max_samples=current_app.config['WEARABLE_INGEST_MAX_SAMPLES']
+        )
+        refresh_rollups(result['patient_ids'])
+        db.session.commit()
+        
+        return jsonify({
+            'message': f"Ingested {result['inserted']} samples",
+            'inserted': result['inserted'],
+            'rejected': result['rejected'],
+            'errors': result['errors'][:100]
+        }), 201 if result['inserted'] else 400
+        
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/wearables/<patient_id>/rollups', methods=['GET'])
+@jwt_required()
+def get_wearable_rollups(patient_id):
+    """Get hourly or daily wearable aggregates for a patient"""
+    try:
+        claims = current_claims()
         
-        # Only doctors can request AI analysis
-        if user.role != 'doctor':
+        if claims.get('role') == 'patient':
+            if claims.get('patient_id') != patient_id:
+                return jsonify({'error': 'Unauthorized'}), 403
+        elif claims.get('role') not in ('doctor', 'admin'):
             return jsonify({'error': 'Unauthorized'}), 403
         
+        granularity = request.args.get('granularity', 'day')
+        if granularity not in ROLLUP_MODELS:
+            return jsonify({'error': 'granularity must be one of: hour, day'}), 400
+        
+        start = request.args.get('start')
+        end = request.args.get('end')
+        rollups = get_rollups(
+            patient_id,
+            granularity=granularity,
+            start=datetime.fromisoformat(start) if start else None,
+            end=datetime.fromisoformat(end) if end else None,
+            limit=request.args.get('limit', type=int)
+        )
+        watermark = WearableRollupWatermark.query.get(patient_id)
+        
+        return jsonify({
+            'patient_id': patient_id,
+            'granularity': granularity,
+            'rollups': [r.to_dict() for r in rollups],
+            'watermark': watermark.to_dict() if watermark else None
+        }), 200
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+from ai_service import ai_analyzer, llm_cache, llm_breaker, CHAT_FALLBACK, ANALYSIS_RISK_LEVELS
+from rules_engine import rules_engine
+
+def _build_analysis_inputs(patient):
+    """Load the patient's real data window and summarize it for the prompt"""
+    features = extract_patient_features(
+        patient.id,
+        days=current_app.config['ANALYSIS_WINDOW_DAYS'],
+        outlier_z=current_app.config['ANALYSIS_OUTLIER_Z']
+    )
+    
+    patient_data = {
+        'name': patient.user.first_name + ' ' + patient.user.last_name,
+        'age': patient_age(patient.date_of_birth),
+        'gender': patient.gender,
+        'blood_type': patient.blood_type
+    }
+    
+    return patient_data, features['daily'], features['recent_logs'], features
+
+def _run_analysis(patient, rate_limiter=None):
+    """
+    Build the patient's inputs and analyze them
+
+    If the summarized inputs hash the same as the previous analysis, that
+    analysis is returned with reused_analysis_id set instead of running a
+    new one. Otherwise the deterministic rules pre-screen runs first;
+    patients it clears get a low-risk result without an LLM call (or a rate
+    limiter slot). Everything else escalates to the AI analysis, which only
+    sees the rows stored since the previous LLM analysis plus its findings
+    when there is one, or the whole window otherwise. The result's
+    analysis_path records which path was taken and data_analyzed what the
+    analysis was based on.
+    """
+    days = current_app.config['ANALYSIS_WINDOW_DAYS']
+    fingerprint, snapshot = data_fingerprint(patient.id, days)
+    patient_data, vital_signs, health_logs, features = _build_analysis_inputs(patient)
+    data_analyzed = dict(snapshot, fingerprint=fingerprint, content_hash=features_hash(features), mode='full')
+    
+    previous = _previous_analysis(patient.id)
+    previous_data = (previous.data_analyzed or {}) if previous is not None else {}
+    if previous_data.get('content_hash') == data_analyzed['content_hash']:
+        analysis = _stored_analysis(previous)
+        analysis['reused_analysis_id'] = previous.id
+        return analysis
+    
+    screen = None
+    if current_app.config.get('ANALYSIS_RULES_ENABLED'):
+        screen = rules_engine.screen(features)
+        if screen['clear']:
+            analysis_paths.inc(path='rules')
+            analysis = _stored_shape(rules_engine.low_risk_analysis(features, screen))
+            analysis['data_analyzed'] = data_analyzed
+            return analysis
+    
+    delta = None
+    if (current_app.config.get('ANALYSIS_INCREMENTAL_ENABLED') and previous is not None
+            and previous.analysis_path == 'llm' and previous_data):
+        delta = extract_patient_features(
+            patient.id,
+            days=days,
+            outlier_z=current_app.config['ANALYSIS_OUTLIER_Z'],
+            wearable_created_after=_parse_timestamp(previous_data.get('wearable_latest')),
+            log_created_after=_parse_timestamp(previous_data.get('health_log_latest'))
+        )
+        if not (delta['window']['wearable_samples'] or delta['window']['health_logs']):
+            # Only older data left the window; re-summarize the whole window instead
+            delta = None
+    
+    if rate_limiter is not None:
+        rate_limiter.acquire()
+    
+    if delta is not None:
+        analysis = ai_analyzer.analyze_patient_update(patient_data, _stored_analysis(previous), delta)
+        data_analyzed.update(mode='incremental', previous_analysis_id=previous.id, delta=delta['window'])
+    else:
+        analysis = ai_analyzer.analyze_patient_data(patient_data, vital_signs, health_logs, features)
+    analysis = _stored_shape(analysis)
+    analysis_paths.inc(path='llm')
+    analysis['analysis_path'] = 'llm'
+    analysis['data_analyzed'] = data_analyzed
+    if screen is not None:
+        analysis['prescreen'] = screen
+    return analysis
+
+def _parse_timestamp(value):
+    return datetime.fromisoformat(value) if value else None
+
+def _stored_analysis(ai_analysis):
+    """Analysis result dict rebuilt from a stored ai_analyses row"""
+    analysis = ai_analysis.to_dict()
+    analysis['generated_at'] = analysis['analysis_timestamp']
+    return _stored_shape(analysis)
+
+def _as_text(value):
+    """findings and recommendations are TEXT columns, but models often answer with a list"""
+    if isinstance(value, (list, tuple)):
+        return '\n'.join(str(item) for item in value)
+    return value or ''
+
+def _as_list(value):
+    """concerns is a list column (TEXT[] on Postgres, JSON elsewhere)"""
+    if isinstance(value, (list, tuple)):
+        return [str(item) for item in value]
+    return [value] if value else []
+
+def _stored_shape(analysis):
+    """
+    Give a fresh analysis result the shape _stored_analysis reads rows back in
+
+    Callers get the same types whether an analysis was just run or reused.
+    """
+    analysis['findings'] = _as_text(analysis.get('findings'))
+    analysis['concerns'] = _as_list(analysis.get('concerns'))
+    analysis['recommendations'] = _as_text(analysis.get('recommendations'))
+    return analysis
+
+def _analysis_values(patient_id, analysis):
+    """Column values for an ai_analyses row built from an analysis result"""
+    data_analyzed = analysis.get('data_analyzed')
+    return {
+        'id': str(uuid.uuid4()),
+        'patient_id': patient_id,
+        'analysis_timestamp': datetime.utcnow(),
+        'findings': _as_text(analysis.get('findings')),
+        'concerns': _as_list(analysis.get('concerns')),
+        'risk_level': analysis.get('risk_level', 'unknown'),
+        'recommendations': _as_text(analysis.get('recommendations')),
+        'confidence_score': analysis.get('confidence_score', 0),
+        'analysis_path': analysis.get('analysis_path', 'llm'),
+        'input_fingerprint': data_analyzed.get('fingerprint') if data_analyzed else None,
+        'data_analyzed': data_analyzed,
+        'status': 'pending'
+    }
+
+def _analysis_key(patient_id, fingerprint):
+    return f'analysis:{patient_id}:{fingerprint}'
+
+def _completed_analyses(patient_id):
+    """Completed, non-fallback analyses of a patient younger than ANALYSIS_REUSE_MAX_AGE"""
+    since = datetime.utcnow() - timedelta(seconds=current_app.config['ANALYSIS_REUSE_MAX_AGE'])
+    return AIAnalyses.query.filter(
+        AIAnalyses.patient_id == patient_id,
+        AIAnalyses.input_fingerprint.isnot(None),
+        AIAnalyses.analysis_timestamp >= since,
+        AIAnalyses.risk_level != 'unknown',
+        AIAnalyses.reused_analysis_id.is_(None),
+        or_(AIAnalyses.job_status.is_(None), AIAnalyses.job_status == 'completed')
+    ).order_by(AIAnalyses.analysis_timestamp.desc())
+
+def _reusable_analysis(patient_id, fingerprint):
+    """Stored analysis of exactly this data, if there is a recent one"""
+    return _completed_analyses(patient_id).filter(AIAnalyses.input_fingerprint == fingerprint).first()
+
+def _inflight_analysis(patient_id, fingerprint):
+    """Queued or running analysis jobs for exactly this data"""
+    return AIAnalyses.query.filter(
+        AIAnalyses.patient_id == patient_id,
+        AIAnalyses.input_fingerprint == fingerprint,
+        AIAnalyses.job_status.in_(('queued', 'running'))
+    )
+
+def _previous_analysis(patient_id):
+    """Most recent analysis new results can be compared against or built on"""
+    return _completed_analyses(patient_id).first()
+
+def _analyze_once(patient, fingerprint):
+    """
+    Single-flight body for analyze_patient
+
+    Runs under the inter-process lock for (patient, fingerprint), so a row
+    stored by a caller that held the lock before us is visible here and is
+    returned instead of calling the model again. Async jobs run under the
+    same lock; one still queued for this data is filled in here and its
+    worker then finds nothing left to do.
+
+    Returns:
+        (analysis dict, analysis id, reused)
+    """
+    existing = _reusable_analysis(patient.id, fingerprint)
+    if existing is not None:
+        return _stored_analysis(existing), existing.id, True
+    
+    job = _inflight_analysis(patient.id, fingerprint).filter(AIAnalyses.job_status == 'queued').first()
+    
+    analysis = _run_analysis(patient)
+    if job is not None:
+        _fill_analysis_job(job, analysis)
+    if analysis.get('reused_analysis_id'):
+        return analysis, analysis['reused_analysis_id'], True
+    
+    ai_analysis = job
+    if ai_analysis is None:
+        ai_analysis = AIAnalyses(**_analysis_values(patient.id, analysis))
+        db.session.add(ai_analysis)
+        db.session.commit()
+    return analysis, ai_analysis.id, False
+
+def _wants_async():
+    """Client asked for job mode via ?async=true or Prefer: respond-async"""
+    return (
+        request.args.get('async', '').lower() in ('1', 'true', 'yes')
+        or 'respond-async' in request.headers.get('Prefer', '')
+    )
+
+def _enqueue_analysis(patient_id, fingerprint=None):
+    """
+    Insert a queued ai_analyses row and hand it to the background pool
+
+    A job already queued or running for the same data, or a recent result
+    for it, is returned instead of queueing a duplicate. A running job holds
+    the analysis lock until it finishes, so that case is checked before
+    waiting for the lock.
+    """
+    if analysis_jobs.pending >= analysis_jobs.max_pending:
+        return jsonify({'error': 'Analysis queue is full, please retry shortly'}), 503, {'Retry-After': '5'}
+    
+    def existing_analysis():
+        if not fingerprint:
+            return None
+        return _inflight_analysis(patient_id, fingerprint).first() or _reusable_analysis(patient_id, fingerprint)
+    
+    existing = existing_analysis()
+    if existing is None:
+        with analysis_flights.interprocess_lock(_analysis_key(patient_id, fingerprint), db.engine):
+            existing = existing_analysis()
+            if existing is None:
+                ai_analysis = AIAnalyses(
+                    patient_id=patient_id,
+                    status='pending',
+                    job_status='queued',
+                    job_owner=process_token(),
+                    input_fingerprint=fingerprint
+                )
+                db.session.add(ai_analysis)
+                db.session.commit()
+    
+    if existing is not None:
+        status_url = f'/api/ai/analyses/{existing.id}'
+        return jsonify({
+            'message': 'Analysis already queued' if existing.job_status in ('queued', 'running')
+                       else 'Analysis of unchanged data already available',
+            'analysis_id': existing.id,
+            'job_status': existing.job_status,
+            'status_url': status_url,
+            'coalesced': True
+        }), 202, {'Location': status_url}
+    
+    try:
+        analysis_jobs.submit(current_app._get_current_object(), _complete_analysis_job, ai_analysis.id)
+    except JobQueueFull:
+        ai_analysis.job_status = 'failed'
+        ai_analysis.job_error = 'Analysis queue is full'
+        db.session.commit()
+        return jsonify({'error': 'Analysis queue is full, please retry shortly'}), 503, {'Retry-After': '5'}
+    
+    status_url = f'/api/ai/analyses/{ai_analysis.id}'
+    return jsonify({
+        'message': 'Analysis queued',
+        'analysis_id': ai_analysis.id,
+        'job_status': ai_analysis.job_status,
+        'status_url': status_url
+    }), 202, {'Location': status_url}
+
+def _fail_lost_analysis_jobs(is_lost, analysis_id=None):
+    """Mark the queued/running job rows for which is_lost(owner, queued at) is true as failed"""
+    query = db.session.query(AIAnalyses.id, AIAnalyses.job_owner, AIAnalyses.analysis_timestamp).filter(
+        AIAnalyses.job_status.in_(('queued', 'running'))
+    )
+    if analysis_id is not None:
+        query = query.filter(AIAnalyses.id == analysis_id)
+    
+    lost = [row_id for row_id, owner, queued_at in query if is_lost(owner, queued_at)]
+    if not lost:
+        return 0
+    
+    failed = AIAnalyses.query.filter(
+        AIAnalyses.id.in_(lost),
+        AIAnalyses.job_status.in_(('queued', 'running'))
+    ).update({
+        'job_status': 'failed',
+        'job_error': 'Analysis job was lost before it completed, please retry'
+    }, synchronize_session=False)
+    db.session.commit()
+    return failed
+
+def fail_orphaned_analysis_jobs(all_owners=False):
+    """
+    Fail the queued/running jobs of processes on this host that have exited
+    
+    Jobs only live in the memory of the process that queued them (job_owner),
+    so at startup every row left by an earlier run of a worker here is failed
+    at once instead of being polled as queued/running. Sibling workers that
+    are still running keep their jobs. A single-process deploy owns every
+    job, so all_owners fails them all (owners on a replaced host included).
+    
+    Returns:
+        Number of rows marked failed
+    """
+    return _fail_lost_analysis_jobs(lambda owner, queued_at: all_owners or owner_is_gone(owner))
+
+def fail_stale_analysis_jobs(analysis_id):
+    """
+    Fail a polled job whose owner has exited or that is older than AI_JOB_STALE_AFTER
+    
+    The age cutoff covers owners on other hosts (e.g. a replaced container),
+    whose liveness cannot be checked from here.
+    
+    Returns:
+        Number of rows marked failed
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=current_app.config['AI_JOB_STALE_AFTER'])
+    return _fail_lost_analysis_jobs(
+        lambda owner, queued_at: owner_is_gone(owner) or queued_at is None or queued_at < cutoff,
+        analysis_id
+    )
+
+def _fill_analysis_job(ai_analysis, analysis):
+    """
+    Store an analysis result in a queued job row and mark it completed
+    
+    When the result is a stored analysis of the same data, the job row only
+    points at it (reused_analysis_id) rather than copying it into a second
+    analysis row; get_analysis serves the referenced analysis.
+    """
+    if analysis.get('reused_analysis_id'):
+        ai_analysis.reused_analysis_id = analysis['reused_analysis_id']
+        ai_analysis.job_status = 'completed'
+        db.session.commit()
+        return
+    
+    values = _analysis_values(ai_analysis.patient_id, analysis)
+    for field in ('analysis_timestamp', 'findings', 'concerns', 'risk_level', 'recommendations',
+                  'confidence_score', 'analysis_path', 'input_fingerprint', 'data_analyzed'):
+        setattr(ai_analysis, field, values[field])
+    ai_analysis.job_status = 'completed'
+    db.session.commit()
+
+def _complete_analysis_job(analysis_id):
+    """
+    Background worker: run the analysis and fill in the queued row
+    
+    Holds the same inter-process lock as _analyze_once while it runs, so a
+    synchronous request for the same data waits for this job and reuses its
+    row, or has already filled the row in by the time the lock is ours.
+    """
+    ai_analysis = AIAnalyses.query.get(analysis_id)
+    if ai_analysis is None:
+        return
+    
+    try:
+        with analysis_flights.interprocess_lock(
+                _analysis_key(ai_analysis.patient_id, ai_analysis.input_fingerprint), db.engine):
+            db.session.refresh(ai_analysis)
+            if ai_analysis.job_status != 'queued':
+                # Filled in by a synchronous request, or failed as stale, while we waited
+                return
+            
+            ai_analysis.job_status = 'running'
+            db.session.commit()
+            
+            _fill_analysis_job(ai_analysis, _run_analysis(ai_analysis.patient))
+        
+    except Exception as e:
+        db.session.rollback()
+        ai_analysis = AIAnalyses.query.get(analysis_id)
+        ai_analysis.job_status = 'failed'
+        ai_analysis.job_error = str(e)
+        db.session.commit()
+
+def _analysis_job_dict(analysis_id):
+    """An analysis row, or for a job that reused one, the reused analysis with the job's id and status"""
+    ai_analysis = AIAnalyses.query.get(analysis_id)
+    if ai_analysis.reused_analysis is None:
+        return ai_analysis.to_dict()
+    return dict(
+        ai_analysis.reused_analysis.to_dict(),
+        job_id=ai_analysis.id,
+        job_status=ai_analysis.job_status,
+        reused_analysis_id=ai_analysis.reused_analysis_id
+    )
+
+@api.route('/ai/analyses/<analysis_id>', methods=['GET'])
+@role_required('doctor')
+@use_primary  # Polled via the Location of a 202 while the job row is being written
+def get_analysis(analysis_id):
+    """Get an analysis, including the progress of an async analysis job"""
+    try:
+        fail_stale_analysis_jobs(analysis_id)
+        
+        # The row only changes when its job or review status does
+        version = db.session.query(
+            AIAnalyses.job_status, AIAnalyses.status, AIAnalyses.analysis_timestamp, AIAnalyses.reused_analysis_id
+        ).filter(AIAnalyses.id == analysis_id).first()
+        if not version:
+            return jsonify({'error': 'Analysis not found'}), 404
+        
+        reused_id = version.reused_analysis_id
+        if reused_id:
+            # A job answered by an existing analysis is served as that analysis
+            version = tuple(version) + tuple(db.session.query(
+                AIAnalyses.status, AIAnalyses.analysis_timestamp
+            ).filter(AIAnalyses.id == reused_id).first() or ())
+        
+        return conditional_json(
+            make_etag(analysis_id, *version),
+            lambda: _analysis_job_dict(analysis_id)
+        )
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/ai/analyze/batch', methods=['POST'])
+@role_required('doctor')
+def analyze_patients_batch():
+    """Generate AI analyses for many patients concurrently"""
+    try:
+        data = request.get_json() or {}
+        max_patients = current_app.config['AI_BATCH_MAX_PATIENTS']
+        
+        query = db.session.query(Patient.id)
+        if data.get('patient_ids'):
+            query = query.filter(Patient.id.in_(data['patient_ids']))
+        elif data.get('filter'):
+            filters = data['filter']
+            if filters.get('gender'):
+                query = query.filter(Patient.gender == filters['gender'])
+            if filters.get('blood_type'):
+                query = query.filter(Patient.blood_type == filters['blood_type'])
+        else:
+            return jsonify({'error': 'Provide patient_ids or filter'}), 400
+        
+        patient_ids = [patient_id for (patient_id,) in query.limit(max_patients + 1).all()]
+        if len(patient_ids) > max_patients:
+            return jsonify({'error': f'Batch is limited to {max_patients} patients'}), 400
+        
+        max_workers = min(
+            int(data.get('max_workers', current_app.config['AI_BATCH_MAX_WORKERS'])),
+            current_app.config['AI_BATCH_MAX_WORKERS']
+        )
+        
+        def analyze(patient_id, rate_limiter):
+            patient = Patient.query.get(patient_id)
+            return _run_analysis(patient, rate_limiter)
+        
+        started = time.monotonic()
+        results = run_bounded(
+            current_app._get_current_object(),
+            analyze,
+            patient_ids,
+            max_workers=max_workers,
+            rate_limiter=batch_rate_limiter
+        )
+        
+        rows = []
+        analyses = []
+        found = set(patient_ids)
+        failed = [
+            {'patient_id': patient_id, 'error': 'Patient not found'}
+            for patient_id in dict.fromkeys(data.get('patient_ids') or [])
+            if patient_id not in found
+        ]
+        for patient_id, analysis, error in results:
+            if error is not None:
+                failed.append({'patient_id': patient_id, 'error': str(error)})
+                continue
+            if analysis.get('model_used') == 'fallback' or analysis.get('risk_level') not in ANALYSIS_RISK_LEVELS:
+                # Not storable (risk_level CHECK) and would abort the whole batch INSERT
+                failed.append({'patient_id': patient_id, 'error': 'AI analysis unavailable, please retry'})
+                continue
+            if analysis.get('reused_analysis_id'):
+                # Nothing new since the stored analysis
+                analyses.append({
+                    'patient_id': patient_id,
+                    'analysis_id': analysis['reused_analysis_id'],
+                    'analysis': analysis,
+                    'reused': True
+                })
+                continue
+            values = _analysis_values(patient_id, analysis)
+            rows.append(values)
+            analyses.append({
+                'patient_id': patient_id,
+                'analysis_id': values['id'],
+                'analysis': analysis
+            })
+        
+        # One multi-row INSERT for the whole batch
+        if rows:
+            db.session.execute(AIAnalyses.__table__.insert(), rows)
+        db.session.commit()
+        
+        return jsonify({
+            'message': f'Generated {len(analyses)} analyses',
+            'analyses': analyses,
+            'failed': failed,
+            'elapsed_ms': round((time.monotonic() - started) * 1000)
+        }), 201
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/ai/analyze/<patient_id>', methods=['POST'])
+@role_required('doctor')
+def analyze_patient(patient_id):
+    """Generate AI analysis for a patient"""
+    try:
         # Get patient data
         patient = Patient.query.get(patient_id)
         if not patient:
             return jsonify({'error': 'Patient not found'}), 404
         
-        # Mock data for now (replace with real data later)
-        patient_data = {
-            'name': patient.user.first_name + ' ' + patient.user.last_name,
-            'age': 52,
-            'gender': patient.gender,
-            'chronic_conditions': ['Type 2 Diabetes'],
-            'medications': ['Metformin 500mg BID']
-        }
-        
-        vital_signs = [
-            {'date': '2025-10-20', 'heart_rate': 78, 'spo2': 97, 'sleep_score': 68},
-            {'date': '2025-10-21', 'heart_rate': 76, 'spo2': 98, 'sleep_score': 72},
-            {'date': '2025-10-22', 'heart_rate': 80, 'spo2': 96, 'sleep_score': 65},
-        ]
+        fingerprint, _ = data_fingerprint(patient_id, current_app.config['ANALYSIS_WINDOW_DAYS'])
         
-        health_logs = [
-            {'date': '2025-10-20', 'blood_pressure': '138/86', 'glucose': 165, 'notes': 'Feeling tired'},
-            {'date': '2025-10-21', 'blood_pressure': '135/84', 'glucose': 158, 'notes': 'Slept poorly'},
-        ]
+        if _wants_async():
+            return _enqueue_analysis(patient_id, fingerprint)
         
-        # Generate AI analysis
-        analysis = ai_analyzer.analyze_patient_data(patient_data, vital_signs, health_logs)
-        
-        # Save to database
-        ai_analysis = AIAnalyses(
-            patient_id=patient_id,
-            findings=analysis.get('findings', ''),
-            concerns=analysis.get('concerns', []),
-            risk_level=analysis.get('risk_level', 'unknown'),
-            recommendations=analysis.get('recommendations', ''),
-            confidence_score=analysis.get('confidence_score', 0),
-            status='pending'
+        # Concurrent requests for the same data share one model call and row
+        (analysis, analysis_id, reused), shared = analysis_flights.do(
+            _analysis_key(patient_id, fingerprint),
+            lambda: _analyze_once(patient, fingerprint),
+            engine=db.engine
         )
         
-        db.session.add(ai_analysis)
-        db.session.commit()
+        if reused or shared:
+            return jsonify({
+                'message': 'Analysis of unchanged data already available',
+                'analysis': analysis,
+                'analysis_id': analysis_id,
+                'coalesced': True
+            }), 200
         
         return jsonify({
             'message': 'Analysis generated successfully',
             'analysis': analysis,
-            'analysis_id': ai_analysis.id
+            'analysis_id': analysis_id
         }), 201
         
+    except SingleFlightTimeout:
+        return jsonify({'error': 'Analysis for this patient is still in progress, please retry shortly'}), 503, {'Retry-After': '5'}
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -217,10 +928,123 @@ def generate_treatment_proposal():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def _open_discussion(data):
+    """
+    Load or start the server-side discussion a chat request refers to
+    
+    Returns:
+        Tuple of (discussion, error response or None); the discussion row is locked
+    """
+    claims = current_claims()
+    
+    if claims.get('role') != 'doctor' or not claims.get('doctor_id'):
+        return None, (jsonify({'error': 'Unauthorized'}), 403)
+    doctor_id = claims['doctor_id']
+    
+    if data.get('discussion_id'):
+        discussion = lock_discussion(data['discussion_id'])
+        if not discussion:
+            return None, (jsonify({'error': 'Discussion not found'}), 404)
+        if discussion.doctor_id != doctor_id:
+            return None, (jsonify({'error': 'Unauthorized'}), 403)
+        return discussion, None
+    
+    if not Patient.query.get(data['patient_id']):
+        return None, (jsonify({'error': 'Patient not found'}), 404)
+    
+    ai_analysis = None
+    if data.get('ai_analysis_id'):
+        ai_analysis = AIAnalyses.query.get(data['ai_analysis_id'])
+        if not ai_analysis or ai_analysis.patient_id != data['patient_id']:
+            return None, (jsonify({'error': 'Analysis not found'}), 404)
+        # An async job id may stand for the existing analysis it reused
+        ai_analysis = ai_analysis.reused_analysis or ai_analysis
+    
+    discussion = CollaborativeDiscussion(
+        patient_id=data['patient_id'],
+        doctor_id=doctor_id,
+        ai_analysis_id=ai_analysis.id if ai_analysis is not None else None,
+        topic=data.get('topic')
+    )
+    db.session.add(discussion)
+    db.session.flush()
+    if ai_analysis is not None:
+        # The analysis under discussion opens the conversation the model sees
+        append_turns(discussion, [('ai', analysis_turn(ai_analysis.to_dict()))])
+    return discussion, None
+
+def _begin_chat_turn(data, doctor_message):
+    """
+    Open the discussion, snapshot its context and store the doctor's message
+    
+    Commits before the model is called so the row lock is not held during it.
+    
+    Returns:
+        Tuple of ((discussion_id, summary, history) or None, error response or None)
+    """
+    discussion, error = _open_discussion(data)
+    if error:
+        db.session.rollback()
+        return None, error
+    
+    summary, history = build_context(discussion)
+    append_turns(discussion, [('doctor', doctor_message)])
+    discussion_id = discussion.id
+    db.session.commit()
+    return (discussion_id, summary, history), None
+
+def _store_ai_turn(discussion_id, ai_response):
+    """
+    Store the AI reply and commit, releasing the discussion row lock
+    
+    The fallback apology is not a real turn and is not stored.
+    
+    Returns:
+        True if the reply was stored
+    """
+    if not ai_response or ai_response == CHAT_FALLBACK:
+        return False
+    
+    discussion = lock_discussion(discussion_id)
+    append_turns(discussion, [('ai', ai_response)])
+    db.session.commit()
+    return True
+
+def _record_ai_turn(discussion_id, ai_response):
+    """
+    Store the AI reply and queue folding of turns that left the context window
+    
+    The summary is produced in the background after the row lock is
+    released, so it adds no model round trip to the chat response.
+    """
+    if not _store_ai_turn(discussion_id, ai_response):
+        return False
+    
+    try:
+        summary_jobs.submit(current_app._get_current_object(), _fold_discussion, discussion_id)
+    except JobQueueFull:
+        pass  # The turns stay unfolded and are picked up after a later reply
+    return True
+
+def _fold_discussion(discussion_id):
+    """Background worker: fold a discussion's out-of-window turns into its summary"""
+    fold_old_turns(
+        discussion_id,
+        ai_analyzer.summarize_discussion,
+        window=current_app.config['CHAT_CONTEXT_WINDOW'],
+        batch=current_app.config['CHAT_SUMMARY_BATCH']
+    )
+
 @api.route('/ai/chat', methods=['POST'])
 @jwt_required()
 def chat_with_ai():
-    """Chat with AI about patient treatment"""
+    """
+    Chat with AI about patient treatment
+    
+    With discussion_id (or patient_id to start one) the conversation is kept
+    server-side and only the new message needs to be sent; otherwise the
+    client-supplied conversation_history is used as before.
+    """
     try:
         data = request.get_json()
         
@@ -230,11 +1054,117 @@ def chat_with_ai():
         if not doctor_message:
             return jsonify({'error': 'Message is required'}), 400
         
-        ai_response = ai_analyzer.chat_with_doctor(conversation_history, doctor_message)
+        if not (data.get('discussion_id') or data.get('patient_id')):
+            ai_response = ai_analyzer.chat_with_doctor(conversation_history, doctor_message)
+            
+            return jsonify({
+                'message': 'AI response generated',
+                'ai_response': ai_response
+            }), 200
+        
+        turn, error = _begin_chat_turn(data, doctor_message)
+        if error:
+            return error
+        discussion_id, summary, history = turn
+        
+        ai_response = ai_analyzer.chat_with_doctor(history, doctor_message, summary=summary)
+        _record_ai_turn(discussion_id, ai_response)
         
         return jsonify({
             'message': 'AI response generated',
-            'ai_response': ai_response
+            'ai_response': ai_response,
+            'discussion_id': discussion_id
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/ai/chat/stream', methods=['POST'])
+@jwt_required()
+def stream_chat_with_ai():
+    """Chat with AI, streaming the reply as Server-Sent Events"""
+    try:
+        data = request.get_json()
+        
+        conversation_history = data.get('conversation_history', [])
+        doctor_message = data.get('message', '')
+        
+        if not doctor_message:
+            return jsonify({'error': 'Message is required'}), 400
+        
+        summary = None
+        discussion_id = None
+        if data.get('discussion_id') or data.get('patient_id'):
+            turn, error = _begin_chat_turn(data, doctor_message)
+            if error:
+                return error
+            discussion_id, summary, conversation_history = turn
+        
+        def generate():
+            parts = []
+            for delta in ai_analyzer.stream_chat_with_doctor(conversation_history, doctor_message, summary=summary):
+                parts.append(delta)
+                yield f"data: {json.dumps({'delta': delta})}\n\n"
+            
+            if discussion_id:
+                _record_ai_turn(discussion_id, "".join(parts))
+            yield f"event: done\ndata: {json.dumps({'discussion_id': discussion_id})}\n\n"
+        
+        return Response(
+            stream_with_context(generate()),
+            mimetype='text/event-stream',
+            headers={
+                'Cache-Control': 'no-cache',
+                'X-Accel-Buffering': 'no'
+            }
+        )
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/discussions/<discussion_id>', methods=['GET'])
+@role_required('doctor')
+@use_primary  # Polled right after the client's own chat turns
+def get_discussion(discussion_id):
+    """Get a discussion with its messages (optionally only those after ?after=<message_order>)"""
+    try:
+        discussion = CollaborativeDiscussion.query.get(discussion_id)
+        if not discussion:
+            return jsonify({'error': 'Discussion not found'}), 404
+        
+        messages = DiscussionMessage.query.filter(
+            DiscussionMessage.discussion_id == discussion_id,
+            DiscussionMessage.message_order > request.args.get('after', 0, type=int)
+        ).order_by(DiscussionMessage.message_order).all()
+        
+        return jsonify({
+            'discussion': discussion.to_dict(),
+            'messages': [m.to_dict() for m in messages]
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/ai/usage', methods=['GET'])
+@role_required('doctor', 'admin')
+def get_ai_usage():
+    """Prompt/completion token usage per AIHealthAnalyzer method"""
+    try:
+        return jsonify(ai_analyzer.usage.snapshot()), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/ai/cache/stats', methods=['GET'])
+@role_required('doctor', 'admin')
+def get_ai_cache_stats():
+    """Hit/miss counters for the LLM response cache"""
+    try:
+        return jsonify({
+            'enabled': llm_cache is not None,
+            'stats': llm_cache.stats() if llm_cache else {}
         }), 200
         
     except Exception as e:
@@ -243,16 +1173,10 @@ def chat_with_ai():
 # ==================== DECISION ENDPOINTS ====================
 
 @api.route('/decisions/create', methods=['POST'])
-@jwt_required()
+@role_required('doctor')
 def create_decision():
     """Create final collaborative decision"""
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
-        
-        if user.role != 'doctor':
-            return jsonify({'error': 'Unauthorized'}), 403
-        
         data = request.get_json()
         
         # Calculate contributions
@@ -265,7 +1189,7 @@ def create_decision():
         decision = FinalDecisions(
             discussion_id=data.get('discussion_id'),
             patient_id=data.get('patient_id'),
-            doctor_id=user.doctor_profile[0].id if user.doctor_profile else None,
+            doctor_id=current_claims().get('doctor_id'),
             treatment_plan=data.get('treatment_plan', {}),
             medications=data.get('medications', []),
             lifestyle_recommendations=data.get('lifestyle_recommendations', []),
@@ -311,12 +1235,18 @@ def calculate_contributions(ai_contributions, doctor_contributions):
 def get_decision(decision_id):
     """Get decision details"""
     try:
-        decision = FinalDecisions.query.get(decision_id)
+        # Decisions are immutable once created
+        created_at = db.session.query(FinalDecisions.created_at).filter(
+            FinalDecisions.id == decision_id
+        ).first()
         
-        if not decision:
+        if not created_at:
             return jsonify({'error': 'Decision not found'}), 404
         
-        return jsonify(decision.to_dict()), 200
+        return conditional_json(
+            make_etag(decision_id, created_at[0]),
+            lambda: FinalDecisions.query.get(decision_id).to_dict()
+        )
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -326,13 +1256,18 @@ def get_decision(decision_id):
 def get_patient_decisions(patient_id):
     """Get all decisions for a patient"""
     try:
-        decisions = FinalDecisions.query.filter_by(patient_id=patient_id).order_by(
-            FinalDecisions.created_at.desc()
-        ).all()
+        # Served from idx_decisions_patient; changes whenever a decision is added or removed
+        count, latest = db.session.query(
+            func.count(FinalDecisions.id), func.max(FinalDecisions.created_at)
+        ).filter(FinalDecisions.patient_id == patient_id).one()
         
-        return jsonify({
-            'decisions': [d.to_dict() for d in decisions]
-        }), 200
+        def build():
+            rows = db.session.query(*FinalDecisions.__table__.columns).filter(
+                FinalDecisions.patient_id == patient_id
+            ).order_by(FinalDecisions.created_at.desc()).all()
+            return {'decisions': [FinalDecisions.row_to_dict(row) for row in rows]}
+        
+        return conditional_json(make_etag(patient_id, count, latest), build)
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
\ No newline at end of file
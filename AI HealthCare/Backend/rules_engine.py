@@ -0,0 +1,147 @@
+from datetime import datetime
+from config import Config
+
+# Normal adult ranges per feature; a bound of None is not checked
+DEFAULT_THRESHOLDS = {
+    'vitals': {
+        'heart_rate': {'min': 50, 'max': 100},
+        'spo2': {'min': 95, 'max': None},
+        'respiratory_rate': {'min': 12, 'max': 20},
+        'temperature': {'min': 36.1, 'max': 37.5},
+        'sleep_score': {'min': 60, 'max': None},
+        'stress_score': {'min': None, 'max': 70},
+    },
+    'logs': {
+        'blood_pressure_systolic': {'min': 90, 'max': 130},
+        'blood_pressure_diastolic': {'min': 60, 'max': 85},
+        'glucose_mg_dl': {'min': 70, 'max': 140},
+        'symptom_severity': {'min': None, 'max': 3},
+    }
+}
+
+# Statistics from features.extract_patient_features that must all be in range
+CHECKED_STATS = ('mean', 'rolling', 'last')
+
+# Vitals a window must contain readings of before it can be cleared
+REQUIRED_VITALS = ('heart_rate', 'spo2')
+
+
+def _merge_thresholds(overrides):
+    thresholds = {source: {field: dict(bounds) for field, bounds in fields.items()}
+                  for source, fields in DEFAULT_THRESHOLDS.items()}
+    for source, fields in (overrides or {}).items():
+        for field, bounds in fields.items():
+            thresholds.setdefault(source, {}).setdefault(field, {'min': None, 'max': None}).update(bounds)
+    return thresholds
+
+
+class RulesEngine:
+    """
+    Deterministic pre-screen run before the LLM analysis
+
+    Checks the mean, recent rolling mean and latest value of each summarized
+    vital and health log field against configured normal ranges. A patient
+    is clear only when every checked value is in range, no field has more
+    than max_outliers outliers, there are at least min_samples wearable
+    samples with readings of every required vital and no free-text notes to
+    interpret; anything else escalates.
+    """
+
+    def __init__(self, thresholds=None, min_samples=24, max_outliers=2, escalate_on_notes=True,
+                 required_vitals=REQUIRED_VITALS):
+        self.thresholds = _merge_thresholds(thresholds)
+        self.required_vitals = tuple(required_vitals)
+        self.min_samples = min_samples
+        self.max_outliers = max_outliers
+        self.escalate_on_notes = escalate_on_notes
+
+    def screen(self, features):
+        """
+        Score a patient's feature summary
+
+        Returns:
+            Dict with clear (bool), score (0 when clear, grows with how far
+            values are out of range) and flags (human-readable reasons)
+        """
+        flags = []
+        score = 0.0
+
+        samples = features['window']['wearable_samples']
+        if samples < self.min_samples:
+            flags.append(f'Only {samples} wearable samples in window (need {self.min_samples})')
+            score += 1
+
+        vitals = features.get('vitals', {})
+        for field in self.required_vitals:
+            if (vitals.get(field) or {}).get('mean') is None:
+                flags.append(f'No {field} readings in window')
+                score += 1
+
+        for source, fields in self.thresholds.items():
+            summaries = features.get(source, {})
+            for field, bounds in fields.items():
+                stats = summaries.get(field)
+                if not stats:
+                    continue
+                low, high = bounds.get('min'), bounds.get('max')
+                span = (high - low) if low is not None and high is not None else max(abs(low or high or 1), 1)
+
+                values = {
+                    'mean': stats.get('mean'),
+                    'rolling': next((v for k, v in stats.items() if k.startswith('rolling_mean')), None),
+                    'last': stats.get('last')
+                }
+                for stat in CHECKED_STATS:
+                    value = values[stat]
+                    if value is None:
+                        continue
+                    if low is not None and value < low:
+                        flags.append(f'{field} {stat} {value} below {low}')
+                        score += (low - value) / span
+                    elif high is not None and value > high:
+                        flags.append(f'{field} {stat} {value} above {high}')
+                        score += (value - high) / span
+
+                if stats.get('outliers', 0) > self.max_outliers:
+                    flags.append(f"{field} has {stats['outliers']} outliers")
+                    score += 0.5
+
+        if self.escalate_on_notes and any(log.get('notes') for log in features.get('recent_logs', [])):
+            flags.append('Recent health logs contain notes')
+            score += 0.5
+
+        return {'clear': not flags, 'score': round(score, 3), 'flags': flags}
+
+    def low_risk_analysis(self, features, screen):
+        """Analysis result in the shape ai_analyses rows are read back in (concerns a list, recommendations text)"""
+        vitals = features.get('vitals', {})
+        summary = ', '.join(
+            f"{field} {stats['mean']}" for field, stats in vitals.items() if stats.get('mean') is not None
+        )
+        window = features['window']
+        return {
+            'findings': (
+                f"All monitored vitals and health log values were within normal ranges over the last "
+                f"{window['days']} days ({window['wearable_samples']} wearable samples, "
+                f"{window['health_logs']} health logs). Averages: {summary or 'n/a'}."
+            ),
+            'concerns': [],
+            'risk_level': 'low',
+            'recommendations': 'Continue routine monitoring; re-run analysis if symptoms or readings change',
+            'evidence': 'Deterministic rules pre-screen against configured clinical thresholds',
+            'confidence_score': 0.9,
+            'generated_at': datetime.utcnow().isoformat(),
+            'model_used': 'rules',
+            'cached': False,
+            'token_usage': {'prompt_tokens': 0, 'completion_tokens': 0},
+            'analysis_path': 'rules',
+            'prescreen': screen
+        }
+
+
+# Shared pre-screen used before LLM analyses
+rules_engine = RulesEngine(
+    thresholds=Config.ANALYSIS_RULES_THRESHOLDS,
+    min_samples=Config.ANALYSIS_RULES_MIN_SAMPLES,
+    max_outliers=Config.ANALYSIS_RULES_MAX_OUTLIERS
+)
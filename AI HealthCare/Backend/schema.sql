@@ -43,6 +43,7 @@ CREATE TABLE patients (
 );
 
 CREATE INDEX idx_patients_user_id ON patients(user_id);
+CREATE INDEX idx_patients_created ON patients(created_at, id);
 
 -- ============================================
 -- DOCTORS TABLE
@@ -85,6 +86,45 @@ CREATE TABLE wearable_data (
 
 CREATE INDEX idx_wearable_patient_time ON wearable_data(patient_id, recorded_at DESC);
 CREATE INDEX idx_wearable_recorded_at ON wearable_data(recorded_at DESC);
+CREATE INDEX idx_wearable_patient_created ON wearable_data(patient_id, created_at);
+
+-- ============================================
+-- WEARABLE ROLLUPS (Hourly / Daily Aggregates)
+-- ============================================
+CREATE TABLE wearable_rollups_hourly (
+    patient_id UUID REFERENCES patients(id) ON DELETE CASCADE,
+    bucket_start TIMESTAMP NOT NULL,
+    sample_count INTEGER NOT NULL DEFAULT 0,
+    heart_rate_sum BIGINT NOT NULL DEFAULT 0,
+    heart_rate_count INTEGER NOT NULL DEFAULT 0,
+    heart_rate_min INTEGER,
+    heart_rate_max INTEGER,
+    spo2_sum BIGINT NOT NULL DEFAULT 0,
+    spo2_count INTEGER NOT NULL DEFAULT 0,
+    spo2_min INTEGER,
+    spo2_max INTEGER,
+    sleep_score_sum BIGINT NOT NULL DEFAULT 0,
+    sleep_score_count INTEGER NOT NULL DEFAULT 0,
+    sleep_score_min INTEGER,
+    sleep_score_max INTEGER,
+    hrv_sum BIGINT NOT NULL DEFAULT 0,
+    hrv_count INTEGER NOT NULL DEFAULT 0,
+    steps_sum BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (patient_id, bucket_start)
+);
+
+CREATE TABLE wearable_rollups_daily (LIKE wearable_rollups_hourly INCLUDING DEFAULTS);
+ALTER TABLE wearable_rollups_daily ADD PRIMARY KEY (patient_id, bucket_start);
+ALTER TABLE wearable_rollups_daily
+    ADD FOREIGN KEY (patient_id) REFERENCES patients(id) ON DELETE CASCADE;
+
+CREATE TABLE wearable_rollup_watermarks (
+    patient_id UUID PRIMARY KEY REFERENCES patients(id) ON DELETE CASCADE,
+    last_created_at TIMESTAMP,
+    last_recorded_at TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
 
 -- ============================================
 -- HEALTH LOGS TABLE (Manual Entry)
@@ -119,11 +159,19 @@ CREATE TABLE ai_analyses (
     confidence_score DECIMAL(3,2),
     recommendations TEXT,
     evidence_sources JSONB,
-    status VARCHAR(20) DEFAULT 'pending' CHECK (status IN ('pending', 'reviewed', 'resolved'))
+    status VARCHAR(20) DEFAULT 'pending' CHECK (status IN ('pending', 'reviewed', 'resolved')),
+    job_status VARCHAR(20) CHECK (job_status IN ('queued', 'running', 'completed', 'failed')),
+    job_error TEXT,
+    job_owner VARCHAR(128),
+    analysis_path VARCHAR(10) CHECK (analysis_path IN ('rules', 'llm')),
+    input_fingerprint VARCHAR(64),
+    reused_analysis_id UUID REFERENCES ai_analyses(id) ON DELETE SET NULL
 );
 
 CREATE INDEX idx_ai_analyses_patient ON ai_analyses(patient_id, analysis_timestamp DESC);
 CREATE INDEX idx_ai_analyses_status ON ai_analyses(status);
+CREATE INDEX idx_ai_analyses_job_status ON ai_analyses(job_status) WHERE job_status IN ('queued', 'running');
+CREATE INDEX idx_ai_analyses_fingerprint ON ai_analyses(patient_id, input_fingerprint);
 
 -- ============================================
 -- COLLABORATIVE DISCUSSIONS TABLE
@@ -135,6 +183,8 @@ CREATE TABLE collaborative_discussions (
     ai_analysis_id UUID REFERENCES ai_analyses(id),
     topic VARCHAR(255),
     status VARCHAR(30) DEFAULT 'ongoing' CHECK (status IN ('ongoing', 'consensus_reached', 'doctor_final_decision')),
+    summary TEXT,
+    summarized_through INTEGER DEFAULT 0,
     started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     concluded_at TIMESTAMP
 );
@@ -182,6 +232,37 @@ CREATE TABLE final_decisions (
 CREATE INDEX idx_decisions_patient ON final_decisions(patient_id, created_at DESC);
 CREATE INDEX idx_decisions_doctor ON final_decisions(doctor_id, created_at DESC);
 
+-- ============================================
+-- LLM RESPONSE CACHE (shared tier)
+-- ============================================
+CREATE TABLE llm_cache (
+    cache_key VARCHAR(64) PRIMARY KEY,
+    model VARCHAR(50),
+    response TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    expires_at TIMESTAMP NOT NULL
+);
+
+CREATE INDEX idx_llm_cache_expires ON llm_cache(expires_at);
+
+-- ============================================
+-- COHORT RISK SCORES (nightly cohort_scoring job)
+-- ============================================
+CREATE TABLE patient_risk_scores (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    patient_id UUID REFERENCES patients(id) ON DELETE CASCADE,
+    scored_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    window_days INTEGER,
+    wearable_samples INTEGER DEFAULT 0,
+    health_logs INTEGER DEFAULT 0,
+    score DECIMAL(7,3),
+    risk_level VARCHAR(20) CHECK (risk_level IN ('low', 'moderate', 'high', 'critical', 'unknown')),
+    flags TEXT
+);
+
+CREATE INDEX idx_risk_scores_patient ON patient_risk_scores(patient_id, scored_at DESC);
+CREATE INDEX idx_risk_scores_run ON patient_risk_scores(scored_at, score DESC);
+
 -- ============================================
 -- SAMPLE DATA (for testing)
 -- ============================================
@@ -0,0 +1,128 @@
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from contextlib import contextmanager
+from sqlalchemy import text
+from config import Config
+
+try:
+    import fcntl
+except ImportError:  # Windows: only in-process coalescing
+    fcntl = None
+
+POLL_INTERVAL = 0.05
+
+
+class SingleFlightTimeout(TimeoutError):
+    """Raised when waiting on another caller's in-flight call takes too long"""
+
+
+def _lock_id(key):
+    """Signed 64-bit advisory lock id for a key"""
+    return int.from_bytes(hashlib.sha256(key.encode('utf-8')).digest()[:8], 'big', signed=True)
+
+
+@contextmanager
+def _advisory_lock(engine, key, timeout):
+    """Postgres session-level advisory lock on its own autocommit connection"""
+    lock_id = _lock_id(key)
+    deadline = time.monotonic() + timeout
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        while not conn.execute(text('SELECT pg_try_advisory_lock(:id)'), {'id': lock_id}).scalar():
+            if time.monotonic() >= deadline:
+                raise SingleFlightTimeout(f'Timed out waiting for lock on {key}')
+            time.sleep(POLL_INTERVAL)
+        try:
+            yield
+        finally:
+            conn.execute(text('SELECT pg_advisory_unlock(:id)'), {'id': lock_id})
+
+
+@contextmanager
+def _file_lock(lock_dir, key, timeout):
+    """flock on a per-key file, shared by every process on this host"""
+    path = os.path.join(lock_dir, f'single-flight-{hashlib.sha256(key.encode("utf-8")).hexdigest()[:24]}.lock')
+    deadline = time.monotonic() + timeout
+    with open(path, 'a') as f:
+        while True:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    raise SingleFlightTimeout(f'Timed out waiting for lock on {key}')
+                time.sleep(POLL_INTERVAL)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls that share a key into one execution
+
+    Within a process, the first caller for a key runs the function and
+    later callers wait on its Future and get the same result. Across worker
+    processes the leader also holds an inter-process lock for the key (a
+    Postgres advisory lock when an engine is given, else a flock file), so
+    leaders in other processes queue behind it; the function should start
+    by checking whether a result the previous holder stored can be reused.
+    """
+
+    def __init__(self, timeout=120, lock_dir=None):
+        self.timeout = timeout
+        self.lock_dir = lock_dir or tempfile.gettempdir()
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def interprocess_lock(self, key, engine=None):
+        if engine is not None and engine.dialect.name == 'postgresql':
+            with _advisory_lock(engine, key, self.timeout):
+                yield
+        elif fcntl is not None:
+            with _file_lock(self.lock_dir, key, self.timeout):
+                yield
+        else:
+            yield
+
+    def do(self, key, func, engine=None):
+        """
+        Run func() once for all concurrent callers with this key
+
+        Returns:
+            (result, shared) where shared is True for callers that waited on
+            another caller's execution in this process
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+
+        if not leader:
+            try:
+                return future.result(timeout=self.timeout), True
+            except FutureTimeout:
+                raise SingleFlightTimeout(f'Timed out waiting for in-flight call {key}')
+
+        try:
+            with self.interprocess_lock(key, engine):
+                result = func()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+
+# Coalesces concurrent analyses of the same patient data (see routes.analyze_patient)
+analysis_flights = SingleFlight(timeout=Config.ANALYSIS_COALESCE_TIMEOUT)
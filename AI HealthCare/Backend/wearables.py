@@ -0,0 +1,191 @@
+import json
+import uuid
+from datetime import datetime
+from models import db, Patient, WearableData
+from rollups import lock_watermarks, db_now
+
+NDJSON_MIMETYPES = (
+    'application/x-ndjson',
+    'application/ndjson',
+    'application/jsonl',
+    'application/x-jsonlines'
+)
+
+INTEGER_FIELDS = (
+    'heart_rate', 'heart_rate_variability', 'spo2', 'respiratory_rate', 'steps',
+    'calories_burned', 'sleep_duration_minutes', 'deep_sleep_minutes',
+    'rem_sleep_minutes', 'sleep_score', 'activity_level', 'stress_score',
+    'readiness_score'
+)
+
+DECIMAL_FIELDS = ('temperature',)
+
+
+def iter_samples(stream, mimetype):
+    """
+    Yield (row_number, sample) pairs from an upload body
+
+    NDJSON bodies are read line by line so large uploads never sit in memory
+    as one parsed document. JSON bodies may be a bare array of samples or an
+    object of the form {"patient_id": ..., "samples": [...]}.
+
+    A sample that cannot be decoded is yielded as a ValueError instead of a dict.
+    """
+    if mimetype in NDJSON_MIMETYPES:
+        for row_number, line in enumerate(stream, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield row_number, json.loads(line)
+            except ValueError as e:
+                yield row_number, ValueError(f'Invalid JSON: {e}')
+        return
+
+    try:
+        body = json.loads(stream.read() or b'null')
+    except ValueError as e:
+        raise ValueError(f'Invalid JSON body: {e}')
+
+    default_patient_id = None
+    if isinstance(body, dict):
+        default_patient_id = body.get('patient_id')
+        body = body.get('samples')
+
+    if not isinstance(body, list):
+        raise ValueError('Expected a JSON array of samples or an object with a "samples" array')
+
+    for row_number, sample in enumerate(body, start=1):
+        if isinstance(sample, dict) and default_patient_id and 'patient_id' not in sample:
+            sample = dict(sample, patient_id=default_patient_id)
+        yield row_number, sample
+
+
+def normalize_sample(sample, default_patient_id=None):
+    """Validate one sample and convert it into a wearable_data row dict"""
+    if not isinstance(sample, dict):
+        raise ValueError('Sample must be a JSON object')
+
+    patient_id = sample.get('patient_id') or default_patient_id
+    if not patient_id:
+        raise ValueError('Missing required field: patient_id')
+
+    recorded_at = sample.get('recorded_at')
+    if not recorded_at:
+        raise ValueError('Missing required field: recorded_at')
+    try:
+        recorded_at = datetime.fromisoformat(str(recorded_at))
+    except ValueError:
+        raise ValueError(f'Invalid recorded_at timestamp: {recorded_at}')
+    if recorded_at.tzinfo is not None:
+        recorded_at = recorded_at.replace(tzinfo=None) - recorded_at.utcoffset()
+
+    row = {
+        'id': str(uuid.uuid4()),
+        'patient_id': str(patient_id),
+        'recorded_at': recorded_at,
+    }
+
+    for field in INTEGER_FIELDS:
+        value = sample.get(field)
+        if value is None:
+            row[field] = None
+            continue
+        try:
+            row[field] = int(value)
+        except (TypeError, ValueError):
+            raise ValueError(f'Field {field} must be an integer')
+
+    for field in DECIMAL_FIELDS:
+        value = sample.get(field)
+        if value is None:
+            row[field] = None
+            continue
+        try:
+            row[field] = round(float(value), 2)
+        except (TypeError, ValueError):
+            raise ValueError(f'Field {field} must be a number')
+
+    return row
+
+
+def ingest_samples(samples, allowed_patient_id=None, batch_size=1000, max_samples=None):
+    """
+    Validate and insert wearable samples in batches
+
+    Rows are written with one executemany per batch against the wearable_data
+    table, which SQLAlchemy sends as multi-row INSERT ... VALUES statements
+    instead of creating an ORM object per sample. Samples are validated
+    first (at most max_samples are held), then the rollup watermark of every
+    patient in the upload is locked in one sorted pass before anything is
+    inserted, so concurrent uploads with overlapping patients cannot
+    deadlock. The caller owns the transaction and must commit or roll back.
+
+    Args:
+        samples: Iterable of (row_number, sample) pairs from iter_samples
+        allowed_patient_id: If set, every sample must belong to this patient
+        batch_size: Number of rows per INSERT statement
+        max_samples: Upper bound on the number of samples accepted per upload
+
+    Returns:
+        Dict with inserted count, rejected count, touched patient ids and per-row errors
+    """
+    errors = []
+    known_patients = set()
+    rows = []
+    batch = []
+
+    def resolve(batch):
+        unknown = {row['patient_id'] for _, row in batch} - known_patients
+        if unknown:
+            found = db.session.query(Patient.id).filter(Patient.id.in_(unknown)).all()
+            known_patients.update(patient_id for (patient_id,) in found)
+
+        for row_number, row in batch:
+            if row['patient_id'] not in known_patients:
+                errors.append({'row': row_number, 'error': f"Unknown patient_id: {row['patient_id']}"})
+                continue
+            rows.append(row)
+
+    for count, (row_number, sample) in enumerate(samples, start=1):
+        if max_samples and count > max_samples:
+            errors.append({'row': row_number, 'error': f'Upload exceeds {max_samples} samples; remaining rows ignored'})
+            break
+
+        if isinstance(sample, Exception):
+            errors.append({'row': row_number, 'error': str(sample)})
+            continue
+
+        try:
+            row = normalize_sample(sample, allowed_patient_id)
+        except ValueError as e:
+            errors.append({'row': row_number, 'error': str(e)})
+            continue
+
+        if allowed_patient_id and row['patient_id'] != allowed_patient_id:
+            errors.append({'row': row_number, 'error': 'Samples can only be uploaded for your own patient profile'})
+            continue
+
+        batch.append((row_number, row))
+        if len(batch) >= batch_size:
+            resolve(batch)
+            batch = []
+
+    if batch:
+        resolve(batch)
+
+    touched_patients = {row['patient_id'] for row in rows}
+    if rows:
+        # created_at is stamped by the database once the watermark locks are
+        # held, so the rollup watermark never skips rows from a concurrent upload
+        lock_watermarks(touched_patients)
+        insert = WearableData.__table__.insert().values(created_at=db_now())
+        for offset in range(0, len(rows), batch_size):
+            db.session.execute(insert, rows[offset:offset + batch_size])
+
+    return {
+        'inserted': len(rows),
+        'rejected': len(errors),
+        'patient_ids': sorted(touched_patients),
+        'errors': errors
+    }
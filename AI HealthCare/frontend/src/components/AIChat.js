@@ -8,6 +8,8 @@ function AIChat({ patient, onClose }) {
   const [inputMessage, setInputMessage] = useState('');
   const [loading, setLoading] = useState(false);
   const [initialAnalysis, setInitialAnalysis] = useState(null);
+  const [analysisId, setAnalysisId] = useState(null);
+  const [discussionId, setDiscussionId] = useState(null);
   const [showDecisionSummary, setShowDecisionSummary] = useState(false);
   const messagesEndRef = useRef(null);
 
@@ -26,6 +28,7 @@ function AIChat({ patient, onClose }) {
     try {
       const response = await aiAPI.analyzePatient(patient.id);
       setInitialAnalysis(response.analysis);
+      setAnalysisId(response.analysis_id);
       
       // Add initial AI message
       const aiMessage = {
@@ -81,17 +84,32 @@ What are your thoughts on these findings, Doctor?`;
     setLoading(true);
 
     try {
-      // Get AI response
-      const response = await aiAPI.chatWithAI(messages, inputMessage);
-      
-      // Add AI response
+      // Stream the AI response into a placeholder message as tokens arrive
       const aiMessage = {
         speaker: 'ai',
-        content: response.ai_response,
+        content: '',
         timestamp: new Date().toISOString()
       };
-      
       setMessages(prev => [...prev, aiMessage]);
+
+      // Only the new message is sent; the server keeps the discussion history
+      const result = await aiAPI.streamChatWithAI({
+        message: inputMessage,
+        discussionId,
+        patientId: patient.id,
+        aiAnalysisId: analysisId
+      }, (delta) => {
+        setLoading(false);
+        setMessages(prev => {
+          const updated = [...prev];
+          const last = updated[updated.length - 1];
+          updated[updated.length - 1] = { ...last, content: last.content + delta };
+          return updated;
+        });
+      });
+      if (result.discussionId) {
+        setDiscussionId(result.discussionId);
+      }
     } catch (error) {
       console.error('Error getting AI response:', error);
       const errorMessage = {
@@ -99,7 +117,14 @@ What are your thoughts on these findings, Doctor?`;
         content: 'I apologize, but I\'m having trouble responding right now. Please try again.',
         timestamp: new Date().toISOString()
       };
-      setMessages(prev => [...prev, errorMessage]);
+      // Replace the streaming placeholder if nothing arrived
+      setMessages(prev => {
+        const last = prev[prev.length - 1];
+        if (last && last.speaker === 'ai' && !last.content) {
+          return [...prev.slice(0, -1), errorMessage];
+        }
+        return [...prev, errorMessage];
+      });
     } finally {
       setLoading(false);
     }
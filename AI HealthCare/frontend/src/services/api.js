@@ -78,9 +78,10 @@ export const authAPI = {
 };
 
 export const patientAPI = {
-  // Get all patients (for doctors)
-  getPatients: async () => {
-    const response = await api.get('/patients');
+  // Get one page of patients (for doctors). params: limit, cursor, gender,
+  // blood_type, risk_level, fields. Pass next_cursor back as cursor for the next page.
+  getPatients: async (params = {}) => {
+    const response = await api.get('/patients', { params });
     return response.data;
   },
 
@@ -115,6 +116,58 @@ export const aiAPI = {
     });
     return response.data;
   },
+
+  // Chat with AI in a server-side discussion, calling onDelta with each chunk
+  // of the reply as it streams in. Pass patientId to start a new discussion.
+  streamChatWithAI: async ({ message, discussionId, patientId, aiAnalysisId }, onDelta) => {
+    const token = localStorage.getItem('token');
+    const response = await fetch(`${API_BASE_URL}/ai/chat/stream`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+        ...(token ? { Authorization: `Bearer ${token}` } : {}),
+      },
+      body: JSON.stringify({
+        message: message,
+        discussion_id: discussionId,
+        patient_id: discussionId ? undefined : patientId,
+        // A new discussion starts from the analysis shown in the chat
+        ai_analysis_id: discussionId ? undefined : aiAnalysisId
+      }),
+    });
+
+    if (!response.ok || !response.body) {
+      throw new Error(`Chat stream failed with status ${response.status}`);
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let fullText = '';
+
+    while (true) {
+      const { done, value } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+
+      // Server-Sent Events are separated by a blank line
+      const events = buffer.split('\n\n');
+      buffer = events.pop();
+      for (const event of events) {
+        const data = event.split('\n').find((line) => line.startsWith('data: '));
+        if (!data) continue;
+        if (event.startsWith('event: done')) {
+          return { text: fullText, discussionId: JSON.parse(data.slice(6)).discussion_id };
+        }
+        const { delta } = JSON.parse(data.slice(6));
+        if (delta) {
+          fullText += delta;
+          onDelta(delta);
+        }
+      }
+    }
+    return { text: fullText, discussionId };
+  },
 };
 
 export default api;
\ No newline at end of file